@@ -1,4 +1,5 @@
 import datetime
+import hashlib
 import json
 import pickle
 import re
@@ -24,12 +25,15 @@ from huey.exceptions import TaskException
 from huey.exceptions import TaskLockedException
 from huey.registry import registry
 from huey.registry import TaskRegistry
+from huey.serializer import get_serializer
 from huey.utils import Error
 from huey.utils import aware_to_utc
 from huey.utils import is_aware
 from huey.utils import is_naive
+from huey.utils import iscoroutinefunction
 from huey.utils import local_to_utc
 from huey.utils import make_naive
+from huey.utils import parse_rate_limit
 from huey.utils import wrap_exception
 
 
@@ -39,8 +43,9 @@ class Huey(object):
     call to be enqueued for execution by the consumer.
 
     Typically your application will only need one Huey instance, but you can
-    have as many as you like -- the only caveat is that one consumer process
-    must be executed for each Huey instance.
+    have as many as you like. A single consumer can serve several Huey
+    instances, each given as an import path optionally followed by a weight,
+    e.g. ``huey_consumer.py my_app.huey my_app.reports_huey:3``.
 
     :param name: a name for the task queue.
     :param bool result_store: whether to store task results.
@@ -51,6 +56,9 @@ class Huey(object):
         immediately, without enqueueing them.
     :param store_errors: Flag to indicate whether task errors should be stored.
     :param global_registry: Use a global registry for tasks.
+    :param int result_ttl: Number of seconds task results are kept in the
+        result store before they expire. By default results are kept until
+        they are read. Can be overridden for individual tasks.
 
     Example usage::
 
@@ -69,21 +77,33 @@ class Huey(object):
             # do a backup every day at 3am
             return
     """
+    # Default number of seconds a concurrency slot is held for, see
+    # acquire_slot().
+    concurrency_ttl = 3600
+
+    # Default number of seconds a unique task is considered pending for, see
+    # enqueue().
+    unique_ttl = 3600
+
     def __init__(self, name='huey', result_store=True, events=True,
                  store_none=False, always_eager=False, store_errors=True,
-                 blocking=False, global_registry=True, **storage_kwargs):
+                 blocking=False, global_registry=True, result_ttl=None,
+                 serializer=None, compression=None, **storage_kwargs):
         self.name = name
         self.result_store = result_store
+        self.result_ttl = result_ttl
         self.events = events
         self.store_none = store_none
         self.always_eager = always_eager
         self.store_errors = store_errors
         self.blocking = blocking
+        self.serializer = get_serializer(serializer, compression)
         self.storage = self.get_storage(**storage_kwargs)
         self.pre_execute_hooks = OrderedDict()
         self.post_execute_hooks = OrderedDict()
         self.startup_hooks = OrderedDict()
         self._locks = set()
+        self._aio = None
         if global_registry:
             self.registry = registry
         else:
@@ -93,6 +113,17 @@ class Huey(object):
         raise NotImplementedError('Storage API not implemented in the base '
                                   'Huey class. Use `RedisHuey` instead.')
 
+    @property
+    def aio(self):
+        """
+        Asynchronous interface to this Huey instance, for use with asyncio.
+        See :py:class:`huey.contrib.asyncio.AsyncHuey`.
+        """
+        if self._aio is None:
+            from huey.contrib.asyncio import AsyncHuey
+            self._aio = AsyncHuey(self)
+        return self._aio
+
     def create_consumer(self, **config):
         return Consumer(self, **config)
 
@@ -114,7 +145,7 @@ class Huey(object):
             return eta
 
     def task(self, retries=0, retry_delay=0, retries_as_argument=False,
-             include_task=False, name=None, **task_settings):
+             include_task=False, name=None, priority=None, **task_settings):
         def decorator(func):
             """
             Decorator to execute a function out-of-band via the consumer.
@@ -127,6 +158,7 @@ class Huey(object):
                 retries_as_argument=retries_as_argument,
                 include_task=include_task,
                 name=name,
+                priority=priority,
                 **task_settings)
         return decorator
 
@@ -143,6 +175,15 @@ class Huey(object):
             def method_validate(self, dt):
                 return validate_datetime(dt)
 
+            # Schedules that can compute their next run time, such as
+            # crontab(), allow the scheduler to fire the task exactly.
+            if hasattr(validate_datetime, 'next_after'):
+                def method_next_after(self, dt):
+                    return validate_datetime.next_after(dt)
+                task_settings['next_after'] = method_next_after
+            if getattr(validate_datetime, 'second', None) is not None:
+                task_settings['second_resolution'] = True
+
             return TaskWrapper(
                 self,
                 func.func if isinstance(func, TaskWrapper) else func,
@@ -155,6 +196,37 @@ class Huey(object):
 
         return decorator
 
+    def batch_task(self, max_size=500, max_wait=2.0, retries=0, retry_delay=0,
+                   name=None, **task_settings):
+        """
+        Decorator to execute a function on batches of calls. Calls are
+        buffered in the storage, and the function is called with a list of
+        the argument tuples of up to ``max_size`` calls, at most ``max_wait``
+        seconds after the first call was buffered.
+        """
+        if max_size < 1 or max_wait <= 0:
+            raise ValueError('max_size must be at least 1 and max_wait must '
+                             'be greater than 0.')
+
+        def decorator(func):
+            def method_execute(self):
+                item_ids, calls = self.data
+                return func(list(calls))
+
+            return BatchTaskWrapper(
+                self,
+                func.func if isinstance(func, TaskWrapper) else func,
+                retries=retries,
+                retry_delay=retry_delay,
+                name=name,
+                task_base=BatchQueueTask,
+                max_size=max_size,
+                max_wait=max_wait,
+                execute=method_execute,
+                **task_settings)
+
+        return decorator
+
     def register_pre_execute(self, name, fn):
         """
         Register a pre-execute hook. The callback will be executed before the
@@ -262,17 +334,33 @@ class Huey(object):
         return decorator
 
     @_wrapped_operation(QueueWriteException)
-    def _enqueue(self, msg):
-        self.storage.enqueue(msg)
+    def _enqueue(self, msg, priority=None):
+        self.storage.enqueue(msg, priority)
+
+    @_wrapped_operation(QueueWriteException)
+    def _enqueue_many(self, msgs, priority=None):
+        self.storage.enqueue_many(msgs, priority)
 
     @_wrapped_operation(QueueReadException)
     def _dequeue(self):
         return self.storage.dequeue()
 
+    @_wrapped_operation(QueueReadException)
+    def _dequeue_many(self, n):
+        return self.storage.dequeue_many(n)
+
+    @_wrapped_operation(QueueReadException)
+    def _dequeue_any(self, storages):
+        return self.storage.dequeue_any(storages)
+
     @_wrapped_operation(QueueRemoveException)
     def _unqueue(self, msg):
         return self.queue.unqueue(msg)
 
+    @_wrapped_operation(QueueRemoveException)
+    def _ack(self, msg):
+        self.storage.ack(msg)
+
     @_wrapped_operation(DataStoreGetException)
     def _get_data(self, key, peek=False):
         if peek:
@@ -280,13 +368,76 @@ class Huey(object):
         else:
             return self.storage.pop_data(key)
 
+    @_wrapped_operation(DataStoreGetException)
+    def _wait_for_result(self, key, timeout):
+        self.storage.wait_for_result(key, timeout)
+
     @_wrapped_operation(DataStorePutException)
     def _put_data(self, key, value):
         return self.storage.put_data(key, value)
 
     @_wrapped_operation(DataStorePutException)
-    def _put_if_empty(self, key, value):
-        return self.storage.put_if_empty(key, value)
+    def _put_result(self, key, value, ack=None, ttl=None):
+        return self.storage.put_result(key, value, ack, ttl)
+
+    @_wrapped_operation(DataStorePutException)
+    def _put_if_empty(self, key, value, ttl=None):
+        return self.storage.put_if_empty(key, value, ttl)
+
+    @_wrapped_operation(DataStorePutException)
+    def _acquire_lease(self, key, lease_id, limit, ttl):
+        return self.storage.acquire_lease(key, lease_id, limit, ttl)
+
+    @_wrapped_operation(DataStorePutException)
+    def _release_lease(self, key, lease_id):
+        return self.storage.release_lease(key, lease_id)
+
+    @_wrapped_operation(DataStorePutException)
+    def _acquire_token(self, key, rate, period):
+        return self.storage.acquire_token(key, rate, period)
+
+    @_wrapped_operation(QueueWriteException)
+    def _push_batch(self, key, data):
+        return self.storage.push_batch(key, data)
+
+    @_wrapped_operation(QueueReadException)
+    def _pop_batch(self, key, n):
+        return self.storage.pop_batch(key, n)
+
+    @_wrapped_operation(QueueReadException)
+    def _batch_size(self, key):
+        return self.storage.batch_size(key)
+
+    @_wrapped_operation(DataStoreGetException)
+    def _get_data_many(self, keys, peek=False):
+        if peek:
+            return self.storage.peek_data_many(keys)
+        else:
+            return self.storage.pop_data_many(keys)
+
+    @_wrapped_operation(DataStoreGetException)
+    def _wait_for_results(self, keys, timeout):
+        self.storage.wait_for_results(keys, timeout)
+
+    @_wrapped_operation(DataStorePutException)
+    def _incr_counter(self, key, amount=1):
+        return self.storage.incr_counter(key, amount)
+
+    @_wrapped_operation(DataStorePutException)
+    def _put_result_many(self, items, ttl=None):
+        return self.storage.put_result_many(items, ttl)
+
+    @_wrapped_operation(DataStorePutException)
+    def _add_revocation(self, key, value):
+        self.storage.add_revocation(key, value)
+
+    @_wrapped_operation(DataStoreGetException)
+    def _remove_revocation(self, key):
+        return self.storage.remove_revocation(key)
+
+    @_wrapped_operation(DataStoreGetException)
+    def _get_revocations(self, keys):
+        return self.storage.get_revocations(keys)
 
     @_wrapped_operation(DataStorePutException)
     def _put_error(self, metadata):
@@ -300,10 +451,22 @@ class Huey(object):
     def _add_to_schedule(self, data, ts):
         self.storage.add_to_schedule(data, ts)
 
+    @_wrapped_operation(ScheduleAddException)
+    def _reschedule(self, data, ts):
+        self.storage.reschedule(data, ts)
+
     @_wrapped_operation(ScheduleReadException)
     def _read_schedule(self, ts):
         return self.storage.read_schedule(ts)
 
+    @_wrapped_operation(ScheduleReadException)
+    def next_scheduled_ts(self):
+        return self.storage.next_scheduled_ts()
+
+    @_wrapped_operation(ScheduleReadException)
+    def wait_for_schedule(self, timeout):
+        self.storage.wait_for_schedule(timeout)
+
     def emit(self, message):
         try:
             self.storage.emit(message)
@@ -340,10 +503,67 @@ class Huey(object):
         return accum[0] if len(accum) == 1 else accum
 
     def enqueue(self, task):
+        """
+        Enqueue a task. If the task is ``unique`` and an identical task is
+        already pending, nothing is enqueued, and the result wrapper of the
+        pending task is returned instead.
+        """
         if self.always_eager:
             return self._execute_always_eager(task)
 
-        self._enqueue(self.registry.get_message_for_task(task))
+        if task.unique:
+            pending = self._get_pending_duplicate(task)
+            if pending is not None:
+                return self._get_result_wrapper(pending)
+
+        self._enqueue(self.serialize_task(task), task.priority)
+        return self._get_result_wrapper(task)
+
+    def _hash_arguments(self, task):
+        args, kwargs = task.get_data() or ((), {})
+        data = pickle.dumps((args, sorted(kwargs.items())), 2)
+        return hashlib.sha1(data).hexdigest()
+
+    def _unique_key(self, task):
+        if task.unique_key is not None:
+            args, kwargs = task.get_data() or ((), {})
+            key = task.unique_key(*args, **kwargs)
+        else:
+            key = self._hash_arguments(task)
+        return '%s.unique.%s.%s' % (
+            self.name,
+            self.registry.task_to_string(type(task)),
+            key)
+
+    def _get_pending_duplicate(self, task):
+        """
+        Mark a unique task as pending, returning ``None``, or return a copy
+        of the identical task that is already pending.
+        """
+        key = self._unique_key(task)
+        ttl = task.unique_ttl or self.unique_ttl
+        while not self._put_if_empty(key, task.task_id, ttl):
+            task_id = self._get_data(key, peek=True)
+            if task_id is EmptyData:
+                # The pending task started running in the meantime.
+                continue
+            if isinstance(task_id, bytes):
+                task_id = task_id.decode('utf-8')
+            if task_id != task.task_id:
+                return type(task)(task.data, task_id=task_id)
+            # The task itself is pending, for example when it is moved from
+            # the schedule to the queue.
+            break
+
+    def clear_unique(self, task):
+        """
+        Stop considering a unique task as pending, so that identical tasks
+        can be enqueued again. Called by the consumer when the task starts
+        running.
+        """
+        self._get_data(self._unique_key(task))
+
+    def _get_result_wrapper(self, task):
         if not self.result_store:
             return
 
@@ -359,24 +579,404 @@ class Huey(object):
         else:
             return TaskResultWrapper(self, task)
 
+    def _get_debounced_task(self, task):
+        # Identical calls share a task ID, and produce identical messages, so
+        # that storing the message again moves the existing schedule entry.
+        task_id = str(uuid.uuid5(uuid.NAMESPACE_OID, '%s.debounce.%s.%s' % (
+            self.name,
+            self.registry.task_to_string(type(task)),
+            self._hash_arguments(task))))
+        return type(task)(
+            task.data,
+            task_id=task_id,
+            retries=task.retries,
+            retry_delay=task.retry_delay,
+            on_complete=task.on_complete,
+            priority=task.priority)
+
+    def debounce(self, task, delay=None):
+        """
+        Schedule a task to run ``delay`` seconds from now, replacing the
+        schedule entry of an identical call that has not run yet. A burst of
+        calls is thereby collapsed into a single execution, ``delay`` seconds
+        after the last call.
+
+        :param QueueTask task: a :py:class:`QueueTask` instance.
+        :param delay: number of seconds, defaults to the task's ``debounce``.
+        :returns: A :py:class:`TaskResultWrapper` object (if result store
+            enabled), shared by all the identical calls.
+        """
+        if self.always_eager:
+            return self._execute_always_eager(task)
+
+        task = self._get_debounced_task(task)
+        delay = task.debounce if delay is None else delay
+        execute_time = self._normalize_execute_time(delay=delay)
+        msg = self.serialize_task(task, timestamp=False)
+        self._reschedule(msg, execute_time)
+        return self._get_result_wrapper(task)
+
+    def group(self, tasks):
+        """
+        Enqueue a group of tasks to run in parallel, see
+        :py:meth:`enqueue_many`.
+
+        :return: A :py:class:`ResultGroup` (if result store enabled).
+        """
+        return self.enqueue_many(tasks)
+
+    def chord(self, tasks, callback):
+        """
+        Enqueue a group of tasks to run in parallel, and a callback which is
+        enqueued once all of them have finished. The callback is called with
+        the list of results of the group as its last argument.
+
+        :param list tasks: a list of :py:class:`QueueTask` instances.
+        :param QueueTask callback: the task to enqueue when the group finished.
+        :return: A :py:class:`TaskResultWrapper` for the callback (if result
+            store enabled).
+        """
+        tasks = list(tasks)
+        if self.always_eager:
+            callback.extend_data(
+                ([self._execute_always_eager(task) for task in tasks],))
+            return self._execute_always_eager(callback)
+        elif not tasks:
+            callback.extend_data(([],))
+            return self.enqueue(callback)
+        elif not self.result_store:
+            raise QueueException('Chords require the result store.')
+
+        # The callback and the IDs of the group are stored alongside a
+        # counter of the tasks that have not finished yet. The task that
+        # brings the counter down to zero enqueues the callback.
+        chord_id = str(uuid.uuid4())
+        key = self._chord_key(chord_id)
+        self._put_data(key, pickle.dumps(
+            (self.serialize_task(callback), [task.task_id for task in tasks]),
+            pickle.HIGHEST_PROTOCOL))
+        self._incr_counter(key, len(tasks))
+        for task in tasks:
+            task.chord = chord_id
+        self.enqueue_many(tasks)
+        return self._get_result_wrapper(callback)
+
+    def _chord_key(self, chord_id):
+        return '%s.chord.%s' % (self.name, chord_id)
+
+    def _finish_chord_task(self, task):
+        """
+        Record that a task in a chord finished, and once every task in the
+        chord has, enqueue the callback with the results of the group. If
+        any task failed, its error is stored as the result of the callback
+        instead. Tasks that were revoked or cancelled count as finished, with
+        a result of None.
+
+        The results of the group are removed from the result store once they
+        have been read, as nothing else refers to them.
+        """
+        key = self._chord_key(task.chord)
+        if self._incr_counter(key, -1) != 0:
+            return
+
+        data = self._get_data(key)
+        if data is EmptyData:
+            return
+        msg, task_ids = pickle.loads(data)
+        callback = self.deserialize_task(msg)
+        results = []
+        for value in self._get_data_many(task_ids):
+            value = (None if value is EmptyData else
+                     self.serializer.deserialize(value))
+            if isinstance(value, Error):
+                self.put_result(callback, value)
+                return
+            results.append(value)
+        callback.extend_data((results,))
+        self.enqueue(callback)
+
+    def _batch_key(self, task_class):
+        return self.registry.task_to_string(task_class)
+
+    def _get_batch_trigger(self, task_class, n):
+        # Return the task that runs the next batch, given the number of calls
+        # in the buffer. A full batch runs immediately.
+        if n >= task_class.max_size:
+            return task_class()
+        return task_class(execute_time=self._normalize_execute_time(
+            delay=task_class.max_wait))
+
+    def enqueue_batch_call(self, task_class, args):
+        """
+        Buffer a call to a batch task, see :py:meth:`batch_task`.
+
+        :param task_class: the task class of the batch task.
+        :param tuple args: the arguments of the call.
+        :returns: A :py:class:`TaskResultWrapper` for the result of the call
+            (if result store enabled).
+        """
+        item_id = str(uuid.uuid4())
+        if self.always_eager:
+            task = task_class(((item_id,), (args,)))
+            results = self._execute_always_eager(task)
+            return self._get_batch_results(task, results)[0][1]
+
+        n = self._push_batch(self._batch_key(task_class), pickle.dumps(
+            (item_id, args),
+            pickle.HIGHEST_PROTOCOL))
+
+        # A batch runs as soon as enough calls are buffered to fill it. The
+        # first call buffered after a batch ran also schedules a batch, so
+        # that no call waits for longer than max_wait.
+        if n % task_class.max_size == 0 or n == 1:
+            self.enqueue(self._get_batch_trigger(task_class, n))
+        if self.result_store:
+            return TaskResultWrapper(self, task_class(task_id=item_id))
+
+    def _load_batch(self, task):
+        """
+        Move the next batch of calls from the buffer into the task's data, so
+        that they are retried together. Returns whether there were any.
+        """
+        task_class = type(task)
+        key = self._batch_key(task_class)
+        items = [pickle.loads(data)
+                 for data in self._pop_batch(key, task.max_size)]
+        remaining = self._batch_size(key)
+        if remaining:
+            self.enqueue(self._get_batch_trigger(task_class, remaining))
+        if items:
+            task.set_data(tuple(zip(*items)))
+        return bool(items)
+
+    def _get_batch_results(self, task, results):
+        item_ids, calls = task.data
+        if not isinstance(results, (list, tuple)):
+            results = [results] * len(item_ids)
+        elif len(results) != len(item_ids):
+            raise ValueError('Batch task %s returned %s results for %s calls.'
+                             % (task.task_id, len(results), len(item_ids)))
+        return list(zip(item_ids, results))
+
+    def _put_batch_results(self, task, items):
+        ttl = task.result_ttl
+        if ttl is None:
+            ttl = self.result_ttl
+        self._put_result_many([
+            (item_id, self.serializer.serialize(value))
+            for item_id, value in items
+            if value is not None or self.store_none], ttl)
+
+    def enqueue_many(self, tasks):
+        """
+        Enqueue a list of tasks using a single storage operation. Rather than
+        returning a :py:class:`TaskResultWrapper` for each task, a single
+        :py:class:`ResultGroup` is returned (if the result store is enabled).
+        """
+        tasks = list(tasks)
+        if self.always_eager:
+            return [self._execute_always_eager(task) for task in tasks]
+
+        # Tasks are written to storage in one operation per priority.
+        by_priority = OrderedDict()
+        for i, task in enumerate(tasks):
+            if task.unique:
+                pending = self._get_pending_duplicate(task)
+                if pending is not None:
+                    tasks[i] = pending
+                    continue
+            msg = self.serialize_task(task)
+            by_priority.setdefault(task.priority, []).append(msg)
+        for priority, msgs in by_priority.items():
+            self._enqueue_many(msgs, priority)
+
+        if self.result_store:
+            return ResultGroup(self, tasks)
+
+    def _load_task(self, message):
+        task = self.deserialize_task(message)
+        task.message = message  # Retained so the task can be acknowledged.
+        return task
+
     def dequeue(self):
         message = self._dequeue()
         if message:
-            return self.registry.get_task_for_message(message)
+            return self._load_task(message)
+
+    def dequeue_many(self, n):
+        return [self._load_task(message) for message in self._dequeue_many(n)]
+
+    def dequeue_any(self, hueys):
+        """
+        Read a task from the first of the given Huey instances whose queue is
+        not empty, using a single blocking read where the storage allows it.
+
+        :param list hueys: Huey instances, in the order they should be read.
+        :returns: A 2-tuple of (huey, task), or None if all queues are empty.
+        """
+        storages = [huey.storage for huey in hueys]
+        res = self._dequeue_any(storages)
+        if res:
+            storage, message = res
+            huey = hueys[storages.index(storage)]
+            return (huey, huey._load_task(message))
+
+    def ack(self, task):
+        """
+        Acknowledge that a task read from the queue has been processed. This
+        is a no-op unless the storage tracks in-flight tasks, and for tasks
+        that were already acknowledged when their result was stored.
+        """
+        if task.message is not None:
+            self._ack(task.message)
+            task.message = None
+
+    def heartbeat(self):
+        """
+        Signal that the consumer is alive, and return any tasks that were
+        in-flight on consumers that have died to the queue.
+
+        :return: Number of tasks that were returned to the queue.
+        """
+        self.storage.heartbeat()
+        messages = self.storage.reap()
+        for message in messages:
+            # Tasks are returned to the queue with their original priority.
+            try:
+                priority = self.deserialize_task(message).priority
+            except QueueException:
+                priority = None
+            self._enqueue(message, priority)
+            self._ack(message)
+        return len(messages)
+
+    def serialize_task(self, task, timestamp=True):
+        """
+        Convert a task to a message for the queue, using the serializer of
+        this Huey instance. See :py:meth:`TaskRegistry.get_message_for_task`.
+        """
+        return self.registry.get_message_for_task(task, timestamp,
+                                                  self.serializer)
+
+    def deserialize_task(self, message):
+        return self.registry.get_task_for_message(message, self.serializer)
 
     def put(self, key, value):
-        return self._put_data(key,
-                              pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        return self._put_data(key, self.serializer.serialize(value))
+
+    def put_result(self, task, value):
+        """
+        Store the result of the given task, acknowledging the task's queue
+        message in the same storage operation.
+        """
+        ttl = task.result_ttl
+        if ttl is None:
+            ttl = self.result_ttl
+        self._put_result(task.task_id,
+                         self.serializer.serialize(value),
+                         task.message,
+                         ttl)
+        task.message = None
+
+    @_wrapped_operation(DataStorePutException)
+    def sweep_results(self, limit=None):
+        """
+        Remove expired results from the result store.
+        """
+        return self.storage.sweep_results(limit)
 
     def get(self, key, peek=False):
         data = self._get_data(key, peek=peek)
         if data is EmptyData:
             return
         else:
-            return pickle.loads(data)
+            return self.serializer.deserialize(data)
+
+    def get_many(self, results, blocking=False, timeout=None, backoff=1.15,
+                 max_delay=1.0, revoke_on_timeout=False, preserve=False):
+        """
+        Retrieve the results of several tasks, reading all the results that
+        are ready in a single storage operation, rather than one operation
+        per task.
+
+        :param results: a list of :py:class:`TaskResultWrapper` instances, or
+            a :py:class:`ResultGroup`.
+        :return: a list of the results, in the same order as ``results``.
+            Results that are not ready are ``None`` when not blocking.
+        """
+        results = list(results)
+        if blocking:
+            for _ in self.as_completed(results, timeout, backoff, max_delay,
+                                       revoke_on_timeout, preserve):
+                pass
+        else:
+            self._read_results(results, preserve)
+        return [None if result._result is EmptyData else result.get()
+                for result in results]
+
+    def as_completed(self, results, timeout=None, backoff=1.15, max_delay=1.0,
+                     revoke_on_timeout=False, preserve=False):
+        """
+        Generator that yields the given :py:class:`TaskResultWrapper`
+        instances as their results become ready. Each time the generator
+        waits, the results of all the pending tasks are read in a single
+        storage operation.
+
+        :raises: ``DataStoreTimeout`` if the results are not all ready within
+            ``timeout`` seconds.
+        """
+        pending = []
+        for result in results:
+            if result._result is EmptyData:
+                pending.append(result)
+            else:
+                yield result
+
+        # As in TaskResultWrapper.get(), the delay bounds how long a single
+        # wait for a notification may last.
+        start = time.time()
+        delay = .1
+        while pending:
+            for result in self._read_results(pending, preserve):
+                yield result
+            pending = [result for result in pending
+                       if result._result is EmptyData]
+            if not pending:
+                break
+
+            if timeout:
+                remaining = timeout - (time.time() - start)
+                if remaining <= 0:
+                    if revoke_on_timeout:
+                        for result in pending:
+                            result.revoke()
+                    raise DataStoreTimeout
+                delay = min(delay, remaining)
+            if delay > max_delay:
+                delay = max_delay
+            self._wait_for_results([result.task.task_id for result in pending],
+                                   delay)
+            delay *= backoff
+
+    def _read_results(self, results, preserve=False):
+        """
+        Read the results of the wrappers that are not ready yet in a single
+        storage operation, returning the wrappers whose results were read.
+        """
+        pending = [result for result in results if result._result is EmptyData]
+        if not pending:
+            return []
+        values = self._get_data_many([result.task.task_id
+                                      for result in pending], peek=preserve)
+        accum = []
+        for result, value in zip(pending, values):
+            if value is not EmptyData:
+                result._result = self.serializer.deserialize(value)
+                accum.append(result)
+        return accum
 
     def put_error(self, metadata):
-        return self._put_error(pickle.dumps(metadata))
+        return self._put_error(self.serializer.serialize(metadata))
 
     def _format_time(self, dt):
         if dt is None:
@@ -398,13 +998,38 @@ class Huey(object):
 
         return metadata
 
+    def _get_error_metadata(self, task, exc):
+        # Called from the exception handler, to include the traceback.
+        metadata = self._get_task_metadata(task, True)
+        metadata['error'] = repr(exc)
+        metadata['traceback'] = traceback.format_exc()
+        return metadata
+
+    def _put_task_error(self, task, metadata):
+        self.put_result(task, Error(metadata))
+        self.put_error(metadata)
+        # Calls to a batch task fail once the batch is not retried.
+        if isinstance(task, BatchQueueTask) and not task.retries:
+            self._put_batch_results(task, [
+                (item_id, Error(metadata)) for item_id in task.data[0]])
+
+    def _should_store_result(self, task, result):
+        return (self.result_store and
+                not isinstance(task, PeriodicQueueTask) and
+                (result is not None or self.store_none))
+
     def emit_status(self, status, error=False, **data):
+        message = self._get_status_message(status, error, **data)
+        if message is not None:
+            self.emit(message)
+
+    def _get_status_message(self, status, error=False, **data):
         if self.events:
             metadata = {'status': status, 'error': error}
             if error:
                 metadata['traceback'] = traceback.format_exc()
             metadata.update(data)
-            self.emit(json.dumps(metadata))
+            return json.dumps(metadata)
 
     def emit_task(self, status, task, error=False, **data):
         if self.events:
@@ -416,20 +1041,29 @@ class Huey(object):
         if not isinstance(task, QueueTask):
             raise TypeError('Unknown object: %s' % task)
 
+        is_batch = isinstance(task, BatchQueueTask)
+        if is_batch and task.data is None and not self._load_batch(task):
+            return
+
         try:
             result = task.execute()
+            if is_batch:
+                items = self._get_batch_results(task, result)
         except Exception as exc:
             if self.store_errors:
-                metadata = self._get_task_metadata(task, True)
-                metadata['error'] = repr(exc)
-                metadata['traceback'] = traceback.format_exc()
-                self.put(task.task_id, Error(metadata))
-                self.put_error(metadata)
+                self._put_task_error(task, self._get_error_metadata(task, exc))
+            if task.chord and not task.retries:
+                self._finish_chord_task(task)
             raise
 
-        if self.result_store and not isinstance(task, PeriodicQueueTask):
-            if result is not None or self.store_none:
-                self.put(task.task_id, result)
+        if is_batch:
+            if self.result_store:
+                self._put_batch_results(task, items)
+        elif self._should_store_result(task, result):
+            self.put_result(task, result)
+
+        if task.chord:
+            self._finish_chord_task(task)
 
         if task.on_complete:
             next_task = task.on_complete
@@ -439,17 +1073,19 @@ class Huey(object):
         return result
 
     def revoke_all(self, task_class, revoke_until=None, revoke_once=False):
-        self.put('rt:%s' % task_class.__name__, (revoke_until, revoke_once))
+        self._add_revocation('rt:%s' % task_class.__name__,
+                             pickle.dumps((revoke_until, revoke_once)))
 
     def restore_all(self, task_class):
-        return self._get_data('rt:%s' % task_class.__name__) is not EmptyData
+        return self._remove_revocation('rt:%s' % task_class.__name__)
 
     def revoke(self, task, revoke_until=None, revoke_once=False):
-        self.put(task.revoke_id, (revoke_until, revoke_once))
+        self._add_revocation(task.revoke_id,
+                             pickle.dumps((revoke_until, revoke_once)))
 
     def restore(self, task):
         # Return value indicates whether the task was in fact revoked.
-        return self._get_data(task.revoke_id) is not EmptyData
+        return self._remove_revocation(task.revoke_id)
 
     def revoke_by_id(self, task_id, revoke_until=None, revoke_once=False):
         return self.revoke(QueueTask(task_id=task_id), revoke_until,
@@ -458,18 +1094,17 @@ class Huey(object):
     def restore_by_id(self, task_id):
         return self.restore(QueueTask(task_id=task_id))
 
-    def _check_revoked(self, revoke_id, dt=None, peek=True):
+    def _check_revoked(self, data, dt=None, peek=True):
         """
         Checks if a task is revoked, returns a 2-tuple indicating:
 
         1. Is task revoked?
         2. Should task be restored?
         """
-        res = self.get(revoke_id, peek=True)
-        if res is None:
+        if data is EmptyData:
             return False, False
 
-        revoke_until, revoke_once = res
+        revoke_until, revoke_once = pickle.loads(data)
         if revoke_once:
             # This task *was* revoked for one run, but now it should be
             # restored to normal execution (unless we are just peeking).
@@ -483,8 +1118,8 @@ class Huey(object):
 
     def is_revoked(self, task, dt=None, peek=True):
         if isclass(task) and issubclass(task, QueueTask):
-            revoke_id = 'rt:%s' % task.__name__
-            is_revoked, can_restore = self._check_revoked(revoke_id, dt, peek)
+            data, = self._get_revocations(['rt:%s' % task.__name__])
+            is_revoked, can_restore = self._check_revoked(data, dt, peek)
             if can_restore:
                 self.restore_all(task)
             return is_revoked
@@ -492,21 +1127,28 @@ class Huey(object):
         if not isinstance(task, QueueTask):
             task = QueueTask(task_id=task)
 
-        is_revoked, can_restore = self._check_revoked(task.revoke_id, dt, peek)
+        # The task and its class are checked in a single storage operation.
+        task_data, class_data = self._get_revocations([
+            task.revoke_id,
+            'rt:%s' % type(task).__name__])
+
+        is_revoked, can_restore = self._check_revoked(task_data, dt, peek)
         if can_restore:
             self.restore(task)
         if not is_revoked:
-            is_revoked = self.is_revoked(type(task), dt, peek)
+            is_revoked, can_restore = self._check_revoked(class_data, dt, peek)
+            if can_restore:
+                self.restore_all(type(task))
 
         return is_revoked
 
     def add_schedule(self, task):
-        msg = self.registry.get_message_for_task(task)
+        msg = self.serialize_task(task)
         ex_time = task.execute_time or datetime.datetime.fromtimestamp(0)
         self._add_to_schedule(msg, ex_time)
 
     def read_schedule(self, ts):
-        return [self.registry.get_task_for_message(m)
+        return [self.deserialize_task(m)
                 for m in self._read_schedule(ts)]
 
     def read_periodic(self, ts):
@@ -519,28 +1161,40 @@ class Huey(object):
         return cmd.execute_time is None or cmd.execute_time <= dt
 
     def pending(self, limit=None):
-        return [self.registry.get_task_for_message(m)
+        return [self.deserialize_task(m)
                 for m in self.storage.enqueued_items(limit)]
 
     def pending_count(self):
         return self.storage.queue_size()
 
     def scheduled(self, limit=None):
-        return [self.registry.get_task_for_message(m)
+        return [self.deserialize_task(m)
                 for m in self.storage.scheduled_items(limit)]
 
     def scheduled_count(self):
         return self.storage.schedule_size()
 
     def all_results(self):
-        return self.storage.result_items()
+        return dict((key, self.serializer.deserialize(value))
+                    for key, value in self.storage.result_items().items()
+                    if self._is_result_key(key))
+
+    def _is_result_key(self, key):
+        # The result store also holds the keys of task locks, pending unique
+        # tasks, chords, periodic task claims and (before they are migrated)
+        # revocations, whose values are not serialized results.
+        if isinstance(key, bytes):
+            key = key.decode('utf-8')
+        prefixes = tuple('%s.%s.' % (self.name, kind)
+                         for kind in ('lock', 'unique', 'chord'))
+        return not key.startswith(prefixes + ('p:', 'r:', 'rt:'))
 
     def result_count(self):
         return self.storage.result_store_size()
 
     def errors(self, limit=None, offset=0):
         return [
-            pickle.loads(error)
+            self.serializer.deserialize(error)
             for error in self.storage.get_errors(limit, offset)]
 
     def __len__(self):
@@ -597,6 +1251,41 @@ class Huey(object):
         """
         return TaskLock(self, lock_name)
 
+    def _concurrency_key(self, task):
+        return 'concurrency.%s' % self.registry.task_to_string(type(task))
+
+    def _get_slot_ttl(self, task):
+        return task.concurrency_ttl or task.timeout or self.concurrency_ttl
+
+    def acquire_slot(self, task):
+        """
+        Acquire one of the ``concurrency`` slots shared by all instances of the
+        task's class, across every consumer. The slot is held until it is
+        released with :py:meth:`release_slot`, or until it expires, after the
+        task's ``concurrency_ttl``, its ``timeout``, or one hour.
+
+        :return: Boolean whether a slot was acquired.
+        """
+        return self._acquire_lease(self._concurrency_key(task), task.task_id,
+                                   task.concurrency, self._get_slot_ttl(task))
+
+    def release_slot(self, task):
+        return self._release_lease(self._concurrency_key(task), task.task_id)
+
+    def _rate_limit_key(self, task):
+        return 'rate_limit.%s' % self.registry.task_to_string(type(task))
+
+    def acquire_token(self, task):
+        """
+        Take a token from the bucket enforcing the ``rate_limit`` of the
+        task's class, which is shared by every consumer.
+
+        :return: 0 if the task may run, otherwise the number of seconds until
+            the next token is available.
+        """
+        rate, period = parse_rate_limit(task.rate_limit)
+        return self._acquire_token(self._rate_limit_key(task), rate, period)
+
     def flush_locks(self):
         """
         Flush any stale locks (for example, when restarting the consumer).
@@ -657,7 +1346,7 @@ class TaskWrapper(object):
         return self.huey.restore_all(self.task_class)
 
     def schedule(self, args=None, kwargs=None, eta=None, delay=None,
-                 convert_utc=True, task_id=None):
+                 convert_utc=True, task_id=None, priority=None):
         execute_time = self.huey._normalize_execute_time(
             eta=eta, delay=delay, convert_utc=convert_utc)
         cmd = self.task_class(
@@ -665,12 +1354,34 @@ class TaskWrapper(object):
             execute_time=execute_time,
             retries=self.retries,
             retry_delay=self.retry_delay,
-            task_id=task_id)
+            task_id=task_id,
+            priority=priority)
         return self.huey.enqueue(cmd)
 
     def __call__(self, *args, **kwargs):
+        if self.task_class.debounce:
+            return self.huey.debounce(self.s(*args, **kwargs))
         return self.huey.enqueue(self.s(*args, **kwargs))
 
+    def aenqueue(self, *args, **kwargs):
+        """
+        Enqueue the task without blocking the event loop. Returns an awaitable
+        that resolves to the result wrapper.
+        """
+        if self.task_class.debounce:
+            return self.huey.aio.debounce(self.s(*args, **kwargs))
+        return self.huey.aio.enqueue(self.s(*args, **kwargs))
+
+    def map(self, it):
+        """
+        Enqueue one task for each item in the iterable, using a single storage
+        operation. Tuples are treated as positional arguments, any other value
+        is passed as the sole argument.
+        """
+        return self.huey.enqueue_many([
+            self.s(*(item if isinstance(item, tuple) else (item,)))
+            for item in it])
+
     def call_local(self, *args, **kwargs):
         return self.func(*args, **kwargs)
 
@@ -679,6 +1390,19 @@ class TaskWrapper(object):
                                retry_delay=self.retry_delay)
 
 
+class BatchTaskWrapper(TaskWrapper):
+    """
+    Task wrapper for functions decorated with :py:meth:`Huey.batch_task`.
+    Calls are buffered in the storage, rather than enqueued as tasks.
+    """
+    def __call__(self, *args):
+        return self.huey.enqueue_batch_call(self.task_class, args)
+
+    def map(self, it):
+        return [self(*(item if isinstance(item, tuple) else (item,)))
+                for item in it]
+
+
 class TaskLock(object):
     """
     Utilize the Storage key/value APIs to implement simple locking. For more
@@ -743,7 +1467,7 @@ class TaskResultWrapper(object):
             res = self.huey._get_data(task_id, peek=preserve)
 
             if res is not EmptyData:
-                self._result = pickle.loads(res)
+                self._result = self.huey.serializer.deserialize(res)
                 return self._result
             else:
                 return res
@@ -757,17 +1481,23 @@ class TaskResultWrapper(object):
             if res is not EmptyData:
                 return res
         else:
+            # Rather than sleeping between reads, wait for the storage to
+            # signal that the result has been stored. The delay bounds how long
+            # a single wait may last, in case a notification is missed.
             start = time.time()
             delay = .1
             while self._result is EmptyData:
-                if timeout and time.time() - start >= timeout:
-                    if revoke_on_timeout:
-                        self.revoke()
-                    raise DataStoreTimeout
+                if timeout:
+                    remaining = timeout - (time.time() - start)
+                    if remaining <= 0:
+                        if revoke_on_timeout:
+                            self.revoke()
+                        raise DataStoreTimeout
+                    delay = min(delay, remaining)
                 if delay > max_delay:
                     delay = max_delay
                 if self._get(preserve) is EmptyData:
-                    time.sleep(delay)
+                    self.huey._wait_for_result(self.task.task_id, delay)
                     delay *= backoff
 
             return self._result
@@ -780,6 +1510,16 @@ class TaskResultWrapper(object):
             raise TaskException(result.metadata)
         return result
 
+    def aget(self, blocking=True, timeout=None, backoff=1.15, max_delay=1.0,
+             revoke_on_timeout=False, preserve=False):
+        """
+        Awaitable version of :py:meth:`get`, which waits for the result by
+        default.
+        """
+        return self.huey.aio.get_result(self, blocking, timeout, backoff,
+                                        max_delay, revoke_on_timeout,
+                                        preserve)
+
     def is_revoked(self):
         return self.huey.is_revoked(self.task, peek=True)
 
@@ -802,13 +1542,49 @@ class TaskResultWrapper(object):
             execute_time=execute_time,
             retries=self.task.retries,
             retry_delay=self.task.retry_delay,
-            task_id=None)
+            task_id=None,
+            priority=self.task.priority)
         return self.huey.enqueue(cmd)
 
     def reset(self):
         self._result = EmptyData
 
 
+class ResultGroup(object):
+    """
+    Lightweight container for the results of a group of tasks, such as the
+    tasks enqueued by :py:meth:`Huey.enqueue_many` or :py:meth:`TaskWrapper.map`.
+    Only the task IDs are retained, :py:class:`TaskResultWrapper` instances
+    are created on demand.
+
+    The results are retrieved in bulk, see :py:meth:`Huey.get_many`.
+    """
+    def __init__(self, huey, tasks):
+        self.huey = huey
+        self.task_ids = [task.task_id for task in tasks]
+
+    def __len__(self):
+        return len(self.task_ids)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._wrapper(task_id) for task_id in self.task_ids[idx]]
+        return self._wrapper(self.task_ids[idx])
+
+    def __iter__(self):
+        return (self._wrapper(task_id) for task_id in self.task_ids)
+
+    def _wrapper(self, task_id):
+        return TaskResultWrapper(self.huey, QueueTask(task_id=task_id))
+
+    def get(self, *args, **kwargs):
+        return self.huey.get_many(self, *args, **kwargs)
+    __call__ = get
+
+    def as_completed(self, *args, **kwargs):
+        return self.huey.as_completed(self, *args, **kwargs)
+
+
 def with_metaclass(meta, base=object):
     return meta("NewBase", (base,), {})
 
@@ -838,9 +1614,22 @@ class QueueTask(object):
     """
     default_retries = 0
     default_retry_delay = 0
+    priority = None
+    result_ttl = None
+    timeout = None
+    concurrency = None
+    concurrency_delay = 1
+    concurrency_ttl = None
+    rate_limit = None
+    unique = False
+    unique_key = None
+    unique_ttl = None
+    debounce = None
+    is_async = False
 
     def __init__(self, data=None, task_id=None, execute_time=None,
-                 retries=None, retry_delay=None, on_complete=None):
+                 retries=None, retry_delay=None, on_complete=None,
+                 priority=None, chord=None):
         self.name = type(self).__name__
         self.set_data(data)
         self.task_id = task_id or self.create_id()
@@ -850,6 +1639,11 @@ class QueueTask(object):
         self.retry_delay = retry_delay if retry_delay is not None else \
                 self.default_retry_delay
         self.on_complete = on_complete
+        self.chord = chord  # ID of the chord the task is a member of.
+        self.message = None
+        self.enqueued_at = None  # Timestamp of the message read from queue.
+        if priority is not None:
+            self.priority = priority
 
     def __repr__(self):
         rep = '%s.%s: %s' % (self.__module__, self.name, self.task_id)
@@ -857,6 +1651,8 @@ class QueueTask(object):
             rep += ' @%s' % self.execute_time
         if self.retries:
             rep += ' %s retries' % self.retries
+        if self.priority:
+            rep += ' priority=%s' % self.priority
         if self.on_complete:
             rep += ' -> %s' % self.on_complete
         return rep
@@ -901,10 +1697,26 @@ class QueueTask(object):
 
 
 class PeriodicQueueTask(QueueTask):
+    # Schedules with a resolution of one second are only honored by the
+    # scheduler in precise mode.
+    second_resolution = False
+
     def validate_datetime(self, dt):
         """Validate that the task should execute at the given datetime"""
         return False
 
+    def next_after(self, dt):
+        """
+        Return the next datetime after ``dt`` at which the task should
+        execute, or ``None`` if it is not known.
+        """
+        return None
+
+
+class BatchQueueTask(QueueTask):
+    max_size = 500
+    max_wait = 2.0
+
 
 def create_task(task_class, func, retries_as_argument=False, task_name=None,
                 include_task=False, **kwargs):
@@ -918,10 +1730,21 @@ def create_task(task_class, func, retries_as_argument=False, task_name=None,
 
     attrs = {
         'execute': execute,
+        'is_async': iscoroutinefunction(func),
         '__module__': func.__module__,
         '__doc__': func.__doc__}
     attrs.update(kwargs)
 
+    # Fail early, when the task is declared, on malformed rate limits.
+    if attrs.get('rate_limit'):
+        parse_rate_limit(attrs['rate_limit'])
+
+    # A function for computing the unique key implies the task is unique. It
+    # is wrapped so it is not bound as a method of the task.
+    if attrs.get('unique_key') is not None:
+        attrs['unique'] = True
+        attrs['unique_key'] = staticmethod(attrs['unique_key'])
+
     if not task_name:
         task_name = 'queue_task_%s' % (func.__name__)
 
@@ -932,31 +1755,36 @@ dash_re = re.compile('(\d+)-(\d+)')
 every_re = re.compile('\*\/(\d+)')
 
 
-def crontab(month='*', day='*', day_of_week='*', hour='*', minute='*'):
+class Crontab(object):
     """
-    Convert a "crontab"-style set of parameters into a test function that will
-    return True when the given datetime matches the parameters set forth in
-    the crontab.
-
-    For day-of-week, 0=Sunday and 6=Saturday.
-
-    Acceptable inputs:
-    * = every distinct value
-    */n = run every "n" times, i.e. hours='*/4' == 0, 4, 8, 12, 16, 20
-    m-n = run every time m..n
-    m,n = run on m and n
+    Compiled "crontab"-style schedule. Each field is converted into a bitmask
+    when the schedule is created, so checking whether a datetime matches is
+    cheap, and the next matching datetime can be computed with
+    :py:meth:`next_after`.
+
+    Instances are callable and return True when the given datetime matches
+    the schedule, so they can be used anywhere a ``validate_datetime``
+    function is expected.
+
+    For day-of-week, 0=Sunday and 6=Saturday. Unless ``second`` is given, the
+    schedule has a resolution of one minute and seconds are ignored when
+    matching.
     """
-    validation = (
-        ('m', month, range(1, 13)),
-        ('d', day, range(1, 32)),
-        ('w', day_of_week, range(8)), # 0-6, but also 7 for Sunday.
-        ('H', hour, range(24)),
-        ('M', minute, range(60))
-    )
-    cron_settings = []
+    def __init__(self, month='*', day='*', day_of_week='*', hour='*',
+                 minute='*', second=None):
+        self.month = self._parse('m', month, range(1, 13))
+        self.day = self._parse('d', day, range(1, 32))
+        # 0-6, but also 7 for Sunday.
+        self.day_of_week = self._parse('w', day_of_week, range(8))
+        self.hour = self._parse('H', hour, range(24))
+        self.minute = self._parse('M', minute, range(60))
+        if second is None:
+            self.second = None
+        else:
+            self.second = self._parse('S', second, range(60))
 
-    for (date_str, value, acceptable) in validation:
-        settings = set([])
+    def _parse(self, date_str, value, acceptable):
+        settings = set()
 
         if isinstance(value, int):
             value = str(value)
@@ -994,18 +1822,81 @@ def crontab(month='*', day='*', day_of_week='*', hour='*', minute='*'):
                     interval = int(every_match.groups()[0])
                     settings.update(acceptable[::interval])
 
-        cron_settings.append(sorted(list(settings)))
+        mask = 0
+        for value in settings:
+            mask |= 1 << value
+        return mask
 
-    def validate_date(dt):
-        _, m, d, H, M, _, w, _, _ = dt.timetuple()
+    def matches(self, dt):
+        """
+        Return whether the given datetime matches the schedule.
+        """
+        _, m, d, H, M, S, w, _, _ = dt.timetuple()
 
         # fix the weekday to be sunday=0
         w = (w + 1) % 7
 
-        for (date_piece, selection) in zip([m, d, w, H, M], cron_settings):
-            if date_piece not in selection:
-                return False
+        return bool(
+            (self.month >> m) & 1 and
+            (self.day >> d) & 1 and
+            (self.day_of_week >> w) & 1 and
+            (self.hour >> H) & 1 and
+            (self.minute >> M) & 1 and
+            (self.second is None or (self.second >> S) & 1))
 
-        return True
+    __call__ = matches
 
-    return validate_date
+    def next_after(self, dt):
+        """
+        Return the earliest datetime strictly after ``dt`` that matches the
+        schedule, or ``None`` if the schedule cannot be satisfied (e.g. the
+        30th of February).
+        """
+        dt = dt.replace(microsecond=0)
+        if self.second is None:
+            dt = dt.replace(second=0) + datetime.timedelta(minutes=1)
+        else:
+            dt += datetime.timedelta(seconds=1)
+
+        # The day and day-of-week fields must both match, so the combination
+        # repeats at most every 28 years.
+        max_year = dt.year + 29
+        while dt.year <= max_year:
+            if not (self.month >> dt.month) & 1:
+                if dt.month == 12:
+                    dt = dt.replace(year=dt.year + 1, month=1, day=1, hour=0,
+                                    minute=0, second=0)
+                else:
+                    dt = dt.replace(month=dt.month + 1, day=1, hour=0,
+                                    minute=0, second=0)
+            elif (not (self.day >> dt.day) & 1 or
+                  not (self.day_of_week >> ((dt.weekday() + 1) % 7)) & 1):
+                dt = (dt.replace(hour=0, minute=0, second=0) +
+                      datetime.timedelta(days=1))
+            elif not (self.hour >> dt.hour) & 1:
+                dt = (dt.replace(minute=0, second=0) +
+                      datetime.timedelta(hours=1))
+            elif not (self.minute >> dt.minute) & 1:
+                dt = dt.replace(second=0) + datetime.timedelta(minutes=1)
+            elif self.second is not None and not (self.second >> dt.second) & 1:
+                dt += datetime.timedelta(seconds=1)
+            else:
+                return dt
+
+
+def crontab(month='*', day='*', day_of_week='*', hour='*', minute='*',
+            second=None):
+    """
+    Convert a "crontab"-style set of parameters into a :py:class:`Crontab`,
+    which will return True when called with a datetime that matches the
+    parameters set forth in the crontab.
+
+    For day-of-week, 0=Sunday and 6=Saturday.
+
+    Acceptable inputs:
+    * = every distinct value
+    */n = run every "n" times, i.e. hours='*/4' == 0, 4, 8, 12, 16, 20
+    m-n = run every time m..n
+    m,n = run on m and n
+    """
+    return Crontab(month, day, day_of_week, hour, minute, second)
@@ -25,6 +25,12 @@ def load_huey(path):
         raise
 
 
+def load_queue(arg):
+    # Queues are given as "path.to.huey_instance[:weight]".
+    path, _, weight = arg.partition(':')
+    return (load_huey(path), int(weight or 1))
+
+
 def consumer_main():
     parser_handler = OptionParserHandler()
     parser = parser_handler.get_option_parser()
@@ -40,10 +46,15 @@ def consumer_main():
     config = ConsumerConfig(**options)
     config.validate()
 
-    huey_instance = load_huey(args[0])
+    huey_instance, weight = load_queue(args[0])
+    queues = [(huey_instance, weight)] + [load_queue(arg) for arg in args[1:]]
     config.setup_logger()
 
-    consumer = huey_instance.create_consumer(**config.values)
+    if len(queues) > 1:
+        consumer = huey_instance.create_consumer(queues=queues,
+                                                 **config.values)
+    else:
+        consumer = huey_instance.create_consumer(**config.values)
     consumer.run()
 
 
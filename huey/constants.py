@@ -1,7 +1,8 @@
 WORKER_THREAD = 'thread'
 WORKER_GREENLET = 'greenlet'
 WORKER_PROCESS = 'process'
-WORKER_TYPES = (WORKER_THREAD, WORKER_GREENLET, WORKER_PROCESS)
+WORKER_ASYNCIO = 'asyncio'
+WORKER_TYPES = (WORKER_THREAD, WORKER_GREENLET, WORKER_PROCESS, WORKER_ASYNCIO)
 
 
 class EmptyData(object):
@@ -1,21 +1,35 @@
+import ctypes
 import datetime
+import functools
+import heapq
 import logging
 import os
 import signal
 import sys
 import threading
 import time
+from collections import deque
 
 from multiprocessing import Event as ProcessEvent
+from multiprocessing import Pipe
 from multiprocessing import Process
+from multiprocessing import Queue as ProcessQueue
+try:
+    from queue import Empty as QueueEmpty
+    from queue import Queue
+except ImportError:
+    from Queue import Empty as QueueEmpty
+    from Queue import Queue
 
 try:
     import gevent
     from gevent import Greenlet
     from gevent.event import Event as GreenEvent
+    from gevent.queue import Queue as GreenQueue
 except ImportError:
-    Greenlet = GreenEvent = None
+    Greenlet = GreenEvent = GreenQueue = None
 
+from huey.constants import WORKER_ASYNCIO
 from huey.constants import WORKER_GREENLET
 from huey.constants import WORKER_PROCESS
 from huey.constants import WORKER_THREAD
@@ -31,9 +45,12 @@ from huey.exceptions import RetryTask
 from huey.exceptions import ScheduleAddException
 from huey.exceptions import ScheduleReadException
 from huey.exceptions import TaskLockedException
+from huey.exceptions import TaskTimeoutException
+from huey.utils import get_rss
 
 
 EVENT_CHECKING_PERIODIC = 'checking-periodic'
+EVENT_DEFERRED = 'deferred'
 EVENT_ERROR_DEQUEUEING = 'error-dequeueing'
 EVENT_ERROR_ENQUEUEING = 'error-enqueueing'
 EVENT_ERROR_INTERNAL = 'error-internal'
@@ -48,6 +65,9 @@ EVENT_SCHEDULED = 'scheduled'
 EVENT_SCHEDULING_PERIODIC = 'scheduling-periodic'
 EVENT_STARTED = 'started'
 EVENT_TIMEOUT = 'timeout'
+EVENT_WORKER_RECYCLED = 'worker-recycled'
+EVENT_WORKER_RECYCLING = 'worker-recycling'
+EVENT_WORKERS_SCALED = 'workers-scaled'
 
 
 def to_timestamp(dt):
@@ -63,6 +83,7 @@ class BaseProcess(object):
     Subclasses should implement the `loop()` method, which is called repeatedly
     until the consumer is shutdown. The `loop()` method's return value is
     ignored, but an unhandled exception will lead to the process shutting down.
+    A process can also exit its run-loop cleanly by setting `finished`.
 
     A typical pattern might be::
 
@@ -96,10 +117,18 @@ class BaseProcess(object):
     def __init__(self, huey, utc):
         self.huey = huey
         self.utc = utc
+        self.finished = False
 
     def initialize(self):
         pass
 
+    def shutdown(self):
+        """
+        Called once when the process exits its run-loop, e.g. because the
+        consumer is shutting down.
+        """
+        pass
+
     def get_now(self):
         if self.utc:
             return datetime.datetime.utcnow()
@@ -158,39 +187,104 @@ class Worker(BaseProcess):
 
     Will pull tasks from the queue, executing them or adding them to the
     schedule if they are set to run in the future.
+
+    If ``prefetch`` is greater than 1, up to that many tasks will be read from
+    the queue at a time and buffered locally. The buffer is drained before the
+    worker goes back to the queue.
+
+    The worker exits after ``max_tasks`` tasks, or once the resident memory of
+    the process exceeds ``max_memory`` bytes, so that it can be replaced by
+    the consumer. The ``recycle_flag`` is set when this happens.
+
+    Tasks run with a deadline if they specify a ``timeout``, or if the worker
+    has a default ``timeout``. The deadline is enforced by the consumer, see
+    :py:meth:`Consumer.check_timeouts`. When a ``deadline_pipe`` is given,
+    the deadline is reported through it, so that it can be read from another
+    process.
+
+    The consumer can ask the worker to exit by setting the ``retire_flag``.
+    When a ``wait_times`` queue is given, the worker puts the number of
+    seconds each task spent waiting in the queue into it.
+
+    To serve several queues, ``queues`` is a list of (huey, weight) 2-tuples.
+    The queues are read using smooth weighted round-robin, so a queue with
+    weight 3 is read first three times as often as a queue with weight 1,
+    while an empty queue never holds up the others. While a task is being
+    processed, ``huey`` refers to the instance the task was read from.
     """
-    def __init__(self, huey, default_delay, max_delay, backoff, utc):
+    def __init__(self, huey, default_delay, max_delay, backoff, utc,
+                 prefetch=1, max_tasks=None, max_memory=None,
+                 recycle_flag=None, timeout=None, deadline_pipe=None,
+                 retire_flag=None, wait_times=None, queues=None):
         self.delay = self.default_delay = default_delay
         self.max_delay = max_delay
         self.backoff = backoff
+        self.prefetch = prefetch
+        self._prefetched = deque()
+        self.max_tasks = max_tasks
+        self.max_memory = max_memory
+        self.recycle_flag = recycle_flag or threading.Event()
+        self.tasks_processed = 0
+        self.timeout = timeout
+        self.deadline = None  # 2-tuple of (timestamp, task) while running.
+        self._deadline_pipe = deadline_pipe
+        self._deadline_lock = threading.Lock()
+        # Set by the consumer when it interrupts the running task, see
+        # clear_deadline().
+        self.cancel_interrupt = None
+        self.retire_flag = retire_flag or threading.Event()
+        self.wait_times = wait_times
+        self.queues = queues
+        self._queue_index = 0
+        if queues:
+            self._credits = [0] * len(queues)
+            self._total_weight = sum(weight for _, weight in queues)
         self._logger = logging.getLogger('huey.consumer.Worker')
-        self._pre_execute = huey.pre_execute_hooks.items()
-        self._post_execute = huey.post_execute_hooks.items()
         super(Worker, self).__init__(huey, utc)
+        self.set_queue(0)
 
     def initialize(self):
-        for name, startup_hook in self.huey.startup_hooks.items():
-            self._logger.debug('calling startup hook "%s"', name)
-            try:
-                startup_hook()
-            except Exception as exc:
-                self._logger.exception('startup hook "%s" failed', name)
+        hueys = [huey for huey, _ in self.queues] if self.queues else \
+                [self.huey]
+        for huey in hueys:
+            for name, startup_hook in huey.startup_hooks.items():
+                self._logger.debug('calling startup hook "%s"', name)
+                try:
+                    startup_hook()
+                except Exception as exc:
+                    self._logger.exception('startup hook "%s" failed', name)
+
+    def set_queue(self, index):
+        """
+        Make the Huey instance of the given queue the current one, when
+        serving several queues.
+        """
+        if self.queues:
+            self.huey = self.queues[index][0]
+        self._queue_index = index
+        self._pre_execute = self.huey.pre_execute_hooks.items()
+        self._post_execute = self.huey.post_execute_hooks.items()
 
     def loop(self, now=None):
+        if self.retire_flag.is_set():
+            self._logger.info('Worker retired by the consumer.')
+            self.finished = True
+            return
+
         task = None
         exc_raised = True
         try:
-            task = self.huey.dequeue()
+            task = self.dequeue()
         except QueueReadException:
-            self.huey.emit_status(EVENT_ERROR_DEQUEUEING, error=True)
+            self.emit_status(EVENT_ERROR_DEQUEUEING, error=True)
             self._logger.exception('Error reading from queue')
         except QueueException:
-            self.huey.emit_status(EVENT_ERROR_INTERNAL, error=True)
+            self.emit_status(EVENT_ERROR_INTERNAL, error=True)
             self._logger.exception('Queue exception')
         except KeyboardInterrupt:
             raise
         except:
-            self.huey.emit_status(EVENT_ERROR_DEQUEUEING, error=True)
+            self.emit_status(EVENT_ERROR_DEQUEUEING, error=True)
             self._logger.exception('Unknown exception dequeueing task.')
         else:
             exc_raised = False
@@ -198,9 +292,91 @@ class Worker(BaseProcess):
         if task:
             self.delay = self.default_delay
             self.handle_task(task, now or self.get_now())
+            self.tasks_processed += 1
+            self.check_recycle()
         elif exc_raised or not self.huey.blocking:
             self.sleep()
 
+    def check_recycle(self):
+        """
+        Exit the worker if it has processed ``max_tasks`` tasks or is using
+        more than ``max_memory`` bytes.
+        """
+        if self.max_tasks and self.tasks_processed >= self.max_tasks:
+            reason = 'processed %s tasks' % self.tasks_processed
+        elif self.max_memory and (get_rss() or 0) > self.max_memory:
+            reason = 'memory usage exceeds %s bytes' % self.max_memory
+        else:
+            return False
+
+        self._logger.info('Recycling worker, %s.', reason)
+        self.emit_status(
+            EVENT_WORKER_RECYCLING,
+            reason=reason,
+            tasks=self.tasks_processed,
+            memory=get_rss())
+        self.finished = True
+        self.recycle_flag.set()
+        return True
+
+    def dequeue(self):
+        if self.queues:
+            return self.dequeue_any()
+        if not self._prefetched:
+            if self.prefetch <= 1:
+                return self.huey.dequeue()
+            self._prefetched.extend(self.huey.dequeue_many(self.prefetch))
+        if self._prefetched:
+            return self._prefetched.popleft()
+
+    def dequeue_any(self):
+        """
+        Read a task from the queue with the most credit that is not empty.
+        Every read gives each queue credit equal to its weight, and the queue
+        that was read from is charged the total weight.
+        """
+        for i, (_, weight) in enumerate(self.queues):
+            self._credits[i] += weight
+        order = sorted(range(len(self.queues)),
+                       key=lambda i: -self._credits[i])
+
+        hueys = [self.queues[i][0] for i in order]
+        res = hueys[0].dequeue_any(hueys)
+        if res is None:
+            # Nothing was read, so do not accumulate credit while idle.
+            for i, (_, weight) in enumerate(self.queues):
+                self._credits[i] -= weight
+            return
+
+        huey, task = res
+        index = order[hueys.index(huey)]
+        total = self._total_weight
+        # Credit is bounded, so that a queue that was empty for a long time
+        # cannot monopolize the worker once it fills up.
+        self._credits[index] -= total
+        self._credits = [max(min(c, total), -total) for c in self._credits]
+        self.set_queue(index)
+        return task
+
+    def shutdown(self):
+        """
+        Return any prefetched tasks that were not run to the queue.
+        """
+        if not self._prefetched:
+            return
+        tasks = list(self._prefetched)
+        self._prefetched.clear()
+        self._logger.info('Returning %s prefetched task(s) to the queue.',
+                          len(tasks))
+        try:
+            self.huey.enqueue_many(tasks)
+        except QueueWriteException:
+            self._logger.exception('Error returning prefetched tasks to the '
+                                   'queue: %s', tasks)
+        else:
+            for task in tasks:
+                self.ack(task)
+
     def sleep(self):
         if self.delay > self.max_delay:
             self.delay = self.max_delay
@@ -221,13 +397,29 @@ class Worker(BaseProcess):
         if not self.huey.ready_to_run(task, ts):
             self.add_schedule(task)
         elif not self.is_revoked(task, ts):
-            self.process_task(task, ts)
+            # The slot is acquired first, so that a task deferred by its
+            # concurrency limit does not use up a rate limit token.
+            if task.concurrency and not self.acquire_slot(task):
+                self.defer_task(task, ts, task.concurrency_delay)
+            else:
+                try:
+                    wait = self.acquire_token(task) if task.rate_limit else 0
+                    if wait:
+                        self.defer_task(task, ts, wait)
+                    else:
+                        # Tasks are acknowledged by process_task(), unless
+                        # interrupted.
+                        return self.process_task(task, ts)
+                finally:
+                    if task.concurrency:
+                        self.release_slot(task)
         else:
-            self.huey.emit_task(
-                EVENT_REVOKED,
-                task,
-                timestamp=to_timestamp(ts))
-            self._logger.debug('Task %s was revoked, not running', task)
+            self.task_revoked(task, ts)
+            if task.unique:
+                self.clear_unique(task)
+            if task.chord:
+                self.finish_chord_task(task)
+        self.ack(task)
 
     def process_task(self, task, ts):
         """
@@ -235,69 +427,217 @@ class Worker(BaseProcess):
 
         Unhandled exceptions are caught and logged.
         """
-        self.huey.emit_task(EVENT_STARTED, task, timestamp=to_timestamp(ts))
+        self.task_started(task, ts)
+        if task.unique:
+            self.clear_unique(task)
         if self._pre_execute:
             try:
                 self.run_pre_execute_hooks(task)
             except CancelExecution:
+                if task.chord:
+                    self.finish_chord_task(task)
+                self.ack(task)
                 return
 
         self._logger.info('Executing %s', task)
         start = time.time()
         exception = None
         task_value = None
+        finished = False
+        timeout = self.get_timeout(task)
+        if timeout:
+            self.set_deadline(start + timeout, task)
 
         try:
             try:
                 task_value = self.huey.execute(task)
+                finished = True
             finally:
-                duration = time.time() - start
-        except DataStorePutException:
+                if timeout:
+                    self.clear_deadline()
+        except KeyboardInterrupt:
+            self._logger.info('Received exit signal, task %s did not finish.',
+                              task.task_id)
+            return
+        except Exception as exc:
+            # The task may be interrupted just after it finished, before its
+            # deadline was cleared, in which case its result is kept.
+            if not finished:
+                exception = exc
+
+        duration = time.time() - start
+        if exception is not None:
+            exception = self.task_failed(task, exception, duration)
+        else:
+            self.task_finished(task, duration)
+
+        if self._post_execute:
+            self.run_post_execute_hooks(task, task_value, exception)
+
+        self.ack(task)
+        if exception is not None and task.retries:
+            self.requeue_task(task, self.get_now())
+
+    def emit_status(self, status, error=False, **data):
+        self.huey.emit_status(status, error=error, **data)
+
+    def emit_task(self, status, task, error=False, **data):
+        self.huey.emit_task(status, task, error=error, **data)
+
+    def task_revoked(self, task, ts):
+        self.emit_task(EVENT_REVOKED, task, timestamp=to_timestamp(ts))
+        self._logger.debug('Task %s was revoked, not running', task)
+
+    def task_started(self, task, ts):
+        self.emit_task(EVENT_STARTED, task, timestamp=to_timestamp(ts))
+        if self.wait_times is not None and task.enqueued_at:
+            self.wait_times.put(max(time.time() - task.enqueued_at, 0))
+
+    def task_finished(self, task, duration):
+        self._logger.info('Executed %s in %0.3fs', task, duration)
+        self.emit_task(
+            EVENT_FINISHED,
+            task,
+            duration=duration,
+            timestamp=self.get_timestamp())
+
+    def task_failed(self, task, exc, duration):
+        """
+        Log and emit the appropriate event for an exception raised while
+        executing a task. Must be called from the exception handler.
+
+        :return: the exception to pass to the post-execute hooks, which is
+            ``None`` if only storing the task's result failed. Tasks are
+            retried if this is not ``None``.
+        """
+        if isinstance(exc, DataStorePutException):
             self._logger.exception('Error storing result')
-            self.huey.emit_task(
+            self.emit_task(
                 EVENT_ERROR_STORING_RESULT,
                 task,
                 error=True,
                 duration=duration)
-        except TaskLockedException as exc:
+            return None
+        elif isinstance(exc, TaskLockedException):
             self._logger.warning('Task %s could not run, unable to obtain '
                                  'lock.', task.task_id)
-            self.huey.emit_task(
+            self.emit_task(
                 EVENT_LOCKED,
                 task,
                 error=False,
                 duration=duration)
-            exception = exc
-        except RetryTask:
+        elif isinstance(exc, RetryTask):
             if not task.retries:
                 self._logger.error('Cannot retry task %s - no retries '
                                    'remaining.', task.task_id)
-            exception = True
-        except KeyboardInterrupt:
-            self._logger.info('Received exit signal, task %s did not finish.',
-                              task.task_id)
-            return
-        except Exception as exc:
-            self._logger.exception('Unhandled exception in worker thread')
-            self.huey.emit_task(
-                EVENT_ERROR_TASK,
+            return True
+        elif isinstance(exc, TaskTimeoutException):
+            self._logger.error('Task %s did not finish within %ss.',
+                               task.task_id, self.get_timeout(task))
+            self.emit_task(
+                EVENT_TIMEOUT,
                 task,
                 error=True,
                 duration=duration)
-            exception = exc
         else:
-            self._logger.info('Executed %s in %0.3fs', task, duration)
-            self.huey.emit_task(
-                EVENT_FINISHED,
+            self._logger.exception('Unhandled exception in worker thread')
+            self.emit_task(
+                EVENT_ERROR_TASK,
                 task,
-                duration=duration,
-                timestamp=self.get_timestamp())
+                error=True,
+                duration=duration)
+        return exc
 
-        if self._post_execute:
-            self.run_post_execute_hooks(task, task_value, exception)
+    def get_timeout(self, task):
+        if task.timeout is not None:
+            return task.timeout
+        return self.timeout
 
-        if exception is not None and task.retries:
+    def set_deadline(self, ts, task=None):
+        """
+        Record the time by which the current task must finish, or clear it if
+        ``ts`` is None.
+        """
+        if self._deadline_pipe is not None:
+            msg = None
+            if ts is not None:
+                # Prefetched tasks are sent along, so that the consumer can
+                # return them to the queue if the process is terminated.
+                prefetched = [(self.huey.serialize_task(t), t.message)
+                              for t in self._prefetched]
+                msg = (self.huey.serialize_task(task), task.message,
+                       self._queue_index, prefetched)
+            self._deadline_pipe[1].send((ts, msg))
+        else:
+            with self._deadline_lock:
+                self.deadline = None if ts is None else (ts, task)
+                self.cancel_interrupt = None
+
+    def clear_deadline(self):
+        """
+        Clear the deadline of the task that just ran. If the consumer
+        interrupted the task, but the exception has not been raised yet, it
+        is cancelled, so that it cannot be raised once the task is over.
+        """
+        if self._deadline_pipe is not None:
+            return self.set_deadline(None)
+        with self._deadline_lock:
+            self.deadline = None
+            cancel, self.cancel_interrupt = self.cancel_interrupt, None
+        if cancel is not None:
+            cancel()
+
+    def get_deadline(self):
+        """
+        Return the deadline of the task the worker is running, as a 2-tuple
+        of (timestamp, task), or None. Called by the consumer.
+        """
+        if self._deadline_pipe is not None:
+            reader = self._deadline_pipe[0]
+            while reader.poll():
+                ts, msg = reader.recv()
+                self._prefetched.clear()
+                if ts is None:
+                    self.deadline = None
+                else:
+                    data, ack, index, prefetched = msg
+                    self.set_queue(index)
+                    task = self._load_task(data, ack)
+                    self._prefetched.extend(self._load_task(d, a)
+                                            for d, a in prefetched)
+                    self.deadline = (ts, task)
+        return self.deadline
+
+    def _load_task(self, data, message):
+        task = self.huey.deserialize_task(data)
+        task.message = message
+        return task
+
+    def handle_timeout(self, task):
+        """
+        Called by the consumer after terminating a worker process that was
+        running the given task for longer than its timeout. Tasks the process
+        had prefetched are returned to the queue.
+        """
+        self._logger.error('Task %s did not finish within %ss, worker was '
+                           'terminated.', task.task_id, self.get_timeout(task))
+        self.emit_task(EVENT_TIMEOUT, task, error=True)
+        if self.huey.store_errors:
+            metadata = self.huey._get_error_metadata(task,
+                                                     TaskTimeoutException())
+            metadata['traceback'] = None
+            try:
+                self.huey._put_task_error(task, metadata)
+            except DataStorePutException:
+                self._logger.exception('Error storing result')
+        if task.concurrency:
+            self.release_slot(task)
+        self.ack(task)
+        if task.retries:
             self.requeue_task(task, self.get_now())
+        elif task.chord:
+            self.finish_chord_task(task)
+        self.shutdown()
 
     def run_pre_execute_hooks(self, task):
         self._logger.info('Running pre-execute hooks for %s', task)
@@ -324,26 +664,100 @@ class Worker(BaseProcess):
                                        'execute hook %s for %s.', name, task)
 
     def requeue_task(self, task, ts):
+        if self.prepare_retry(task, ts):
+            self.add_schedule(task)
+        else:
+            self.enqueue(task)
+
+    def prepare_retry(self, task, ts):
+        """
+        Use up one of the task's retries. Return True if the task has a retry
+        delay, and must be added to the schedule rather than enqueued.
+        """
         task.retries -= 1
-        self.huey.emit_task(EVENT_RETRYING, task)
+        self.emit_task(EVENT_RETRYING, task)
         self._logger.info('Re-enqueueing task %s, %s tries left',
                           task.task_id, task.retries)
         if task.retry_delay:
             delay = datetime.timedelta(seconds=task.retry_delay)
             task.execute_time = ts + delay
-            self.add_schedule(task)
-        else:
-            self.enqueue(task)
+            return True
+        return False
+
+    def acquire_slot(self, task):
+        try:
+            return self.huey.acquire_slot(task)
+        except DataStorePutException:
+            self.emit_task(EVENT_ERROR_INTERNAL, task, error=True)
+            self._logger.exception('Error acquiring concurrency slot for %s',
+                                   task)
+            return False
+
+    def release_slot(self, task):
+        try:
+            self.huey.release_slot(task)
+        except DataStorePutException:
+            self.emit_task(EVENT_ERROR_INTERNAL, task, error=True)
+            self._logger.exception('Error releasing concurrency slot for %s',
+                                   task)
+
+    def acquire_token(self, task):
+        try:
+            return self.huey.acquire_token(task)
+        except DataStorePutException:
+            # Fail open: the task runs, rather than being deferred forever
+            # while the storage is unavailable.
+            self.emit_task(EVENT_ERROR_INTERNAL, task, error=True)
+            self._logger.exception('Error checking rate limit for %s', task)
+            return 0
+
+    def clear_unique(self, task):
+        try:
+            self.huey.clear_unique(task)
+        except DataStoreGetException:
+            self.emit_task(EVENT_ERROR_INTERNAL, task, error=True)
+            self._logger.exception('Error clearing unique key for %s', task)
+
+    def finish_chord_task(self, task):
+        # Called for tasks in a chord that will not be executed, so that the
+        # callback is not held up.
+        try:
+            self.huey._finish_chord_task(task)
+        except QueueException:
+            self.emit_task(EVENT_ERROR_INTERNAL, task, error=True)
+            self._logger.exception('Error finishing chord task %s', task)
+
+    def defer_task(self, task, ts, delay):
+        """
+        Add a task that is over its concurrency or rate limit back to the
+        schedule, to run after ``delay`` seconds, without using up any of its
+        retries.
+        """
+        self.prepare_defer(task, ts, delay)
+        self.add_schedule(task)
+
+    def prepare_defer(self, task, ts, delay):
+        self._logger.info('Task %s is over its concurrency or rate limit, '
+                          'deferring by %ss.', task.task_id, delay)
+        self.emit_task(EVENT_DEFERRED, task, delay=delay)
+        task.execute_time = ts + datetime.timedelta(seconds=delay)
 
     def add_schedule(self, task):
         self._logger.info('Adding %s to schedule', task)
         try:
             self.huey.add_schedule(task)
         except ScheduleAddException:
-            self.huey.emit_task(EVENT_ERROR_SCHEDULING, task, error=True)
+            self.emit_task(EVENT_ERROR_SCHEDULING, task, error=True)
             self._logger.error('Error adding task to schedule: %s', task)
         else:
-            self.huey.emit_task(EVENT_SCHEDULED, task)
+            self.emit_task(EVENT_SCHEDULED, task)
+
+    def ack(self, task):
+        try:
+            self.huey.ack(task)
+        except QueueException:
+            self.emit_task(EVENT_ERROR_INTERNAL, task, error=True)
+            self._logger.exception('Error acknowledging task: %s', task)
 
     def is_revoked(self, task, ts):
         try:
@@ -351,7 +765,7 @@ class Worker(BaseProcess):
                 return True
             return False
         except DataStoreGetException:
-            self.huey.emit_task(EVENT_ERROR_INTERNAL, task, error=True)
+            self.emit_task(EVENT_ERROR_INTERNAL, task, error=True)
             self._logger.error('Error checking if task is revoked: %s', task)
             return True
 
@@ -364,11 +778,32 @@ class Scheduler(BaseProcess):
 
     If periodic tasks are enabled, the scheduler will wake up every 60 seconds
     to enqueue any periodic tasks that should be run.
+
+    In precise mode, periodic tasks that can compute their next run time (e.g.
+    those using :py:func:`crontab`) are kept in a heap ordered by their next
+    run time. The scheduler sleeps until the next periodic or scheduled task
+    is due, and is woken up early when a task is added to the schedule.
+
+    When several consumers are run for redundancy, ``dedupe_periodic`` ensures
+    that each run of a periodic task is enqueued by only one of them.
+
+    The scheduler also periodically removes expired results from the result
+    store, for storage implementations that do not expire data natively.
     """
-    def __init__(self, huey, interval, utc, periodic):
+    sweep_interval = 60
+    sweep_limit = 1000
+    dedupe_ttl = 3600
+
+    def __init__(self, huey, interval, utc, periodic, precise=False,
+                 dedupe_periodic=False):
         super(Scheduler, self).__init__(huey, utc)
         self.interval = min(interval, 60)
         self.periodic = periodic
+        self.precise = precise
+        self.dedupe_periodic = dedupe_periodic
+        self._periodic_heap = None
+        self._other_periodic = None
+        self._last_minute = None
         if periodic:
             # Determine the periodic task interval.
             self._counter = 0
@@ -376,23 +811,23 @@ class Scheduler(BaseProcess):
             self._cr = self._r
         self._logger = logging.getLogger('huey.consumer.Scheduler')
         self._next_loop = time.time()
+        self._next_sweep = time.time() + self.sweep_interval
 
     def loop(self, now=None):
+        if self.precise:
+            return self.loop_precise(now)
+
         current = self._next_loop
         self._next_loop += self.interval
         if self._next_loop < time.time():
             self._logger.info('scheduler skipping iteration to avoid race.')
             return
 
-        try:
-            task_list = self.huey.read_schedule(now or self.get_now())
-        except ScheduleReadException:
-            #self.huey.emit_task(EVENT_ERROR_SCHEDULING, task, error=True)
-            self._logger.exception('Error reading from task schedule.')
-        else:
-            for task in task_list:
-                self._logger.info('Scheduling %s for execution', task)
-                self.enqueue(task)
+        self.enqueue_scheduled_tasks(now or self.get_now())
+
+        if time.time() >= self._next_sweep:
+            self._next_sweep = time.time() + self.sweep_interval
+            self.sweep_results()
 
         if self.periodic:
             # The scheduler has an interesting property of being able to run at
@@ -417,21 +852,147 @@ class Scheduler(BaseProcess):
 
         self.sleep_for_interval(current, self.interval)
 
+    def loop_precise(self, now=None):
+        start = time.time()
+        now = now or self.get_now()
+        self.enqueue_scheduled_tasks(now)
+
+        if time.time() >= self._next_sweep:
+            self._next_sweep = time.time() + self.sweep_interval
+            self.sweep_results()
+
+        delay = self.interval
+        if self.periodic:
+            self.enqueue_due_periodic_tasks(now)
+            if self._periodic_heap:
+                next_ts = self._periodic_heap[0][0]
+                delay = min(delay, (next_ts - now).total_seconds())
+
+        try:
+            next_ts = self.huey.next_scheduled_ts()
+        except ScheduleReadException:
+            self._logger.exception('Error reading from task schedule.')
+        else:
+            if next_ts is not None:
+                delay = min(delay, (next_ts - now).total_seconds())
+        self.wait_for_interval(start, delay)
+
+    def wait_for_interval(self, start_ts, nseconds):
+        """
+        Like :py:meth:`sleep_for_interval`, but returns early if a task is added
+        to the schedule. As storage backends may only support waiting for whole
+        seconds, the remaining fraction of a second is slept normally.
+        """
+        sleep_time = nseconds - (time.time() - start_ts)
+        if sleep_time >= 1:
+            self._logger.debug('Waiting up to %s for schedule', sleep_time)
+            try:
+                self.huey.wait_for_schedule(int(sleep_time))
+            except ScheduleReadException:
+                self._logger.exception('Error waiting for task schedule.')
+                time.sleep(sleep_time)
+        elif sleep_time > 0:
+            time.sleep(sleep_time)
+
+    def enqueue_scheduled_tasks(self, now):
+        try:
+            task_list = self.huey.read_schedule(now)
+        except ScheduleReadException:
+            #self.huey.emit_task(EVENT_ERROR_SCHEDULING, task, error=True)
+            self._logger.exception('Error reading from task schedule.')
+        else:
+            for task in task_list:
+                self._logger.info('Scheduling %s for execution', task)
+                self.enqueue(task)
+
+    def _load_periodic_tasks(self, now):
+        self._periodic_heap = []
+        self._other_periodic = []
+        for i, task in enumerate(self.huey.registry.get_periodic_tasks()):
+            next_ts = task.next_after(now)
+            if next_ts is None:
+                self._other_periodic.append(type(task))
+            else:
+                self._periodic_heap.append((next_ts, i, type(task)))
+        heapq.heapify(self._periodic_heap)
+
+    def enqueue_due_periodic_tasks(self, now):
+        """
+        Enqueue the periodic tasks whose next run time has passed. Used in
+        precise mode instead of :py:meth:`enqueue_periodic_tasks`.
+        """
+        if self._periodic_heap is None:
+            self._load_periodic_tasks(now)
+
+        heap = self._periodic_heap
+        while heap and heap[0][0] <= now:
+            ts, i, task_class = heapq.heappop(heap)
+            task = task_class()
+            self.enqueue_periodic_task(task, ts)
+            next_ts = task.next_after(now)
+            if next_ts is not None:
+                heapq.heappush(heap, (next_ts, i, task_class))
+
+        # Tasks that cannot compute their next run time are checked once per
+        # minute, as in the default mode.
+        minute = now.replace(second=0, microsecond=0)
+        if self._other_periodic and minute != self._last_minute:
+            self._last_minute = minute
+            for task_class in self._other_periodic:
+                task = task_class()
+                if task.validate_datetime(now):
+                    self.enqueue_periodic_task(task, minute)
+
+    def sweep_results(self):
+        # Remove a bounded number of expired results on each pass, so that a
+        # large backlog of expired results does not stall the scheduler.
+        try:
+            n = self.huey.sweep_results(self.sweep_limit)
+        except DataStorePutException:
+            self._logger.exception('Error removing expired results.')
+        else:
+            if n:
+                self._logger.debug('Removed %s expired results.', n)
+            return n
+
     def enqueue_periodic_tasks(self, now, start):
         self.huey.emit_status(
             EVENT_CHECKING_PERIODIC,
             timestamp=self.get_timestamp())
         self._logger.debug('Checking periodic tasks')
+        minute = now.replace(second=0, microsecond=0)
         for task in self.huey.read_periodic(now):
-            self.huey.emit_task(
-                EVENT_SCHEDULING_PERIODIC,
-                task,
-                timestamp=self.get_timestamp())
-            self._logger.info('Scheduling periodic task %s.', task)
-            self.enqueue(task)
+            self.enqueue_periodic_task(task, minute)
 
         return True
 
+    def claim_periodic_task(self, task, ts):
+        """
+        Claim the run of a periodic task at the given time, so that when
+        several consumers are running, only one of them enqueues it. The claim
+        is a key that is only written if it does not exist yet.
+        """
+        key = 'p:%s:%s' % (self.huey.registry.task_to_string(type(task)),
+                           ts.strftime('%Y-%m-%dT%H:%M:%S'))
+        try:
+            return self.huey._put_if_empty(key, '1', self.dedupe_ttl)
+        except DataStorePutException:
+            self._logger.exception('Error claiming periodic task %s.', task)
+            return False
+
+    def enqueue_periodic_task(self, task, ts):
+        if self.dedupe_periodic and not self.claim_periodic_task(task, ts):
+            self._logger.debug('Periodic task %s already enqueued by another '
+                               'consumer.', task)
+            return
+
+        self.huey.emit_task(
+            EVENT_SCHEDULING_PERIODIC,
+            task,
+            timestamp=self.get_timestamp())
+        self._logger.info('Scheduling periodic task %s.', task)
+        self.enqueue(task)
+
 
 class Environment(object):
     """
@@ -446,6 +1007,28 @@ class Environment(object):
     def is_alive(self, proc):
         raise NotImplementedError
 
+    def interrupt(self, proc, exc_class):
+        """
+        Interrupt the task running in the given process by raising the
+        exception in it. Returns True if the process was terminated instead.
+        """
+        raise NotImplementedError
+
+    def cancel_interrupt(self, proc, exc_class):
+        """
+        Cancel the interruption of the given process, if the exception has
+        not been raised yet. Called from the interrupted process itself.
+        """
+        pass
+
+    def get_deadline_pipe(self):
+        # Deadlines are only sent through a pipe when workers do not share
+        # memory with the consumer.
+        return None
+
+    def get_queue(self):
+        raise NotImplementedError
+
 
 class ThreadEnvironment(Environment):
     def get_stop_flag(self):
@@ -457,7 +1040,23 @@ class ThreadEnvironment(Environment):
         return t
 
     def is_alive(self, proc):
-        return proc.isAlive()
+        return proc.is_alive()
+
+    def interrupt(self, proc, exc_class):
+        # The exception is raised the next time the thread executes Python
+        # bytecode, so a thread blocked in a system call is interrupted once
+        # the call returns.
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_ulong(proc.ident),
+            ctypes.py_object(exc_class))
+        return False
+
+    def cancel_interrupt(self, proc, exc_class):
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(
+            ctypes.c_ulong(proc.ident), None)
+
+    def get_queue(self):
+        return Queue()
 
 
 class GreenletEnvironment(Environment):
@@ -474,25 +1073,64 @@ class GreenletEnvironment(Environment):
     def is_alive(self, proc):
         return not proc.dead
 
+    def interrupt(self, proc, exc_class):
+        # The exception is raised the next time the greenlet yields.
+        proc.kill(exc_class, block=False)
+        return False
+
+    def cancel_interrupt(self, proc, exc_class):
+        # Yield, so that a pending exception is raised here.
+        try:
+            gevent.sleep()
+        except exc_class:
+            pass
+
+    def get_queue(self):
+        return GreenQueue()
+
 
 class ProcessEnvironment(Environment):
+    # Seconds to wait for a terminated process to exit before killing it.
+    terminate_timeout = 5
+
     def get_stop_flag(self):
         return ProcessEvent()
 
     def create_process(self, runnable, name):
-        p = Process(target=runnable, name=name)
+        def run_wrapper():
+            # The consumer's SIGTERM handler is inherited when the process is
+            # forked, and would prevent the process from being terminated.
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            runnable()
+        p = Process(target=run_wrapper, name=name)
         p.daemon = True
         return p
 
     def is_alive(self, proc):
         return proc.is_alive()
 
+    def interrupt(self, proc, exc_class):
+        proc.terminate()
+        proc.join(self.terminate_timeout)
+        if proc.is_alive():
+            os.kill(proc.pid, signal.SIGKILL)
+            proc.join()
+        return True
+
+    def get_deadline_pipe(self):
+        return Pipe(duplex=False)
+
+    def get_queue(self):
+        return ProcessQueue()
+
 
 WORKER_TO_ENVIRONMENT = {
     WORKER_THREAD: ThreadEnvironment,
     WORKER_GREENLET: GreenletEnvironment,
     'gevent': GreenletEnvironment,  # Preserved for backwards-compat.
     WORKER_PROCESS: ProcessEnvironment,
+    # The asyncio worker runs its event loop in a thread.
+    WORKER_ASYNCIO: ThreadEnvironment,
 }
 
 
@@ -501,10 +1139,19 @@ class Consumer(object):
     Consumer sets up and coordinates the execution of the workers and scheduler
     and registers signal handlers.
     """
+    # Number of consecutive health checks the consumer must be busy (or idle)
+    # before workers are added (or retired).
+    scale_up_checks = 2
+    scale_down_checks = 30
+
     def __init__(self, huey, workers=1, periodic=True, initial_delay=0.1,
                  backoff=1.15, max_delay=10.0, utc=True, scheduler_interval=1,
                  worker_type='thread', check_worker_health=True,
-                 health_check_interval=1, flush_locks=False):
+                 health_check_interval=1, flush_locks=False, prefetch=1,
+                 precise=False, dedupe_periodic=False,
+                 max_tasks_per_worker=None, max_worker_memory=None,
+                 task_timeout=None, min_workers=None, max_workers=None,
+                 scale_latency=1.0, queues=None):
 
         self._logger = logging.getLogger('huey.consumer')
         if huey.always_eager:
@@ -513,6 +1160,9 @@ class Consumer(object):
                                  'must be disabled before the consumer can '
                                  'be run.')
         self.huey = huey
+        # Huey instances served by the consumer, as (huey, weight) 2-tuples.
+        # The first is always `huey`.
+        self.queues = self._get_queues(huey, queues)
         self.workers = workers  # Number of workers.
         self.periodic = periodic  # Enable periodic task scheduler?
         self.default_delay = initial_delay  # Default queue polling interval.
@@ -523,15 +1173,66 @@ class Consumer(object):
         # Ensure that the scheduler runs at an interval between 1 and 60s.
         self.scheduler_interval = max(min(scheduler_interval, 60), 1)
         self.worker_type = worker_type  # What process model are we using?
+        self.prefetch = max(prefetch, 1)  # Tasks to read from queue at once.
+        if len(self.queues) > 1:
+            if worker_type == WORKER_ASYNCIO:
+                raise ConfigurationError('The asyncio worker can only serve '
+                                         'a single queue.')
+            if self.prefetch > 1:
+                self._logger.warning('Workers read one task at a time when '
+                                     'serving several queues, so prefetch '
+                                     'is ignored.')
+                self.prefetch = 1
+        self.precise = precise  # Fire periodic tasks at their exact time.
+        self.dedupe_periodic = dedupe_periodic  # Coordinate periodic tasks.
+
+        # Workers exit after running this many tasks, or once the process uses
+        # more than this many megabytes, and are replaced by the health check.
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.max_worker_memory = max_worker_memory
+        self._recycled = 0
+        if max_worker_memory and worker_type != WORKER_PROCESS:
+            self._logger.warning('Memory usage is measured per-process, so '
+                                 'max_worker_memory is ignored unless the '
+                                 'process worker type is used.')
+            self.max_worker_memory = None
 
         # Configure health-check and consumer main-loop attributes.
         self._stop_flag_timeout = 0.1
         self._health_check = check_worker_health
         self._health_check_interval = float(health_check_interval)
+        # Default timeout for tasks that do not specify one. Timeouts are
+        # enforced by the health check.
+        self.task_timeout = task_timeout
+        if self.max_tasks_per_worker or self.max_worker_memory or \
+                self.task_timeout:
+            # Recycled workers are replaced by the health check.
+            self._health_check = True
 
         # Create the execution environment helper.
         self.environment = self.get_environment(self.worker_type)
 
+        # The number of workers is adjusted by the health check, between
+        # `min_workers` and `max_workers`, based on the number of pending
+        # tasks and how long tasks wait in the queue before they run.
+        self.min_workers = workers if min_workers is None else min_workers
+        self.max_workers = workers if max_workers is None else max_workers
+        self.scale_latency = scale_latency
+        self._autoscale = self.min_workers != self.max_workers
+        if self._autoscale and worker_type == WORKER_ASYNCIO:
+            self._logger.warning('The asyncio worker runs tasks concurrently '
+                                 'on a single worker, so min_workers and '
+                                 'max_workers are ignored.')
+            self._autoscale = False
+        self._retiring = []
+        self._busy_checks = self._idle_checks = 0
+        self._wait_times = None
+        if self._autoscale:
+            workers = max(min(workers, self.max_workers), self.min_workers)
+            self.workers = workers
+            self._wait_times = self.environment.get_queue()
+            self._health_check = True
+
         # Create the event used to signal the process should terminate. We'll
         # also store a boolean flag to indicate whether we should restart after
         # the processes are cleaned up.
@@ -545,13 +1246,23 @@ class Consumer(object):
         if flush_locks:
             self.flush_locks()
 
-        # Create the scheduler process (but don't start it yet).
-        scheduler = self._create_scheduler()
-        self.scheduler = self._create_process(scheduler, 'Scheduler')
-
-        # Create the worker process(es) (also not started yet).
+        # Create the scheduler process(es) (but don't start them yet). Each
+        # queue has its own schedule, stored as [(huey, scheduler_t), ...].
+        self.schedulers = []
+        for huey, _ in self.queues:
+            scheduler = self._create_scheduler(huey)
+            process = self._create_process(scheduler,
+                                           self._scheduler_name(huey))
+            self.schedulers.append((huey, process))
+
+        # Create the worker process(es) (also not started yet). When using
+        # asyncio, a single worker runs up to `workers` tasks concurrently.
         self.worker_threads = []
-        for i in range(workers):
+        if self.worker_type == WORKER_ASYNCIO:
+            nworkers = 1
+        else:
+            nworkers = workers
+        for i in range(nworkers):
             worker = self._create_worker()
             process = self._create_process(worker, 'Worker-%d' % (i + 1))
 
@@ -560,12 +1271,38 @@ class Consumer(object):
             # but it is referenced in the test-suite.
             self.worker_threads.append((worker, process))
 
+    def _get_queues(self, huey, queues):
+        accum = [(huey, 1)]
+        for item in queues or ():
+            if isinstance(item, tuple):
+                queue_huey, weight = item
+            else:
+                queue_huey, weight = item, 1
+            if weight < 1:
+                raise ValueError('Queue weights must be at least 1.')
+            if queue_huey is huey:
+                accum[0] = (huey, weight)
+            else:
+                accum.append((queue_huey, weight))
+        return accum
+
+    @property
+    def scheduler(self):
+        # Scheduler of the main Huey instance.
+        return self.schedulers[0][1]
+
+    def _scheduler_name(self, huey):
+        if huey is self.huey:
+            return 'Scheduler'
+        return 'Scheduler-%s' % huey.name
+
     def flush_locks(self):
         self._logger.debug('Flushing locks before starting up.')
-        flushed = self.huey.flush_locks()
-        if flushed:
-            self._logger.warning('Found stale locks: %s' % (
-                ', '.join(key for key in flushed)))
+        for huey, _ in self.queues:
+            flushed = huey.flush_locks()
+            if flushed:
+                self._logger.warning('Found stale locks: %s' % (
+                    ', '.join(key for key in flushed)))
 
     def get_environment(self, worker_type):
         if worker_type not in WORKER_TO_ENVIRONMENT:
@@ -574,19 +1311,45 @@ class Consumer(object):
         return WORKER_TO_ENVIRONMENT[worker_type]()
 
     def _create_worker(self):
-        return Worker(
+        if self.max_worker_memory:
+            max_memory = self.max_worker_memory * 1024 * 1024
+        else:
+            max_memory = None
+        kwargs = dict(
             huey=self.huey,
             default_delay=self.default_delay,
             max_delay=self.max_delay,
             backoff=self.backoff,
-            utc=self.utc)
-
-    def _create_scheduler(self):
+            utc=self.utc,
+            prefetch=self.prefetch,
+            max_tasks=self.max_tasks_per_worker,
+            max_memory=max_memory,
+            recycle_flag=self.environment.get_stop_flag(),
+            timeout=self.task_timeout,
+            deadline_pipe=self.environment.get_deadline_pipe(),
+            retire_flag=self.environment.get_stop_flag(),
+            wait_times=self._wait_times)
+        if len(self.queues) > 1:
+            kwargs['queues'] = self.queues
+        if self.worker_type == WORKER_ASYNCIO:
+            from huey.contrib.asyncio import AsyncWorker
+            return AsyncWorker(concurrency=self.workers, **kwargs)
+        return Worker(**kwargs)
+
+    def _create_scheduler(self, huey=None):
+        if huey is None:
+            huey = self.huey
+        # Periodic tasks in the shared registry are only enqueued into the
+        # main Huey instance's queue.
+        periodic = self.periodic and (huey is self.huey or
+                                      huey.registry is not self.huey.registry)
         return Scheduler(
-            huey=self.huey,
+            huey=huey,
             interval=self.scheduler_interval,
             utc=self.utc,
-            periodic=self.periodic)
+            periodic=periodic,
+            precise=self.precise,
+            dedupe_periodic=self.dedupe_periodic)
 
     def _create_process(self, process, name):
         """
@@ -596,33 +1359,81 @@ class Consumer(object):
         def _run():
             process.initialize()
             try:
-                while not self.stop_flag.is_set():
+                while not self.stop_flag.is_set() and not process.finished:
                     process.loop()
             except KeyboardInterrupt:
                 pass
             except:
                 self._logger.exception('Process %s died!', name)
+
+            try:
+                process.shutdown()
+            except:
+                self._logger.exception('Error shutting down %s.', name)
         return self.environment.create_process(_run, name)
 
+    def _check_periodic_resolution(self):
+        # Outside precise mode, periodic tasks are checked once per minute, at
+        # an arbitrary second, so schedules down to the second would rarely
+        # run.
+        if not self.periodic or self.precise:
+            return
+        names = sorted(set(
+            type(task).__name__
+            for huey, _ in self.queues
+            for task in huey.registry.get_periodic_tasks()
+            if task.second_resolution))
+        if names:
+            raise ConfigurationError(
+                'Periodic tasks %s are scheduled to the second, which requires'
+                ' the consumer to run in precise mode (-P).' %
+                ', '.join(names))
+
     def start(self):
         """
         Start all consumer processes and register signal handlers.
         """
-        if self.huey.always_eager:
+        if any(huey.always_eager for huey, _ in self.queues):
             raise ConfigurationError(
                 'Consumer cannot be run with Huey instances where always_eager'
                 ' is enabled. Please check your configuration and ensure that'
                 ' "huey.always_eager = False".')
+        self._check_periodic_resolution()
         # Log startup message.
         self._logger.info('Huey consumer started with %s %s, PID %s',
                           self.workers, self.worker_type, os.getpid())
+        if len(self.queues) > 1:
+            self._logger.info('Serving queues: %s.', ', '.join(
+                '%s (weight %s)' % (huey.name, weight)
+                for huey, weight in self.queues))
+        if self.prefetch > 1:
+            self._logger.info('Workers will prefetch up to %s tasks.',
+                              self.prefetch)
         self._logger.info('Scheduler runs every %s second(s).',
                           self.scheduler_interval)
         self._logger.info('Periodic tasks are %s.',
                           'enabled' if self.periodic else 'disabled')
+        if self.precise:
+            self._logger.info('Scheduler is running in precise mode.')
+        if self.periodic and self.dedupe_periodic:
+            self._logger.info('Periodic tasks are deduplicated across '
+                              'consumers.')
+        if self.max_tasks_per_worker:
+            self._logger.info('Workers are recycled after %s tasks.',
+                              self.max_tasks_per_worker)
+        if self.max_worker_memory:
+            self._logger.info('Workers are recycled when using more than '
+                              '%sMB.', self.max_worker_memory)
+        if self.task_timeout:
+            self._logger.info('Tasks time out after %s seconds by default.',
+                              self.task_timeout)
+        if self._autoscale:
+            self._logger.info('Workers are scaled between %s and %s.',
+                              self.min_workers, self.max_workers)
         self._logger.info('UTC is %s.', 'enabled' if self.utc else 'disabled')
 
         self._set_signal_handlers()
+        self.heartbeat()
 
         msg = ['The following commands are available:']
         for command in self.huey.registry._registry:
@@ -637,7 +1448,8 @@ class Consumer(object):
         if hasattr(signal, 'SIGHUP'):
             original_sighup_handler = signal.signal(signal.SIGHUP, signal.SIG_IGN)
 
-        self.scheduler.start()
+        for _, scheduler_process in self.schedulers:
+            scheduler_process.start()
         for _, worker_process in self.worker_threads:
             worker_process.start()
 
@@ -656,7 +1468,7 @@ class Consumer(object):
         if graceful:
             self._logger.info('Shutting down gracefully...')
             try:
-                for _, worker_process in self.worker_threads:
+                for _, worker_process in self.worker_threads + self._retiring:
                     worker_process.join()
             except KeyboardInterrupt:
                 self._logger.info('Received request to shut down now.')
@@ -671,7 +1483,7 @@ class Consumer(object):
         """
         self.start()
         timeout = self._stop_flag_timeout
-        health_check_ts = time.time()
+        health_check_ts = heartbeat_ts = time.time()
 
         while True:
             try:
@@ -689,8 +1501,12 @@ class Consumer(object):
             if self.stop_flag.is_set():
                 break
 
+            now = time.time()
+            if now >= heartbeat_ts + self._health_check_interval:
+                heartbeat_ts = now
+                self.heartbeat()
+
             if self._health_check:
-                now = time.time()
                 if now >= health_check_ts + self._health_check_interval:
                     health_check_ts = now
                     self.check_worker_health()
@@ -702,17 +1518,43 @@ class Consumer(object):
         else:
             self._logger.info('Consumer exiting.')
 
+    def heartbeat(self):
+        """
+        Let the storage know this consumer is alive, and recover any tasks
+        that were being processed by consumers which have died.
+        """
+        for huey, _ in self.queues:
+            try:
+                recovered = huey.heartbeat()
+            except Exception:
+                self._logger.exception('Error sending consumer heartbeat.')
+            else:
+                if recovered:
+                    self._logger.warning('Re-enqueued %s unacknowledged '
+                                         'task(s) from dead consumer(s).',
+                                         recovered)
+
     def check_worker_health(self):
         """
         Check the health of the worker processes. Workers that have died will
         be replaced with new workers.
         """
         self._logger.debug('Checking worker health.')
+        self.check_timeouts()
         workers = []
         restart_occurred = False
         for i, (worker, worker_t) in enumerate(self.worker_threads):
             if not self.environment.is_alive(worker_t):
-                self._logger.warning('Worker %d died, restarting.', i + 1)
+                if worker.recycle_flag.is_set():
+                    self._recycled += 1
+                    self._logger.info('Worker %d was recycled, replacing.',
+                                      i + 1)
+                    self.huey.emit_status(
+                        EVENT_WORKER_RECYCLED,
+                        worker=i + 1,
+                        recycled=self._recycled)
+                else:
+                    self._logger.warning('Worker %d died, restarting.', i + 1)
                 worker = self._create_worker()
                 worker_t = self._create_process(worker, 'Worker-%d' % (i + 1))
                 worker_t.start()
@@ -724,16 +1566,120 @@ class Consumer(object):
         else:
             self._logger.debug('Workers are up and running.')
 
-        if not self.environment.is_alive(self.scheduler):
-            self._logger.warning('Scheduler died, restarting.')
-            scheduler = self._create_scheduler()
-            self.scheduler = self._create_process(scheduler, 'Scheduler')
-            self.scheduler.start()
-        else:
-            self._logger.debug('Scheduler is up and running.')
+        for i, (huey, scheduler_t) in enumerate(self.schedulers):
+            name = self._scheduler_name(huey)
+            if not self.environment.is_alive(scheduler_t):
+                self._logger.warning('%s died, restarting.', name)
+                scheduler = self._create_scheduler(huey)
+                scheduler_t = self._create_process(scheduler, name)
+                scheduler_t.start()
+                self.schedulers[i] = (huey, scheduler_t)
+            else:
+                self._logger.debug('%s is up and running.', name)
+
+        if self._autoscale:
+            self.autoscale()
 
         return not restart_occurred
 
+    def autoscale(self):
+        """
+        Add or retire workers based on the number of pending tasks, and how
+        long the tasks started since the last check waited in the queue.
+
+        Workers are added once the consumer has been busy for
+        `scale_up_checks` consecutive checks, and retired one at a time once
+        the queue has been empty for `scale_down_checks` consecutive checks.
+        """
+        self._retiring = [(worker, worker_t)
+                          for worker, worker_t in self._retiring
+                          if self.environment.is_alive(worker_t)]
+
+        waits = []
+        while True:
+            try:
+                waits.append(self._wait_times.get_nowait())
+            except QueueEmpty:
+                break
+        wait = sum(waits) / len(waits) if waits else 0.
+
+        try:
+            pending = sum(huey.pending_count() for huey, _ in self.queues)
+        except Exception:
+            self._logger.exception('Error reading queue size.')
+            return
+
+        nworkers = len(self.worker_threads)
+        if pending > nworkers * self.prefetch or wait > self.scale_latency:
+            self._busy_checks += 1
+            self._idle_checks = 0
+        elif not pending and wait <= self.scale_latency / 2.:
+            self._busy_checks = 0
+            self._idle_checks += 1
+        else:
+            self._busy_checks = self._idle_checks = 0
+
+        if self._busy_checks >= self.scale_up_checks and \
+                nworkers < self.max_workers:
+            # Grow by half the current size, to catch up with bursts quickly.
+            target = min(nworkers + max(nworkers // 2, 1), self.max_workers)
+        elif self._idle_checks >= self.scale_down_checks and \
+                nworkers > self.min_workers:
+            target = nworkers - 1
+        else:
+            return
+
+        self._busy_checks = self._idle_checks = 0
+        self._logger.info('Scaling from %s to %s workers (%s pending, average '
+                          'wait %0.3fs).', nworkers, target, pending, wait)
+        self.huey.emit_status(
+            EVENT_WORKERS_SCALED,
+            workers=target,
+            previous=nworkers,
+            pending=pending,
+            wait=wait)
+
+        for i in range(nworkers, target):
+            worker = self._create_worker()
+            worker_t = self._create_process(worker, 'Worker-%d' % (i + 1))
+            worker_t.start()
+            self.worker_threads.append((worker, worker_t))
+        while len(self.worker_threads) > target:
+            # Retired workers finish their current task before exiting.
+            worker, worker_t = self.worker_threads.pop()
+            worker.retire_flag.set()
+            self._retiring.append((worker, worker_t))
+
+    def check_timeouts(self):
+        """
+        Interrupt any task that is running past its deadline. Thread and
+        greenlet workers have a :py:class:`TaskTimeoutException` raised in
+        the task, process workers are terminated and replaced.
+        """
+        now = time.time()
+        for i, (worker, worker_t) in enumerate(self.worker_threads):
+            with worker._deadline_lock:
+                deadline = worker.get_deadline()
+                if deadline is None or deadline[0] > now:
+                    continue
+                worker.deadline = None
+                self._logger.warning('Worker %d is running %s past its '
+                                     'timeout, interrupting.', i + 1,
+                                     deadline[1])
+                terminated = self.environment.interrupt(worker_t,
+                                                        TaskTimeoutException)
+                if not terminated:
+                    worker.cancel_interrupt = functools.partial(
+                        self.environment.cancel_interrupt, worker_t,
+                        TaskTimeoutException)
+
+            if terminated:
+                worker.handle_timeout(deadline[1])
+                worker = self._create_worker()
+                worker_t = self._create_process(worker, 'Worker-%d' % (i + 1))
+                worker_t.start()
+                self.worker_threads[i] = (worker, worker_t)
+
     def _set_signal_handlers(self):
         signal.signal(signal.SIGTERM, self._handle_stop_signal)
         signal.signal(signal.SIGINT, signal.default_int_handler)
@@ -21,6 +21,15 @@ config_defaults = (
     ('logfile', None),
     ('verbose', None),
     ('flush_locks', False),
+    ('prefetch', 1),
+    ('precise', False),
+    ('dedupe_periodic', False),
+    ('max_tasks_per_worker', None),
+    ('max_worker_memory', None),
+    ('task_timeout', None),
+    ('min_workers', None),
+    ('max_workers', None),
+    ('scale_latency', 1.0),
 )
 config_keys = [param for param, _ in config_defaults]
 
@@ -38,15 +47,16 @@ def option(name, **options):
 class OptionParserHandler(object):
     def get_worker_options(self):
         return (
-            # -w, -k, -d, -m, -b, -c, -C, -f
+            # -w, -k, -d, -m, -b, -c, -C, -f, -p, -t, -M, -T, -N, -W, -L
             option('workers', type='int',
                    help='number of worker threads/processes (default=1)'),
             option(('k', 'worker-type'), choices=WORKER_TYPES,
                    dest='worker_type',
                    help=('worker execution model (thread, greenlet, '
-                         'process). Use process for CPU-intensive workloads, '
-                         'and greenlet for IO-heavy workloads. When in doubt, '
-                         'thread is the safest choice.')),
+                         'process, asyncio). Use process for CPU-intensive '
+                         'workloads, and greenlet or asyncio for IO-heavy '
+                         'workloads. When in doubt, thread is the safest '
+                         'choice.')),
             option('delay', dest='initial_delay',
                    help='minimum time to wait when polling queue (default=.1)',
                    metavar='SECONDS', type='float'),
@@ -67,15 +77,48 @@ class OptionParserHandler(object):
                          'restarting any worker that crashes unexpectedly.')),
             option('flush_locks', action='store_true', dest='flush_locks',
                    help=('flush all locks when starting consumer.')),
+            option('prefetch', type='int',
+                   help=('number of tasks each worker reads from the queue '
+                         'at a time (default=1)')),
+            option(('t', 'max-tasks-per-worker'), type='int',
+                   dest='max_tasks_per_worker', metavar='N',
+                   help=('replace each worker after it has run this many '
+                         'tasks')),
+            option(('M', 'max-worker-memory'), type='int',
+                   dest='max_worker_memory', metavar='MB',
+                   help=('replace a worker process once its resident memory '
+                         'exceeds this many megabytes (process workers '
+                         'only)')),
+            option(('T', 'task-timeout'), type='float', dest='task_timeout',
+                   metavar='SECONDS',
+                   help=('interrupt tasks that run longer than this many '
+                         'seconds, unless the task specifies a timeout')),
+            option(('N', 'min-workers'), type='int', dest='min_workers',
+                   help=('minimum number of workers when autoscaling '
+                         '(default=workers)')),
+            option(('W', 'max-workers'), type='int', dest='max_workers',
+                   help=('maximum number of workers when autoscaling '
+                         '(default=workers)')),
+            option(('L', 'scale-latency'), type='float',
+                   dest='scale_latency', metavar='SECONDS',
+                   help=('add workers when tasks wait longer than this in '
+                         'the queue, when autoscaling (default=1.0)')),
         )
 
     def get_scheduler_options(self):
         return (
-            # -s, -n, -u, -o
+            # -s, -n, -P, -D, -u, -o
             option('scheduler_interval', type='int',
                    help='Granularity of scheduler in seconds.'),
             option('no_periodic', action='store_false',
                    dest='periodic', help='do NOT enqueue periodic tasks'),
+            option(('P', 'precise'), action='store_true', dest='precise',
+                   help=('run periodic tasks defined with crontab() at their '
+                         'exact time, rather than checking once per minute')),
+            option(('D', 'dedupe-periodic'), action='store_true',
+                   dest='dedupe_periodic',
+                   help=('ensure each run of a periodic task is enqueued by '
+                         'only one consumer, when running several consumers')),
             option('utc', action='store_true',
                    help='use UTC time for all tasks (default=True)'),
             option(('o', 'localtime'), action='store_false', dest='utc',
@@ -94,7 +137,7 @@ class OptionParserHandler(object):
 
     def get_option_parser(self):
         parser = optparse.OptionParser('Usage: %prog [options] '
-                                       'path.to.huey_instance')
+                                       'path.to.huey_instance[:weight] ...')
 
         def add_group(name, description, options):
             group = parser.add_option_group(name, description)
@@ -130,6 +173,29 @@ class ConsumerConfig(namedtuple('_ConsumerConfig', config_keys)):
     def validate(self):
         if self.backoff < 1:
             raise ValueError('The backoff must be greater than 1.')
+        if self.prefetch < 1:
+            raise ValueError('The prefetch count must be at least 1.')
+        if self.max_tasks_per_worker is not None and \
+                self.max_tasks_per_worker < 1:
+            raise ValueError('The maximum tasks per worker must be at '
+                             'least 1.')
+        if self.max_worker_memory is not None and self.max_worker_memory < 1:
+            raise ValueError('The maximum worker memory must be at least '
+                             '1MB.')
+        if self.task_timeout is not None and self.task_timeout <= 0:
+            raise ValueError('The task timeout must be greater than 0.')
+        min_workers = self.workers if self.min_workers is None \
+                else self.min_workers
+        max_workers = self.workers if self.max_workers is None \
+                else self.max_workers
+        if min_workers < 1:
+            raise ValueError('The minimum number of workers must be at '
+                             'least 1.')
+        if min_workers > max_workers:
+            raise ValueError('The minimum number of workers must not exceed '
+                             'the maximum number of workers.')
+        if self.scale_latency <= 0:
+            raise ValueError('The scale latency must be greater than 0.')
         if not (0 < self.scheduler_interval <= 60):
             raise ValueError('The scheduler must run at least once per '
                              'minute, and at most once per second (1-60).')
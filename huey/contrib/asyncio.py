@@ -0,0 +1,902 @@
+"""
+asyncio support for huey.
+
+:py:class:`AsyncHuey` allows tasks to be enqueued, and their results read,
+from asyncio applications without blocking the event loop.
+
+The :py:class:`AsyncWorker` runs tasks on an event loop. Tasks defined with
+``async def`` are run concurrently on the loop, while regular tasks are run
+in a thread-pool. The queue, result store and event channel are accessed
+through an asynchronous storage, so the loop is never blocked waiting on the
+storage backend.
+
+This module requires Python 3.5 or newer. The native Redis implementation
+requires redis-py 4.2 or newer, which provides ``redis.asyncio``.
+"""
+import asyncio
+import datetime
+import logging
+import pickle
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+try:
+    from redis import asyncio as aioredis
+    from redis.connection import SSLConnection
+    from redis.connection import UnixDomainSocketConnection
+except ImportError:
+    aioredis = None
+
+from huey.api import BatchQueueTask
+from huey.api import ResultGroup
+from huey.consumer import EVENT_ERROR_DEQUEUEING
+from huey.consumer import EVENT_ERROR_ENQUEUEING
+from huey.consumer import EVENT_ERROR_INTERNAL
+from huey.consumer import EVENT_ERROR_SCHEDULING
+from huey.consumer import EVENT_SCHEDULED
+from huey.consumer import Worker
+from huey.constants import EmptyData
+from huey.exceptions import CancelExecution
+from huey.exceptions import DataStoreGetException
+from huey.exceptions import DataStorePutException
+from huey.exceptions import DataStoreTimeout
+from huey.exceptions import QueueWriteException
+from huey.exceptions import ScheduleAddException
+from huey.exceptions import TaskException
+from huey.exceptions import TaskTimeoutException
+from huey.storage import LEASE_ACQUIRE_LUA
+from huey.storage import QUEUE_POP_LUA
+from huey.storage import RESULT_PUT_LUA
+from huey.storage import RESULT_RENOTIFY_LUA
+from huey.storage import REVOKE_LUA
+from huey.storage import REVOKED_LUA
+from huey.storage import RedisStorage
+from huey.storage import TOKEN_BUCKET_LUA
+from huey.utils import Error
+from huey.utils import parse_rate_limit
+from huey.utils import wrap_exception
+
+
+class AsyncStorage(object):
+    """
+    Asynchronous interface to a huey storage. The methods mirror those of
+    :py:class:`BaseStorage`, but are coroutines.
+
+    This implementation runs the methods of the underlying storage in a
+    thread-pool, so it can be used with any storage. Subclasses provide native
+    implementations for specific backends.
+    """
+    def __init__(self, storage, executor=None):
+        self.storage = storage
+        self.executor = executor
+
+    def _run(self, fn, *args):
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self.executor, fn, *args)
+
+    async def enqueue(self, data, priority=None):
+        await self._run(self.storage.enqueue, data, priority)
+
+    async def enqueue_many(self, data_list, priority=None):
+        await self._run(self.storage.enqueue_many, data_list, priority)
+
+    async def dequeue_many(self, n):
+        return await self._run(self.storage.dequeue_many, n)
+
+    async def ack(self, data):
+        await self._run(self.storage.ack, data)
+
+    async def add_to_schedule(self, data, ts):
+        await self._run(self.storage.add_to_schedule, data, ts)
+
+    async def reschedule(self, data, ts):
+        await self._run(self.storage.reschedule, data, ts)
+
+    async def put_result(self, key, value, ack=None, ttl=None):
+        await self._run(self.storage.put_result, key, value, ack, ttl)
+
+    async def peek_data(self, key):
+        return await self._run(self.storage.peek_data, key)
+
+    async def pop_data(self, key):
+        return await self._run(self.storage.pop_data, key)
+
+    async def put_if_empty(self, key, value, ttl=None):
+        return await self._run(self.storage.put_if_empty, key, value, ttl)
+
+    async def wait_for_result(self, key, timeout):
+        await self._run(self.storage.wait_for_result, key, timeout)
+
+    async def add_revocation(self, key, value):
+        await self._run(self.storage.add_revocation, key, value)
+
+    async def get_revocations(self, keys):
+        return await self._run(self.storage.get_revocations, keys)
+
+    async def remove_revocation(self, key):
+        return await self._run(self.storage.remove_revocation, key)
+
+    async def acquire_lease(self, key, lease_id, limit, ttl):
+        return await self._run(self.storage.acquire_lease, key, lease_id,
+                               limit, ttl)
+
+    async def release_lease(self, key, lease_id):
+        return await self._run(self.storage.release_lease, key, lease_id)
+
+    async def acquire_token(self, key, rate, period):
+        return await self._run(self.storage.acquire_token, key, rate, period)
+
+    async def emit(self, message):
+        await self._run(self.storage.emit, message)
+
+    async def close(self):
+        pass
+
+
+def _async_connection_pool(pool):
+    # Create an asyncio connection pool with the same configuration as the
+    # given (synchronous) connection pool.
+    if issubclass(pool.connection_class, UnixDomainSocketConnection):
+        connection_class = aioredis.UnixDomainSocketConnection
+    elif issubclass(pool.connection_class, SSLConnection):
+        connection_class = aioredis.SSLConnection
+    else:
+        connection_class = aioredis.Connection
+    return aioredis.ConnectionPool(
+        connection_class=connection_class,
+        max_connections=pool.max_connections,
+        **pool.connection_kwargs)
+
+
+class AsyncRedisStorage(AsyncStorage):
+    """
+    Native asyncio implementation of :py:class:`RedisStorage`, using the
+    connection settings and keys of the given storage.
+
+    Connections are bound to the event loop they were created on, so each
+    event loop the storage is used from gets its own connection pool.
+    """
+    def __init__(self, storage, executor=None):
+        if aioredis is None:
+            raise ImportError('"redis.asyncio" not found, cannot use asyncio '
+                              'Redis storage. Run "pip install -U redis" to '
+                              'install a version with asyncio support.')
+        super(AsyncRedisStorage, self).__init__(storage, executor)
+        self._clients = weakref.WeakKeyDictionary()
+        # Scripts are run with the client of the current event loop.
+        conn = aioredis.Redis(connection_pool=_async_connection_pool(
+            storage.pool))
+        self._pop_many = conn.register_script(QUEUE_POP_LUA)
+        self._revoked = conn.register_script(REVOKED_LUA)
+        self._revoke = conn.register_script(REVOKE_LUA)
+        self._acquire_lease = conn.register_script(LEASE_ACQUIRE_LUA)
+        self._acquire_token = conn.register_script(TOKEN_BUCKET_LUA)
+        self._renotify = conn.register_script(RESULT_RENOTIFY_LUA)
+        self._put_result = conn.register_script(RESULT_PUT_LUA)
+
+    @property
+    def conn(self):
+        loop = asyncio.get_event_loop()
+        conn = self._clients.get(loop)
+        if conn is None:
+            conn = self._clients[loop] = aioredis.Redis(
+                connection_pool=_async_connection_pool(self.storage.pool))
+        return conn
+
+    async def _queue_keys(self):
+        levels = await self.conn.zrevrange(self.storage.priority_key, 0, -1,
+                                           withscores=True)
+        return self.storage._queue_keys_for_levels(levels)
+
+    async def enqueue(self, data, priority=None):
+        if not priority:
+            await self.conn.lpush(self.storage.queue_key, data)
+        else:
+            pipe = self.conn.pipeline()
+            self.storage._pipe_enqueue(pipe, data, priority)
+            await pipe.execute()
+
+    async def enqueue_many(self, data_list, priority=None):
+        if not data_list:
+            return
+        pipe = self.conn.pipeline(transaction=False)
+        self.storage._pipe_enqueue_many(pipe, data_list, priority)
+        await pipe.execute()
+
+    async def dequeue_many(self, n):
+        storage = self.storage
+        keys = await self._queue_keys()
+        pop_keys, nqueues = storage._pop_many_keys(keys)
+        accum = await self._pop_many(keys=pop_keys, args=[n, nqueues],
+                                     client=self.conn)
+        if not accum and storage.blocking:
+            data = await self._dequeue_blocking(keys)
+            if data is not None:
+                accum.append(data)
+        return accum
+
+    async def _dequeue_blocking(self, keys):
+        storage = self.storage
+        try:
+            if storage.reliable:
+                return await self.conn.brpoplpush(
+                    storage.queue_key,
+                    storage.processing_key,
+                    timeout=storage.read_timeout)
+            res = await self.conn.brpop(keys, timeout=storage.read_timeout)
+            return res[1]
+        except (aioredis.ConnectionError, TypeError, IndexError):
+            return None
+
+    async def ack(self, data):
+        if self.storage.reliable:
+            await self.conn.lrem(self.storage.processing_key, 1, data)
+
+    async def add_to_schedule(self, data, ts):
+        pipe = self.conn.pipeline()
+        self.storage._pipe_add_to_schedule(pipe, data, ts)
+        await pipe.execute()
+
+    reschedule = add_to_schedule
+
+    async def put_result(self, key, value, ack=None, ttl=None):
+        storage = self.storage
+        pipe = self.conn.pipeline()
+        await self._put_result(client=pipe,
+                               **storage.put_result_params(key, value, ttl))
+        if ack is not None and storage.reliable:
+            pipe.lrem(storage.processing_key, 1, ack)
+        await pipe.execute()
+
+    async def peek_data(self, key):
+        pipe = self.conn.pipeline()
+        self.storage._pipe_get_data(pipe, key, peek=True)
+        return self.storage._data_from_pipe(await pipe.execute())
+
+    async def pop_data(self, key):
+        pipe = self.conn.pipeline()
+        self.storage._pipe_get_data(pipe, key, peek=False)
+        return self.storage._data_from_pipe(await pipe.execute())
+
+    async def put_if_empty(self, key, value, ttl=None):
+        storage = self.storage
+        if ttl:
+            if not await self.conn.set(storage.result_ttl_key(key), value,
+                                       px=int(ttl * 1000), nx=True):
+                return False
+            await self.conn.zadd(storage.result_ttl_index_key,
+                                 {key: storage._result_ttl_expiry(ttl)})
+            return True
+        return bool(await self.conn.hsetnx(storage.result_key, key, value))
+
+    async def wait_for_result(self, key, timeout):
+        storage = self.storage
+        pipe = self.conn.pipeline()
+        storage._pipe_add_waiters(pipe, [key], timeout)
+        if storage._results_ready(await pipe.execute()):
+            return
+
+        try:
+            res = await self.conn.blpop(
+                storage.result_notify_key(key),
+                timeout=storage.blocking_timeout(timeout))
+        except aioredis.ResponseError:
+            if not storage.fractional_timeouts:
+                raise
+            storage.fractional_timeouts = False
+            return await self.wait_for_result(key, timeout)
+        except aioredis.ConnectionError:
+            return
+        if res is not None:
+            await self._renotify(client=self.conn,
+                                 **storage.renotify_params(key))
+
+    async def add_revocation(self, key, value):
+        await self._revoke(keys=self.storage.revocation_keys(),
+                           args=[key, value], client=self.conn)
+
+    async def get_revocations(self, keys):
+        res = await self._revoked(keys=self.storage.revocation_keys(),
+                                  args=keys, client=self.conn)
+        return self.storage._revocations_from_script(keys, res)
+
+    async def remove_revocation(self, key):
+        pipe = self.conn.pipeline()
+        pipe.hdel(self.storage.revoke_key, key)
+        pipe.hdel(self.storage.result_key, key)
+        return any(await pipe.execute())
+
+    async def acquire_lease(self, key, lease_id, limit, ttl):
+        return bool(await self._acquire_lease(
+            keys=[self.storage.lease_prefix + key],
+            args=[lease_id, limit, ttl],
+            client=self.conn))
+
+    async def release_lease(self, key, lease_id):
+        return bool(await self.conn.zrem(self.storage.lease_prefix + key,
+                                         lease_id))
+
+    async def acquire_token(self, key, rate, period):
+        return float(await self._acquire_token(
+            keys=[self.storage.bucket_prefix + key],
+            args=[rate, period],
+            client=self.conn))
+
+    async def emit(self, message):
+        await self.conn.publish(self.storage.name, message)
+
+    async def close(self):
+        conn = self._clients.pop(asyncio.get_event_loop(), None)
+        if conn is not None:
+            await conn.connection_pool.disconnect()
+
+
+def get_async_storage(storage, executor=None):
+    """
+    Return an asynchronous interface to the given storage, using a native
+    implementation when one is available.
+    """
+    if isinstance(storage, RedisStorage) and aioredis is not None:
+        return AsyncRedisStorage(storage, executor)
+    return AsyncStorage(storage, executor)
+
+
+class AsyncWorker(Worker):
+    """
+    Worker that runs up to ``concurrency`` tasks at a time on an event loop.
+
+    Coroutine tasks run on the loop itself, while regular tasks run in a
+    thread-pool of the same size. When the worker shuts down, the tasks that
+    are still running are allowed to finish.
+
+    Task timeouts are enforced by the worker itself, by cancelling the task.
+    """
+    def __init__(self, huey, default_delay, max_delay, backoff, utc,
+                 prefetch=1, max_tasks=None, max_memory=None,
+                 recycle_flag=None, timeout=None, deadline_pipe=None,
+                 retire_flag=None, wait_times=None, concurrency=1):
+        super(AsyncWorker, self).__init__(huey, default_delay, max_delay,
+                                          backoff, utc, prefetch, max_tasks,
+                                          max_memory, recycle_flag, timeout,
+                                          deadline_pipe, retire_flag,
+                                          wait_times)
+        self.concurrency = concurrency
+        self._logger = logging.getLogger('huey.consumer.AsyncWorker')
+
+    def initialize(self):
+        super(AsyncWorker, self).initialize()
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._loop.set_default_executor(self._executor)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._running = set()
+        self.storage = get_async_storage(self.huey.storage)
+        self._events = asyncio.Queue()
+        self._publisher = self._loop.create_task(self.publish_events())
+
+    def loop(self, now=None):
+        self._loop.run_until_complete(self.aloop(now))
+
+    async def aloop(self, now=None):
+        # Wait for a free slot before reading from the queue, so that tasks
+        # are not read until they can be run.
+        await self._slots.acquire()
+        if self.finished:
+            self._slots.release()
+            return
+
+        task = None
+        exc_raised = True
+        try:
+            task = await self.adequeue()
+        except KeyboardInterrupt:
+            raise
+        except:
+            self.emit_status(EVENT_ERROR_DEQUEUEING, error=True)
+            self._logger.exception('Error reading from queue')
+        else:
+            exc_raised = False
+
+        if task:
+            self.delay = self.default_delay
+            future = asyncio.ensure_future(
+                self.handle_task(task, now or self.get_now()))
+            self._running.add(future)
+            future.add_done_callback(self._task_done)
+        else:
+            self._slots.release()
+            if exc_raised or not self.huey.blocking:
+                await self.asleep()
+
+    def _task_done(self, future):
+        self._running.discard(future)
+        self.tasks_processed += 1
+        if not self.finished:
+            self.check_recycle()
+        self._slots.release()
+
+    async def adequeue(self):
+        if not self._prefetched:
+            messages = await self.storage.dequeue_many(self.prefetch)
+            self._prefetched.extend(self.huey._load_task(message)
+                                    for message in messages)
+        if self._prefetched:
+            return self._prefetched.popleft()
+
+    async def asleep(self):
+        if self.delay > self.max_delay:
+            self.delay = self.max_delay
+
+        self._logger.debug('No messages, sleeping for: %s', self.delay)
+        await asyncio.sleep(self.delay)
+        self.delay *= self.backoff
+
+    def shutdown(self):
+        """
+        Wait for running tasks to finish, then return any prefetched tasks to
+        the queue.
+        """
+        if self._running:
+            self._logger.info('Waiting for %s running task(s) to finish.',
+                              len(self._running))
+            self._loop.run_until_complete(asyncio.wait(self._running))
+        super(AsyncWorker, self).shutdown()
+        self._loop.run_until_complete(self._events.join())
+        self._publisher.cancel()
+        self._loop.run_until_complete(
+            asyncio.gather(self._publisher, return_exceptions=True))
+        self._loop.run_until_complete(self.storage.close())
+        self._executor.shutdown()
+        self._loop.close()
+
+    def emit_status(self, status, error=False, **data):
+        # Events are published in order by a separate coroutine, so that the
+        # helpers shared with the Worker can emit them without blocking.
+        message = self.huey._get_status_message(status, error, **data)
+        if message is not None:
+            self._events.put_nowait(message)
+
+    def emit_task(self, status, task, error=False, **data):
+        if self.huey.events:
+            metadata = self.huey._get_task_metadata(task)
+            metadata.update(data)
+            self.emit_status(status, error=error, **metadata)
+
+    async def publish_events(self):
+        while True:
+            message = await self._events.get()
+            try:
+                await self.storage.emit(message)
+            except:
+                pass
+            finally:
+                self._events.task_done()
+
+    async def handle_task(self, task, ts):
+        if not self.huey.ready_to_run(task, ts):
+            await self.add_schedule(task)
+        elif not await self.is_revoked(task, ts):
+            if task.concurrency and not await self.acquire_slot(task):
+                await self.defer_task(task, ts, task.concurrency_delay)
+            else:
+                try:
+                    if task.rate_limit:
+                        wait = await self.acquire_token(task)
+                    else:
+                        wait = 0
+                    if wait:
+                        await self.defer_task(task, ts, wait)
+                    else:
+                        return await self.process_task(task, ts)
+                finally:
+                    if task.concurrency:
+                        await self.release_slot(task)
+        else:
+            self.task_revoked(task, ts)
+            if task.unique:
+                await self.clear_unique(task)
+            if task.chord:
+                await self.finish_chord_task(task)
+        await self.ack(task)
+
+    async def process_task(self, task, ts):
+        self.task_started(task, ts)
+        if task.unique:
+            await self.clear_unique(task)
+        if self._pre_execute:
+            try:
+                self.run_pre_execute_hooks(task)
+            except CancelExecution:
+                if task.chord:
+                    await self.finish_chord_task(task)
+                await self.ack(task)
+                return
+
+        self._logger.info('Executing %s', task)
+        start = time.time()
+        exception = None
+        task_value = None
+
+        try:
+            try:
+                task_value = await self.execute(task)
+            finally:
+                duration = time.time() - start
+        except Exception as exc:
+            exception = self.task_failed(task, exc, duration)
+        else:
+            self.task_finished(task, duration)
+
+        if self._post_execute:
+            self.run_post_execute_hooks(task, task_value, exception)
+
+        await self.ack(task)
+        if exception is not None and task.retries:
+            await self.requeue_task(task, self.get_now())
+
+    async def execute(self, task):
+        """
+        Asynchronous equivalent of :py:meth:`Huey.execute`.
+
+        Tasks are cancelled once they exceed their timeout. Synchronous tasks
+        cannot be interrupted, so they continue running in the thread-pool
+        but their result is discarded.
+
+        The calls to batch tasks are read, and their results stored, in the
+        thread-pool, as is the bookkeeping for failed tasks and for tasks
+        that are part of a chord.
+        """
+        huey = self.huey
+        is_batch = isinstance(task, BatchQueueTask)
+        if is_batch and task.data is None:
+            if not await self._loop.run_in_executor(None, huey._load_batch,
+                                                    task):
+                return
+
+        try:
+            if task.is_async:
+                fut = task.execute()
+            else:
+                fut = self._loop.run_in_executor(None, task.execute)
+            try:
+                result = await asyncio.wait_for(fut, self.get_timeout(task))
+            except asyncio.TimeoutError:
+                raise TaskTimeoutException()
+            if is_batch:
+                items = huey._get_batch_results(task, result)
+        except Exception as exc:
+            if huey.store_errors:
+                metadata = huey._get_error_metadata(task, exc)
+                await self._loop.run_in_executor(
+                    None, huey._put_task_error, task, metadata)
+            if task.chord and not task.retries:
+                await self._loop.run_in_executor(
+                    None, huey._finish_chord_task, task)
+            raise
+
+        if is_batch:
+            if huey.result_store:
+                await self._loop.run_in_executor(
+                    None, huey._put_batch_results, task, items)
+        elif huey._should_store_result(task, result):
+            await self.put_result(task, result)
+
+        if task.chord:
+            await self._loop.run_in_executor(
+                None, huey._finish_chord_task, task)
+
+        if task.on_complete:
+            next_task = task.on_complete
+            next_task.extend_data(result)
+            await self.enqueue(next_task)
+
+        return result
+
+    async def put_result(self, task, value):
+        ttl = task.result_ttl
+        if ttl is None:
+            ttl = self.huey.result_ttl
+        try:
+            await self.storage.put_result(
+                task.task_id,
+                self.huey.serializer.serialize(value),
+                task.message,
+                ttl)
+        except Exception:
+            wrap_exception(DataStorePutException)
+        task.message = None
+
+    async def requeue_task(self, task, ts):
+        if self.prepare_retry(task, ts):
+            await self.add_schedule(task)
+        else:
+            await self.enqueue(task)
+
+    async def enqueue(self, task):
+        try:
+            await self.storage.enqueue(
+                self.huey.serialize_task(task),
+                task.priority)
+        except Exception:
+            self.emit_task(EVENT_ERROR_ENQUEUEING, task, error=True)
+            self._logger.exception('Error enqueueing task: %s', task)
+        else:
+            self._logger.debug('Enqueued task: %s', task)
+
+    async def add_schedule(self, task):
+        self._logger.info('Adding %s to schedule', task)
+        msg = self.huey.serialize_task(task)
+        ex_time = task.execute_time or datetime.datetime.fromtimestamp(0)
+        try:
+            await self.storage.add_to_schedule(msg, ex_time)
+        except Exception:
+            self.emit_task(EVENT_ERROR_SCHEDULING, task, error=True)
+            self._logger.error('Error adding task to schedule: %s', task)
+        else:
+            self.emit_task(EVENT_SCHEDULED, task)
+
+    async def acquire_slot(self, task):
+        try:
+            return await self.storage.acquire_lease(
+                self.huey._concurrency_key(task),
+                task.task_id,
+                task.concurrency,
+                self.huey._get_slot_ttl(task))
+        except Exception:
+            self.emit_task(EVENT_ERROR_INTERNAL, task, error=True)
+            self._logger.exception('Error acquiring concurrency slot for %s',
+                                   task)
+            return False
+
+    async def release_slot(self, task):
+        try:
+            await self.storage.release_lease(self.huey._concurrency_key(task),
+                                             task.task_id)
+        except Exception:
+            self.emit_task(EVENT_ERROR_INTERNAL, task, error=True)
+            self._logger.exception('Error releasing concurrency slot for %s',
+                                   task)
+
+    async def acquire_token(self, task):
+        rate, period = parse_rate_limit(task.rate_limit)
+        try:
+            return await self.storage.acquire_token(
+                self.huey._rate_limit_key(task), rate, period)
+        except Exception:
+            self.emit_task(EVENT_ERROR_INTERNAL, task, error=True)
+            self._logger.exception('Error checking rate limit for %s', task)
+            return 0
+
+    async def clear_unique(self, task):
+        try:
+            await self.storage.pop_data(self.huey._unique_key(task))
+        except Exception:
+            self.emit_task(EVENT_ERROR_INTERNAL, task, error=True)
+            self._logger.exception('Error clearing unique key for %s', task)
+
+    async def finish_chord_task(self, task):
+        try:
+            await self._loop.run_in_executor(
+                None, self.huey._finish_chord_task, task)
+        except Exception:
+            self.emit_task(EVENT_ERROR_INTERNAL, task, error=True)
+            self._logger.exception('Error finishing chord task %s', task)
+
+    async def defer_task(self, task, ts, delay):
+        self.prepare_defer(task, ts, delay)
+        await self.add_schedule(task)
+
+    async def ack(self, task):
+        if task.message is None:
+            return
+        try:
+            await self.storage.ack(task.message)
+        except Exception:
+            self.emit_task(EVENT_ERROR_INTERNAL, task, error=True)
+            self._logger.exception('Error acknowledging task: %s', task)
+        task.message = None
+
+    async def is_revoked(self, task, ts):
+        # The task and its class are checked in a single storage operation.
+        class_key = 'rt:%s' % type(task).__name__
+        try:
+            task_data, class_data = await self.storage.get_revocations([
+                task.revoke_id,
+                class_key])
+            for key, data in ((task.revoke_id, task_data),
+                              (class_key, class_data)):
+                is_revoked, can_restore = self.huey._check_revoked(data, ts,
+                                                                   False)
+                if can_restore:
+                    await self.storage.remove_revocation(key)
+                if is_revoked:
+                    return True
+            return False
+        except Exception:
+            self.emit_task(EVENT_ERROR_INTERNAL, task, error=True)
+            self._logger.error('Error checking if task is revoked: %s', task)
+            return True
+
+
+def _wrapped_operation(exc_class):
+    # Coroutine equivalent of Huey._wrapped_operation().
+    def decorator(fn):
+        @wraps(fn)
+        async def inner(*args, **kwargs):
+            try:
+                return await fn(*args, **kwargs)
+            except (KeyboardInterrupt, RuntimeError):
+                raise
+            except:
+                wrap_exception(exc_class)
+        return inner
+    return decorator
+
+
+class AsyncHuey(object):
+    """
+    Asynchronous facade for a :py:class:`Huey` instance. The storage is
+    accessed through an :py:class:`AsyncStorage`, so enqueueing tasks and
+    reading results does not block the event loop.
+
+    The facade for a Huey instance is available as :py:attr:`Huey.aio`, and
+    is also used by :py:meth:`TaskWrapper.aenqueue` and
+    :py:meth:`TaskResultWrapper.aget`. It can be used from any number of
+    event loops, such as successive calls to ``asyncio.run()``. Calling
+    :py:meth:`close` closes the connections of the current event loop.
+    """
+    def __init__(self, huey, executor=None):
+        self.huey = huey
+        self.storage = get_async_storage(huey.storage, executor)
+
+    @_wrapped_operation(QueueWriteException)
+    async def _enqueue(self, msg, priority=None):
+        await self.storage.enqueue(msg, priority)
+
+    @_wrapped_operation(QueueWriteException)
+    async def _enqueue_many(self, msgs, priority=None):
+        await self.storage.enqueue_many(msgs, priority)
+
+    @_wrapped_operation(DataStoreGetException)
+    async def _get_data(self, key, peek=False):
+        if peek:
+            return await self.storage.peek_data(key)
+        else:
+            return await self.storage.pop_data(key)
+
+    @_wrapped_operation(DataStoreGetException)
+    async def _wait_for_result(self, key, timeout):
+        await self.storage.wait_for_result(key, timeout)
+
+    @_wrapped_operation(DataStorePutException)
+    async def _put_if_empty(self, key, value, ttl=None):
+        return await self.storage.put_if_empty(key, value, ttl)
+
+    @_wrapped_operation(DataStorePutException)
+    async def _add_revocation(self, key, value):
+        await self.storage.add_revocation(key, value)
+
+    @_wrapped_operation(ScheduleAddException)
+    async def _reschedule(self, data, ts):
+        await self.storage.reschedule(data, ts)
+
+    async def _get_pending_duplicate(self, task):
+        # Coroutine equivalent of Huey._get_pending_duplicate().
+        key = self.huey._unique_key(task)
+        ttl = task.unique_ttl or self.huey.unique_ttl
+        while not await self._put_if_empty(key, task.task_id, ttl):
+            task_id = await self._get_data(key, peek=True)
+            if task_id is EmptyData:
+                continue
+            if isinstance(task_id, bytes):
+                task_id = task_id.decode('utf-8')
+            if task_id != task.task_id:
+                return type(task)(task.data, task_id=task_id)
+            break
+
+    async def enqueue(self, task):
+        if self.huey.always_eager:
+            return self.huey._execute_always_eager(task)
+
+        if task.unique:
+            pending = await self._get_pending_duplicate(task)
+            if pending is not None:
+                return self.huey._get_result_wrapper(pending)
+
+        await self._enqueue(self.huey.serialize_task(task),
+                            task.priority)
+        return self.huey._get_result_wrapper(task)
+
+    async def debounce(self, task, delay=None):
+        if self.huey.always_eager:
+            return self.huey._execute_always_eager(task)
+
+        task = self.huey._get_debounced_task(task)
+        delay = task.debounce if delay is None else delay
+        execute_time = self.huey._normalize_execute_time(delay=delay)
+        msg = self.huey.serialize_task(task, timestamp=False)
+        await self._reschedule(msg, execute_time)
+        return self.huey._get_result_wrapper(task)
+
+    async def enqueue_many(self, tasks):
+        tasks = list(tasks)
+        if self.huey.always_eager:
+            return [self.huey._execute_always_eager(task) for task in tasks]
+
+        by_priority = OrderedDict()
+        for i, task in enumerate(tasks):
+            if task.unique:
+                pending = await self._get_pending_duplicate(task)
+                if pending is not None:
+                    tasks[i] = pending
+                    continue
+            msg = self.huey.serialize_task(task)
+            by_priority.setdefault(task.priority, []).append(msg)
+        for priority, msgs in by_priority.items():
+            await self._enqueue_many(msgs, priority)
+
+        if self.huey.result_store:
+            return ResultGroup(self.huey, tasks)
+
+    async def get(self, key, peek=False):
+        data = await self._get_data(key, peek=peek)
+        if data is not EmptyData:
+            return self.huey.serializer.deserialize(data)
+
+    async def revoke(self, task, revoke_until=None, revoke_once=False):
+        await self._add_revocation(task.revoke_id,
+                                   pickle.dumps((revoke_until, revoke_once)))
+
+    async def _read_result(self, result, preserve):
+        # Results are cached on the TaskResultWrapper, as with get().
+        if result._result is EmptyData:
+            data = await self._get_data(result.task.task_id, peek=preserve)
+            if data is not EmptyData:
+                result._result = self.huey.serializer.deserialize(data)
+        return result._result
+
+    async def get_raw_result(self, result, blocking=True, timeout=None,
+                             backoff=1.15, max_delay=1.0,
+                             revoke_on_timeout=False, preserve=False):
+        if not blocking:
+            res = await self._read_result(result, preserve)
+            if res is not EmptyData:
+                return res
+            return
+
+        start = time.time()
+        delay = .1
+        while await self._read_result(result, preserve) is EmptyData:
+            if timeout:
+                remaining = timeout - (time.time() - start)
+                if remaining <= 0:
+                    if revoke_on_timeout:
+                        await self.revoke(result.task)
+                    raise DataStoreTimeout
+                delay = min(delay, remaining)
+            if delay > max_delay:
+                delay = max_delay
+            await self._wait_for_result(result.task.task_id, delay)
+            delay *= backoff
+        return result._result
+
+    async def get_result(self, result, blocking=True, timeout=None,
+                         backoff=1.15, max_delay=1.0, revoke_on_timeout=False,
+                         preserve=False):
+        """
+        Asynchronous equivalent of :py:meth:`TaskResultWrapper.get`, which
+        waits for the result by default.
+        """
+        value = await self.get_raw_result(result, blocking, timeout, backoff,
+                                          max_delay, revoke_on_timeout,
+                                          preserve)
+        if value is not None and isinstance(value, Error):
+            raise TaskException(value.metadata)
+        return value
+
+    async def close(self):
+        await self.storage.close()
@@ -11,7 +11,7 @@ class SimpleStorage(BaseStorage):
         super(SimpleStorage, self).__init__(name=name, **storage_kwargs)
         self.client = Client(host=host, port=port)
 
-    def enqueue(self, data):
+    def enqueue(self, data, priority=None):
         self.client.lpush(self.name, data)
 
     def dequeue(self):
@@ -53,7 +53,7 @@ class SimpleStorage(BaseStorage):
     def has_data_for_key(self, key):
         return self.client.exists(key)
 
-    def put_if_empty(self, key, value):
+    def put_if_empty(self, key, value, ttl=None):
         return self.client.setnx(key, value)
 
     def result_store_size(self, key, value):
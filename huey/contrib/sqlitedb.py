@@ -1,8 +1,11 @@
+import datetime
 import operator
-import pickle
 import threading
+import time
 
 from peewee import *
+from playhouse.migrate import SqliteMigrator
+from playhouse.migrate import migrate
 
 from huey.api import Huey
 from huey.constants import EmptyData
@@ -17,23 +20,82 @@ class BaseModel(Model):
 class Task(BaseModel):
     queue = CharField()
     data = BlobField()
+    priority = IntegerField(default=0, index=True)
+
+
+class FloatTimestampField(TimestampField):
+    """
+    Timestamp stored as a float, keeping sub-second precision. Timestamps
+    stored as whole seconds by older versions are read unchanged.
+    """
+    field_type = 'FLOAT'
+
+    def db_value(self, value):
+        if isinstance(value, datetime.datetime):
+            return (time.mktime(value.timetuple()) +
+                    value.microsecond / 1000000.)
+        return super(FloatTimestampField, self).db_value(value)
+
+    def python_value(self, value):
+        if isinstance(value, (int, float)):
+            return datetime.datetime.fromtimestamp(value)
+        return value
 
 
 class Schedule(BaseModel):
     queue = CharField()
     data = BlobField()
-    timestamp = TimestampField()
+    timestamp = FloatTimestampField()
 
 
 class KeyValue(BaseModel):
     queue = CharField()
     key = CharField()
     value = BlobField()
+    expires_at = FloatField(null=True, index=True)
+
+    class Meta:
+        primary_key = CompositeKey('queue', 'key')
+
+
+class Lease(BaseModel):
+    queue = CharField()
+    key = CharField()
+    lease_id = CharField()
+    expires_at = FloatField(index=True)
+
+    class Meta:
+        primary_key = CompositeKey('queue', 'key', 'lease_id')
+
+
+class TokenBucket(BaseModel):
+    queue = CharField()
+    key = CharField()
+    tokens = FloatField()
+    timestamp = FloatField()
 
     class Meta:
         primary_key = CompositeKey('queue', 'key')
 
 
+class Counter(BaseModel):
+    queue = CharField()
+    key = CharField()
+    value = IntegerField()
+
+    class Meta:
+        primary_key = CompositeKey('queue', 'key')
+
+
+class BatchItem(BaseModel):
+    queue = CharField()
+    key = CharField()
+    data = BlobField()
+
+    class Meta:
+        indexes = ((('queue', 'key'), False),)
+
+
 class SqliteStorage(BaseStorage):
     def __init__(self, name='huey', filename='huey.db', **storage_kwargs):
         self.filename = filename
@@ -45,7 +107,31 @@ class SqliteStorage(BaseStorage):
         Task._meta.database = self.database
         Schedule._meta.database = self.database
         KeyValue._meta.database = self.database
-        self.database.create_tables([Task, Schedule, KeyValue], safe=True)
+        Lease._meta.database = self.database
+        TokenBucket._meta.database = self.database
+        BatchItem._meta.database = self.database
+        Counter._meta.database = self.database
+        models = [Task, Schedule, KeyValue, Lease, TokenBucket, BatchItem,
+                  Counter]
+        with self.database.atomic('IMMEDIATE'):
+            self.add_missing_columns(models)
+            self.database.create_tables(models, safe=True)
+
+    def add_missing_columns(self, models):
+        # Tables created by an older version of huey may lack columns that
+        # have since been added to the models. Indexed columns are added along
+        # with their index.
+        migrator = SqliteMigrator(self.database)
+        for model in models:
+            table = model._meta.table_name
+            if not self.database.table_exists(table):
+                continue
+            columns = set(column.name for column in
+                          self.database.get_columns(table))
+            for field in model._meta.sorted_fields:
+                if field.column_name not in columns:
+                    migrate(migrator.add_column(table, field.column_name,
+                                                field))
 
     def tasks(self, *columns):
         return Task.select(*columns).where(Task.queue == self.name)
@@ -60,24 +146,62 @@ class SqliteStorage(BaseStorage):
                 .order_by(Schedule.timestamp))
 
     def kv(self, *columns):
-        return KeyValue.select(*columns).where(KeyValue.queue == self.name)
+        # Expired values are filtered out lazily, and removed periodically by
+        # the consumer (see sweep_results()).
+        return (KeyValue
+                .select(*columns)
+                .where((KeyValue.queue == self.name) &
+                       (KeyValue.expires_at.is_null() |
+                        (KeyValue.expires_at > time.time()))))
+
+    def enqueue(self, data, priority=None):
+        Task.create(queue=self.name, data=data, priority=priority or 0)
 
-    def enqueue(self, data):
-        Task.create(queue=self.name, data=data)
+    def enqueue_many(self, data_list, priority=None):
+        rows = [{'queue': self.name, 'data': data, 'priority': priority or 0}
+                for data in data_list]
+        with self.database.atomic():
+            for batch in chunked(rows, 100):
+                Task.insert_many(batch).execute()
 
     def dequeue(self):
         try:
             task = (self
                     .tasks()
-                    .order_by(Task.id)
+                    .order_by(Task.priority.desc(), Task.id)
                     .limit(1)
                     .get())
         except Task.DoesNotExist:
             return
-        res = self.delete().where(Task.id == task.id).execute()
+        # SQLite may re-use the ID of a deleted row, so the data is compared
+        # as well, in case another consumer dequeued the task concurrently.
+        res = (self
+               .delete()
+               .where((Task.id == task.id) & (Task.data == task.data))
+               .execute())
         if res == 1:
             return task.data
 
+    def dequeue_many(self, n):
+        # The write lock is taken before reading, so that the same tasks
+        # cannot be handed out to another consumer.
+        with self.database.atomic('IMMEDIATE') as txn:
+            tasks = list(self
+                         .tasks(Task.id, Task.data)
+                         .order_by(Task.priority.desc(), Task.id)
+                         .limit(n)
+                         .tuples())
+            if not tasks:
+                return []
+            res = (self
+                   .delete()
+                   .where(Task.id << [task_id for task_id, _ in tasks])
+                   .execute())
+            if res != len(tasks):
+                txn.rollback()
+                return []
+        return [data for _, data in tasks]
+
     def unqueue(self, data):
         return (self
                 .delete()
@@ -88,7 +212,10 @@ class SqliteStorage(BaseStorage):
         return self.tasks().count()
 
     def enqueued_items(self, limit=None):
-        query = self.tasks(Task.data).tuples()
+        query = (self
+                 .tasks(Task.data)
+                 .order_by(Task.priority.desc(), Task.id)
+                 .tuples())
         if limit is not None:
             query = query.limit(limit)
         return map(operator.itemgetter(0), query)
@@ -98,6 +225,18 @@ class SqliteStorage(BaseStorage):
 
     def add_to_schedule(self, data, ts):
         Schedule.create(data=data, timestamp=ts, queue=self.name)
+        self.notify_schedule()
+
+    def reschedule(self, data, ts):
+        with self.database.atomic('IMMEDIATE'):
+            updated = (Schedule
+                       .update(timestamp=ts)
+                       .where((Schedule.queue == self.name) &
+                              (Schedule.data == data))
+                       .execute())
+            if not updated:
+                Schedule.create(data=data, timestamp=ts, queue=self.name)
+        self.notify_schedule()
 
     def read_schedule(self, ts):
         tasks = (self
@@ -115,6 +254,14 @@ class SqliteStorage(BaseStorage):
              .execute())
         return data
 
+    def next_scheduled_ts(self):
+        ts = (Schedule
+              .select(fn.MIN(Schedule.timestamp))
+              .where(Schedule.queue == self.name)
+              .scalar())
+        if ts is not None:
+            return Schedule.timestamp.python_value(ts)
+
     def schedule_size(self):
         return self.schedule().count()
 
@@ -128,8 +275,20 @@ class SqliteStorage(BaseStorage):
     def flush_schedule(self):
         return Schedule.delete().where(Schedule.queue == self.name).execute()
 
+    def _put(self, key, value, expires_at=None):
+        (KeyValue
+         .insert(queue=self.name, key=key, value=value, expires_at=expires_at)
+         .on_conflict('replace')
+         .execute())
+
     def put_data(self, key, value):
-        KeyValue.create(queue=self.name, key=key, value=value)
+        self._put(key, value)
+
+    def put_result(self, key, value, ack=None, ttl=None):
+        self._put(key, value, time.time() + ttl if ttl else None)
+        if ack is not None:
+            self.ack(ack)
+        self.notify_result(key)
 
     def peek_data(self, key):
         try:
@@ -139,6 +298,32 @@ class SqliteStorage(BaseStorage):
         else:
             return kv.value
 
+    def peek_data_many(self, keys):
+        values = self._get_many(keys)
+        return [values.get(key, EmptyData) for key in keys]
+
+    def pop_data_many(self, keys):
+        with self.database.atomic('IMMEDIATE'):
+            values = self._get_many(keys)
+            for batch in chunked(list(values), 500):
+                (KeyValue
+                 .delete()
+                 .where((KeyValue.queue == self.name) &
+                        (KeyValue.key << batch))
+                 .execute())
+        return [values.get(key, EmptyData) for key in keys]
+
+    def _get_many(self, keys):
+        # Keys are read in batches, as SQLite limits the number of parameters
+        # a query may use.
+        values = {}
+        for batch in chunked(keys, 500):
+            values.update(self
+                          .kv(KeyValue.key, KeyValue.value)
+                          .where(KeyValue.key << batch)
+                          .tuples())
+        return values
+
     def pop_data(self, key):
         try:
             kv = self.kv().where(KeyValue.key == key).get()
@@ -153,22 +338,153 @@ class SqliteStorage(BaseStorage):
     def has_data_for_key(self, key):
         return self.kv().where(KeyValue.key == key).exists()
 
-    def put_if_empty(self, key, value):
-        sql = ('INSERT OR ABORT INTO "keyvalue" ("queue", "key", "value") '
-               'VALUES (?, ?, ?);')
+    def put_if_empty(self, key, value, ttl=None):
+        sql = ('INSERT OR ABORT INTO "keyvalue" '
+               '("queue", "key", "value", "expires_at") VALUES (?, ?, ?, ?);')
+        now = time.time()
         try:
-            res = self.database.execute_sql(sql, (self.name, key, value))
+            with self.database.atomic():
+                # An expired value does not count as being set.
+                (KeyValue
+                 .delete()
+                 .where((KeyValue.queue == self.name) &
+                        (KeyValue.key == key) &
+                        (KeyValue.expires_at <= now))
+                 .execute())
+                self.database.execute_sql(sql, (
+                    self.name, key, value, now + ttl if ttl else None))
         except IntegrityError:
             return False
         else:
             return True
 
+    def leases(self, key):
+        return Lease.select().where((Lease.queue == self.name) &
+                                    (Lease.key == key))
+
+    def acquire_lease(self, key, lease_id, limit, ttl):
+        now = time.time()
+        # Take the write lock up-front, so that concurrent consumers cannot
+        # both see a free slot.
+        with self.database.atomic('IMMEDIATE'):
+            (Lease
+             .delete()
+             .where((Lease.queue == self.name) &
+                    (Lease.key == key) &
+                    (Lease.expires_at <= now))
+             .execute())
+            held = self.leases(key).where(Lease.lease_id == lease_id).exists()
+            if not held and self.leases(key).count() >= limit:
+                return False
+            (Lease
+             .insert(queue=self.name, key=key, lease_id=lease_id,
+                     expires_at=now + ttl)
+             .on_conflict('replace')
+             .execute())
+        return True
+
+    def release_lease(self, key, lease_id):
+        return (Lease
+                .delete()
+                .where((Lease.queue == self.name) &
+                       (Lease.key == key) &
+                       (Lease.lease_id == lease_id))
+                .execute()) == 1
+
+    def acquire_token(self, key, rate, period):
+        now = time.time()
+        with self.database.atomic('IMMEDIATE'):
+            try:
+                bucket = (TokenBucket
+                          .select()
+                          .where((TokenBucket.queue == self.name) &
+                                 (TokenBucket.key == key))
+                          .get())
+            except TokenBucket.DoesNotExist:
+                tokens = rate
+            else:
+                elapsed = max(0, now - bucket.timestamp)
+                tokens = min(rate, bucket.tokens + elapsed * rate / period)
+
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) * period / rate
+            (TokenBucket
+             .insert(queue=self.name, key=key, tokens=tokens, timestamp=now)
+             .on_conflict('replace')
+             .execute())
+        return wait
+
+    def incr_counter(self, key, amount=1):
+        with self.database.atomic('IMMEDIATE'):
+            query = (Counter
+                     .insert(queue=self.name, key=key, value=amount)
+                     .on_conflict(
+                         conflict_target=[Counter.queue, Counter.key],
+                         update={Counter.value: Counter.value + amount})
+                     .returning(Counter.value)
+                     .tuples())
+            (value,), = query.execute()
+            if value == 0:
+                (Counter
+                 .delete()
+                 .where((Counter.queue == self.name) & (Counter.key == key))
+                 .execute())
+        return value
+
+    def batch_items(self, key, *columns):
+        return (BatchItem
+                .select(*columns)
+                .where((BatchItem.queue == self.name) &
+                       (BatchItem.key == key)))
+
+    def push_batch(self, key, data):
+        with self.database.atomic():
+            BatchItem.create(queue=self.name, key=key, data=data)
+            return self.batch_size(key)
+
+    def pop_batch(self, key, n):
+        with self.database.atomic('IMMEDIATE'):
+            items = list(self
+                         .batch_items(key, BatchItem.id, BatchItem.data)
+                         .order_by(BatchItem.id)
+                         .limit(n)
+                         .tuples())
+            if items:
+                (BatchItem
+                 .delete()
+                 .where(BatchItem.id << [item_id for item_id, _ in items])
+                 .execute())
+        return [data for _, data in items]
+
+    def batch_size(self, key):
+        return self.batch_items(key).count()
+
+    def put_result_many(self, items, ttl=None):
+        with self.database.atomic():
+            super(SqliteStorage, self).put_result_many(items, ttl)
+
+    def sweep_results(self, limit=None):
+        query = (KeyValue
+                 .select(KeyValue.key)
+                 .where((KeyValue.queue == self.name) &
+                        (KeyValue.expires_at <= time.time())))
+        if limit is not None:
+            query = query.limit(limit)
+        return (KeyValue
+                .delete()
+                .where((KeyValue.queue == self.name) &
+                       (KeyValue.key << query))
+                .execute())
+
     def result_store_size(self):
         return self.kv().count()
 
     def result_items(self):
         query = self.kv(KeyValue.key, KeyValue.value).tuples()
-        return dict((k, pickle.loads(v)) for k, v in query.iterator())
+        return dict((k, v) for k, v in query.iterator())
 
     def flush_results(self):
         return KeyValue.delete().where(KeyValue.queue == self.name).execute()
@@ -18,6 +18,7 @@ class TaskLockedException(QueueException): pass
 
 class CancelExecution(Exception): pass
 class RetryTask(Exception): pass
+class TaskTimeoutException(Exception): pass
 class TaskException(Exception):
     def __init__(self, metadata, *args):
         self.metadata = metadata
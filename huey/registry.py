@@ -1,6 +1,9 @@
-import pickle
+import time
+import zlib
 
 from huey.exceptions import QueueException
+from huey.serializer import Message
+from huey.serializer import PickleSerializer
 
 
 class TaskRegistry(object):
@@ -14,17 +17,38 @@ class TaskRegistry(object):
     def __init__(self):
         self._registry = {}
         self._periodic_tasks = []
+        self._names = {}
+        self._serializer = PickleSerializer()
 
     def task_to_string(self, task):
         return '%s' % (task.__name__)
 
+    def task_name_to_int(self, klass_str):
+        """
+        Convert a task class name to a small integer, which is used in place
+        of the name by compact message formats. The integer is derived from
+        the name, so it is the same in every process.
+        """
+        return zlib.crc32(klass_str.encode('utf-8')) & 0xffffffff
+
+    def int_to_task_name(self, value):
+        try:
+            return self._names[value]
+        except KeyError:
+            raise QueueException('Task %s not found in TaskRegistry' % value)
+
     def register(self, task_class):
         klass_str = self.task_to_string(task_class)
         if klass_str in self._ignore:
             return
 
         if klass_str not in self._registry:
+            value = self.task_name_to_int(klass_str)
+            if self._names.get(value, klass_str) != klass_str:
+                raise QueueException('%s conflicts with %s in TaskRegistry' %
+                                     (klass_str, self._names[value]))
             self._registry[klass_str] = task_class
+            self._names[value] = klass_str
 
             # store an instance in a separate list of periodic tasks
             if hasattr(task_class, 'validate_datetime'):
@@ -35,6 +59,7 @@ class TaskRegistry(object):
 
         if klass_str in self._registry:
             del(self._registry[klass_str])
+            del(self._names[self.task_name_to_int(klass_str)])
 
             for task in self._periodic_tasks:
                 if isinstance(task, task_class):
@@ -43,8 +68,18 @@ class TaskRegistry(object):
     def __contains__(self, klass_str):
         return klass_str in self._registry
 
-    def get_message_for_task(self, task):
-        """Convert a task object to a message for storage in the queue"""
+    def get_message_for_task(self, task, timestamp=True, serializer=None):
+        """
+        Convert a task object to a message for storage in the queue. Unless
+        ``timestamp`` is false, the time the message was created is included,
+        so identical tasks always produce distinct messages. Messages are
+        pickled, unless another ``serializer`` is given.
+        """
+        message = self._get_message(task, timestamp)
+        return (serializer or self._serializer).serialize_message(message,
+                                                                  self)
+
+    def _get_message(self, task, timestamp):
         data = task.get_data()
         if data and isinstance(data, tuple) and len(data) == 2:
             args, kwargs = data
@@ -53,18 +88,21 @@ class TaskRegistry(object):
                 data = (args, kwargs)
 
         if task.on_complete is not None:
-            on_complete = self.get_message_for_task(task.on_complete)
+            on_complete = self._get_message(task.on_complete, True)
         else:
             on_complete = None
 
-        return pickle.dumps((
+        return Message(
             task.task_id,
             self.task_to_string(type(task)),
             task.execute_time,
             task.retries,
             task.retry_delay,
             data,
-            on_complete))
+            on_complete,
+            task.priority,
+            time.time() if timestamp else None,
+            task.chord)
 
     def get_task_class(self, klass_str):
         klass = self._registry.get(klass_str)
@@ -74,19 +112,26 @@ class TaskRegistry(object):
 
         return klass
 
-    def get_task_for_message(self, msg):
-        """Convert a message from the queue into a task"""
-        # parse out the pieces from the enqueued message
-        raw = pickle.loads(msg)
-        if len(raw) == 7:
-            task_id, klass_str, ex_time, retries, delay, data, oc_raw = raw
-        elif len(raw) == 6:
-            task_id, klass_str, ex_time, retries, delay, data = raw
-            oc_raw = None
-
-        klass = self.get_task_class(klass_str)
-        on_complete = self.get_task_for_message(oc_raw) if oc_raw else None
-        return klass(data, task_id, ex_time, retries, delay, on_complete)
+    def get_task_for_message(self, msg, serializer=None):
+        """
+        Convert a message from the queue into a task. Messages in any of the
+        formats of :py:mod:`huey.serializer` can be read.
+        """
+        message = (serializer or self._serializer).deserialize_message(msg,
+                                                                       self)
+        return self._get_task(message)
+
+    def _get_task(self, message):
+        klass = self.get_task_class(message.name)
+        if message.on_complete is not None:
+            on_complete = self._get_task(message.on_complete)
+        else:
+            on_complete = None
+        task = klass(message.data, message.task_id, message.execute_time,
+                     message.retries, message.retry_delay, on_complete,
+                     message.priority, message.chord)
+        task.enqueued_at = message.enqueued_at
+        return task
 
     def get_periodic_tasks(self):
         return [task_class() for task_class in self._periodic_tasks]
@@ -0,0 +1,393 @@
+"""
+Serializers for task messages, task results and errors.
+
+Every serializer writes its own format, but reads the data written by any of
+them, so the serializer used by a queue can be changed while data in another
+format is still pending. Formats are told apart by their first byte, which
+also identifies the version of the format. Pickled data has no header, so the
+messages and results written by older versions of huey can still be read.
+
+Serialized data larger than a threshold may be compressed, in which case it
+begins with a byte identifying the compression algorithm instead.
+"""
+import datetime
+import json
+import pickle
+import struct
+import threading
+import uuid
+import zlib
+from collections import namedtuple
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+from huey.exceptions import ConfigurationError
+from huey.utils import Error
+
+
+Message = namedtuple('Message', (
+    'task_id',
+    'name',
+    'execute_time',
+    'retries',
+    'retry_delay',
+    'data',
+    'on_complete',
+    'priority',
+    'enqueued_at',
+    'chord'))
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Compression algorithms, and the byte that marks data compressed with them.
+COMPRESSION = {'zlib': (b'\x10', zlib.compress, zlib.decompress)}
+if lzma is not None:
+    COMPRESSION['lzma'] = (b'\x11', lzma.compress, lzma.decompress)
+
+_decompressors = dict((header, decompress)
+                      for header, _, decompress in COMPRESSION.values())
+
+
+def datetime_to_epoch(dt):
+    return (dt - EPOCH).total_seconds()
+
+
+def epoch_to_datetime(ts):
+    return EPOCH + datetime.timedelta(seconds=ts)
+
+
+class BaseSerializer(object):
+    """
+    Convert task messages (see :py:class:`Message`) and values, such as
+    task results and errors, to and from bytes.
+
+    :param str compression: ``'zlib'`` or ``'lzma'`` to compress serialized
+        data, or ``None``.
+    :param int compression_threshold: serialized data smaller than this many
+        bytes is not compressed.
+    """
+    # Byte at the start of the data written by this serializer.
+    header = None
+
+    def __init__(self, compression=None, compression_threshold=1024):
+        if compression is not None and compression not in COMPRESSION:
+            raise ConfigurationError(
+                'Unsupported compression "%s", expected one of: %s.' %
+                (compression, ', '.join(sorted(COMPRESSION))))
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self._stats_lock = threading.Lock()
+        self._stats = {'serialized': 0, 'compressed': 0, 'bytes_in': 0,
+                       'bytes_out': 0}
+
+    def serialize(self, value):
+        return self._compress(self._dump(value))
+
+    def serialize_message(self, message, registry):
+        """
+        :param Message message: message to serialize.
+        :param TaskRegistry registry: registry of the task classes.
+        """
+        return self._compress(self._dump_message(message, registry))
+
+    def _dump(self, value):
+        raise NotImplementedError
+
+    def _dump_message(self, message, registry):
+        raise NotImplementedError
+
+    def _load(self, data):
+        raise NotImplementedError
+
+    def _load_message(self, data, registry):
+        raise NotImplementedError
+
+    def _compress(self, data):
+        size = len(data)
+        if self.compression is not None and size >= self.compression_threshold:
+            header, compress, _ = COMPRESSION[self.compression]
+            compressed = header + compress(data)
+            # Data that does not compress well is stored as-is.
+            if len(compressed) < size:
+                data = compressed
+
+        with self._stats_lock:
+            self._stats['serialized'] += 1
+            self._stats['bytes_in'] += size
+            self._stats['bytes_out'] += len(data)
+            if len(data) != size:
+                self._stats['compressed'] += 1
+        return data
+
+    def _for_data(self, data):
+        header = bytes(data[:1])
+        if header == self.header:
+            return self
+        return _formats.get(header, _pickle_serializer)
+
+    def _decompress(self, data):
+        decompress = _decompressors.get(bytes(data[:1]))
+        if decompress is not None:
+            data = decompress(bytes(data[1:]))
+        return data
+
+    def deserialize(self, data):
+        data = self._decompress(data)
+        return self._for_data(data)._load(data)
+
+    def deserialize_message(self, data, registry):
+        data = self._decompress(data)
+        return self._for_data(data)._load_message(data, registry)
+
+    def stats(self):
+        """
+        Return statistics about the data serialized by this serializer in
+        the current process: the number of payloads ``serialized`` and
+        ``compressed``, their total size before (``bytes_in``) and after
+        (``bytes_out``) compression, and the compression ``ratio``.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        if stats['bytes_out']:
+            stats['ratio'] = float(stats['bytes_in']) / stats['bytes_out']
+        else:
+            stats['ratio'] = 1.
+        return stats
+
+
+class PickleSerializer(BaseSerializer):
+    """
+    Pickle messages and values. Messages are pickled tuples, the format used
+    by older versions of huey.
+    """
+    def _dump(self, value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _load(self, data):
+        return pickle.loads(data)
+
+    def _dump_message(self, message, registry):
+        on_complete = message.on_complete
+        if on_complete is not None:
+            on_complete = self._dump_message(on_complete, registry)
+        return pickle.dumps(message._replace(on_complete=on_complete)[:])
+
+    def _load_message(self, data, registry):
+        raw = pickle.loads(data)
+        priority = enqueued_at = chord = oc_raw = None
+        if len(raw) == 10:
+            (task_id, name, ex_time, retries, delay, data, oc_raw,
+             priority, enqueued_at, chord) = raw
+        elif len(raw) == 9:
+            (task_id, name, ex_time, retries, delay, data, oc_raw,
+             priority, enqueued_at) = raw
+        elif len(raw) == 8:
+            (task_id, name, ex_time, retries, delay, data, oc_raw,
+             priority) = raw
+        elif len(raw) == 7:
+            task_id, name, ex_time, retries, delay, data, oc_raw = raw
+        elif len(raw) == 6:
+            task_id, name, ex_time, retries, delay, data = raw
+
+        if oc_raw:
+            on_complete = self.deserialize_message(oc_raw, registry)
+        else:
+            on_complete = None
+        return Message(task_id, name, ex_time, retries, delay, data,
+                       on_complete, priority, enqueued_at, chord)
+
+
+class JSONSerializer(BaseSerializer):
+    """
+    Serialize messages and values as JSON. Task arguments and results must be
+    JSON-serializable, and lists are used in place of tuples.
+    """
+    header = b'\x02'
+
+    def _dumps(self, obj):
+        data = json.dumps(obj, separators=(',', ':'))
+        return self.header + data.encode('utf-8')
+
+    def _loads(self, data):
+        return json.loads(bytes(data[1:]).decode('utf-8'))
+
+    def _dump(self, value):
+        # Errors are stored as the results of failed tasks. They are tuples,
+        # which JSON would otherwise encode as lists.
+        if isinstance(value, Error):
+            value = {'__error__': value.metadata}
+        return self._dumps(value)
+
+    def _load(self, data):
+        value = self._loads(data)
+        if isinstance(value, dict) and '__error__' in value:
+            value = Error(value['__error__'])
+        return value
+
+    def _dump_message(self, message, registry):
+        return self._dumps(self._message_to_dict(message))
+
+    def _message_to_dict(self, message):
+        accum = message._asdict()
+        if message.execute_time is not None:
+            accum['execute_time'] = datetime_to_epoch(message.execute_time)
+        if message.on_complete is not None:
+            accum['on_complete'] = self._message_to_dict(message.on_complete)
+        return accum
+
+    def _load_message(self, data, registry):
+        return self._dict_to_message(self._loads(data))
+
+    def _dict_to_message(self, obj):
+        if obj['execute_time'] is not None:
+            obj['execute_time'] = epoch_to_datetime(obj['execute_time'])
+        if obj['on_complete'] is not None:
+            obj['on_complete'] = self._dict_to_message(obj['on_complete'])
+
+        # Task data is an (args, kwargs) 2-tuple.
+        data = obj['data']
+        if isinstance(data, list):
+            if len(data) == 2 and isinstance(data[0], list):
+                data = (tuple(data[0]), data[1])
+            else:
+                data = tuple(data)
+        obj['data'] = data
+        return Message(**obj)
+
+
+class BinarySerializer(PickleSerializer):
+    """
+    Compact binary encoding of messages. The fields of the message are packed
+    in a fixed-size header, with the task class identified by a small integer
+    (see :py:meth:`TaskRegistry.task_name_to_int`), and the times as floats.
+    Task data, as well as results and errors, are pickled.
+    """
+    header = b'\x01'
+
+    # Flags, task class, retries, retry delay, execute time, priority,
+    # enqueued at.
+    _fields = struct.Struct('>BIiddid')
+    _length = struct.Struct('>I')
+
+    F_EXECUTE_TIME = 1
+    F_PRIORITY = 2
+    F_ENQUEUED_AT = 4
+    F_ON_COMPLETE = 8
+    F_CHORD = 16
+    F_INT_DELAY = 32
+
+    def _dump_id(self, value):
+        # Task IDs are usually UUIDs, which are stored as 16 bytes.
+        try:
+            if str(uuid.UUID(value)) == value:
+                return b'\x00' + uuid.UUID(value).bytes
+        except (AttributeError, TypeError, ValueError):
+            pass
+        value = value.encode('utf-8')
+        return b'\x01' + self._length.pack(len(value)) + value
+
+    def _load_id(self, data, offset):
+        if data[offset:offset + 1] == b'\x00':
+            value = uuid.UUID(bytes=bytes(data[offset + 1:offset + 17]))
+            return str(value), offset + 17
+        length, = self._length.unpack_from(data, offset + 1)
+        offset += 1 + self._length.size
+        value = bytes(data[offset:offset + length]).decode('utf-8')
+        return value, offset + length
+
+    def _dump_message(self, message, registry):
+        flags = 0
+        if message.execute_time is not None:
+            flags |= self.F_EXECUTE_TIME
+        if message.priority is not None:
+            flags |= self.F_PRIORITY
+        if message.enqueued_at is not None:
+            flags |= self.F_ENQUEUED_AT
+        if message.on_complete is not None:
+            flags |= self.F_ON_COMPLETE
+        if message.chord is not None:
+            flags |= self.F_CHORD
+        if isinstance(message.retry_delay, int):
+            flags |= self.F_INT_DELAY
+
+        accum = [
+            self.header,
+            self._fields.pack(
+                flags,
+                registry.task_name_to_int(message.name),
+                message.retries,
+                message.retry_delay,
+                (datetime_to_epoch(message.execute_time)
+                 if message.execute_time is not None else 0.),
+                message.priority or 0,
+                message.enqueued_at or 0.),
+            self._dump_id(message.task_id)]
+        if message.chord is not None:
+            accum.append(self._dump_id(message.chord))
+        if message.on_complete is not None:
+            on_complete = self._dump_message(message.on_complete, registry)
+            accum.append(self._length.pack(len(on_complete)))
+            accum.append(on_complete)
+        accum.append(pickle.dumps(message.data, pickle.HIGHEST_PROTOCOL))
+        return b''.join(accum)
+
+    def _load_message(self, data, registry):
+        (flags, name, retries, retry_delay, execute_time, priority,
+         enqueued_at) = self._fields.unpack_from(data, 1)
+        task_id, offset = self._load_id(data, 1 + self._fields.size)
+        chord = on_complete = None
+        if flags & self.F_CHORD:
+            chord, offset = self._load_id(data, offset)
+        if flags & self.F_ON_COMPLETE:
+            length, = self._length.unpack_from(data, offset)
+            offset += self._length.size
+            on_complete = self.deserialize_message(
+                data[offset:offset + length], registry)
+            offset += length
+
+        return Message(
+            task_id,
+            registry.int_to_task_name(name),
+            (epoch_to_datetime(execute_time)
+             if flags & self.F_EXECUTE_TIME else None),
+            retries,
+            int(retry_delay) if flags & self.F_INT_DELAY else retry_delay,
+            pickle.loads(data[offset:]),
+            on_complete,
+            priority if flags & self.F_PRIORITY else None,
+            enqueued_at if flags & self.F_ENQUEUED_AT else None,
+            chord)
+
+
+_pickle_serializer = PickleSerializer()
+_formats = {
+    BinarySerializer.header: BinarySerializer(),
+    JSONSerializer.header: JSONSerializer(),
+}
+
+SERIALIZERS = {
+    'binary': BinarySerializer,
+    'json': JSONSerializer,
+    'pickle': PickleSerializer,
+}
+
+
+def get_serializer(serializer=None, compression=None):
+    """
+    Return a serializer given its name, or an instance, defaulting to the
+    :py:class:`BinarySerializer`.
+    """
+    if isinstance(serializer, BaseSerializer):
+        if compression is not None:
+            raise ConfigurationError('Compression must be configured on the '
+                                     'serializer instance.')
+        return serializer
+    elif serializer is None:
+        return BinarySerializer(compression)
+    elif serializer in SERIALIZERS:
+        return SERIALIZERS[serializer](compression)
+    raise ConfigurationError('Unknown serializer "%s", expected one of: %s.' %
+                             (serializer, ', '.join(sorted(SERIALIZERS))))
@@ -1,6 +1,10 @@
+import datetime
 import json
+import math
 import re
+import threading
 import time
+import uuid
 
 try:
     from redis import ConnectionPool
@@ -9,26 +13,49 @@ try:
     except ImportError:
         from redis import Redis
     from redis.exceptions import ConnectionError
+    from redis.exceptions import ResponseError
 except ImportError:
-    ConnectionPool = Redis = ConnectionError = None
+    ConnectionPool = Redis = ConnectionError = ResponseError = None
 
 from huey.api import Huey
 from huey.constants import EmptyData
 
 
 class BaseStorage(object):
+    # Whether dequeue() waits for data when the queue is empty.
+    blocking = False
+
     def __init__(self, name='huey', **storage_kwargs):
         self.name = name
+        self._result_cond = threading.Condition()
+        self._schedule_cond = threading.Condition()
 
-    def enqueue(self, data):
+    def enqueue(self, data, priority=None):
         """
         Given an opaque chunk of data, add it to the queue.
 
         :param bytes data: Task data.
+        :param int priority: Priority of the task. Higher values are dequeued
+            first, ``None`` is equivalent to ``0``. Implementations that do not
+            support priorities may ignore this parameter.
         :return: No return value.
         """
         raise NotImplementedError
 
+    def enqueue_many(self, data_list, priority=None):
+        """
+        Given a list of opaque chunks of data, add them all to the queue. The
+        default implementation simply calls :py:meth:`enqueue` for each item,
+        but implementations should override this to write the data in a single
+        round-trip / transaction.
+
+        :param list data_list: List of task data.
+        :param int priority: Priority of the tasks.
+        :return: No return value.
+        """
+        for data in data_list:
+            self.enqueue(data, priority)
+
     def dequeue(self):
         """
         Atomically remove data from the queue. If no data is available, no data
@@ -38,6 +65,60 @@ class BaseStorage(object):
         """
         raise NotImplementedError
 
+    def dequeue_nowait(self):
+        """
+        Atomically remove data from the queue, without waiting for data if the
+        queue is empty. The default implementation calls :py:meth:`dequeue`,
+        blocking storages must override it.
+
+        :return: Opaque binary task data or None if queue is empty.
+        """
+        return self.dequeue()
+
+    def dequeue_many(self, n):
+        """
+        Atomically remove up to ``n`` items from the queue. The default
+        implementation simply calls :py:meth:`dequeue` repeatedly, but
+        implementations should override this to read the data in a single
+        round-trip / transaction.
+
+        :param int n: Maximum number of items to read.
+        :return: List of opaque binary task data, in the order they were
+                 enqueued. The list will be empty if the queue is empty.
+        """
+        accum = []
+        while len(accum) < n:
+            data = self.dequeue()
+            if not data:
+                break
+            accum.append(data)
+        return accum
+
+    def dequeue_any(self, storages):
+        """
+        Remove data from the first queue that is not empty, out of the queues
+        of the given storages. Used by consumers that serve several queues,
+        with the storages listed in the order they should be read. The default
+        implementation reads each queue in turn without waiting, and if they
+        are all empty, waits on the first blocking storage's queue.
+
+        :param list storages: Storage instances, typically including this one.
+        :return: A 2-tuple of (storage, data), or None if all queues are empty.
+        """
+        for storage in storages:
+            data = storage.dequeue_nowait()
+            if data:
+                return (storage, data)
+
+        # A single wait, so that an empty queue does not hold up the others
+        # for more than one read timeout.
+        for storage in storages:
+            if storage.blocking:
+                data = storage.dequeue()
+                if data:
+                    return (storage, data)
+                break
+
     def unqueue(self, data):
         """
         Atomically remove the given data from the queue, if it is present. This
@@ -52,6 +133,36 @@ class BaseStorage(object):
         """
         raise NotImplementedError
 
+    def ack(self, data):
+        """
+        Acknowledge that the given data, previously read from the queue, has
+        been processed. Storage implementations that do not track in-flight
+        tasks need not do anything.
+
+        :param bytes data: Task data returned by :py:meth:`dequeue`.
+        :return: No return value.
+        """
+        pass
+
+    def heartbeat(self):
+        """
+        Signal that the consumer using this storage is still alive. Used by
+        storage implementations that track in-flight tasks.
+
+        :return: No return value.
+        """
+        pass
+
+    def reap(self):
+        """
+        Claim any tasks that were in-flight on consumers that have stopped
+        sending heartbeats. The tasks become in-flight on this consumer, and
+        must be enqueued again and then acknowledged by the caller.
+
+        :return: List of task data.
+        """
+        return []
+
     def queue_size(self):
         """
         Return the length of the queue.
@@ -89,6 +200,17 @@ class BaseStorage(object):
         """
         raise NotImplementedError
 
+    def reschedule(self, data, ts):
+        """
+        Add the given task data to the schedule, or if identical data is
+        already in the schedule, move it to the given timestamp.
+
+        :param bytes data: Task data.
+        :param datetime ts: Timestamp at which task should be executed.
+        :return: No return value.
+        """
+        raise NotImplementedError
+
     def read_schedule(self, ts):
         """
         Read all tasks from the schedule that should be executed at or before
@@ -101,6 +223,41 @@ class BaseStorage(object):
         """
         raise NotImplementedError
 
+    def next_scheduled_ts(self):
+        """
+        Return the timestamp of the task that is next due in the schedule,
+        without removing it. Used by the scheduler in precise mode to sleep
+        until the next task is due.
+
+        :return: A ``datetime``, or ``None`` if the schedule is empty or the
+                 storage does not support this operation.
+        """
+        return None
+
+    def notify_schedule(self):
+        """
+        Wake up any threads in this process waiting for changes to the schedule
+        (see :py:meth:`wait_for_schedule`). Implementations should call this
+        method after adding a task to the schedule.
+
+        :return: No return value.
+        """
+        with self._schedule_cond:
+            self._schedule_cond.notify_all()
+
+    def wait_for_schedule(self, timeout):
+        """
+        Block until a task may have been added to the schedule, or until the
+        timeout expires. The default implementation waits on a condition
+        variable, so it is only woken up by tasks scheduled in the same
+        process.
+
+        :param int timeout: maximum number of seconds to wait.
+        :return: No return value.
+        """
+        with self._schedule_cond:
+            self._schedule_cond.wait(timeout)
+
     def schedule_size(self):
         """
         :return: The number of tasks currently in the schedule.
@@ -144,6 +301,77 @@ class BaseStorage(object):
         """
         raise NotImplementedError
 
+    def put_result(self, key, value, ack=None, ttl=None):
+        """
+        Store the result of a task and, optionally, acknowledge the queue data
+        for the task in the same operation.
+
+        :param bytes key: lookup key
+        :param bytes value: value
+        :param bytes ack: Task data to acknowledge (see :py:meth:`ack`).
+        :param int ttl: Number of seconds after which the result expires.
+            Implementations that do not support expiry may ignore this.
+        :return: No return value.
+        """
+        self.put_data(key, value)
+        if ack is not None:
+            self.ack(ack)
+        self.notify_result(key)
+
+    def put_result_many(self, items, ttl=None):
+        """
+        Store the results of several tasks. Implementations may override this
+        to store all the results in a single operation.
+
+        :param list items: A list of ``(key, value)`` 2-tuples.
+        :param int ttl: Number of seconds after which the results expire.
+        :return: No return value.
+        """
+        for key, value in items:
+            self.put_result(key, value, ttl=ttl)
+
+    def notify_result(self, key):
+        """
+        Wake up any threads in this process waiting for the given result (see
+        :py:meth:`wait_for_result`).
+
+        :param bytes key: lookup key
+        :return: No return value.
+        """
+        with self._result_cond:
+            self._result_cond.notify_all()
+
+    def wait_for_result(self, key, timeout):
+        """
+        Block until a result may have been stored for the given key, or until
+        the timeout expires. Callers should check for the result after this
+        method returns, as a notification does not guarantee that the data is
+        present.
+
+        The default implementation waits on a condition variable that is
+        notified by :py:meth:`put_result`, so it is only woken up by results
+        stored in the same process. Otherwise it simply sleeps for the
+        duration of the timeout.
+
+        :param bytes key: lookup key
+        :param float timeout: maximum number of seconds to wait.
+        :return: No return value.
+        """
+        with self._result_cond:
+            self._result_cond.wait(timeout)
+
+    def wait_for_results(self, keys, timeout):
+        """
+        Block until a result may have been stored for any of the given keys,
+        or until the timeout expires. See :py:meth:`wait_for_result`.
+
+        :param list keys: lookup keys
+        :param float timeout: maximum number of seconds to wait.
+        :return: No return value.
+        """
+        with self._result_cond:
+            self._result_cond.wait(timeout)
+
     def pop_data(self, key):
         """
         Destructively read the value at the given key, if it exists.
@@ -153,6 +381,28 @@ class BaseStorage(object):
         """
         raise NotImplementedError
 
+    def peek_data_many(self, keys):
+        """
+        Non-destructively read the values at the given keys. Implementations
+        may override this to read all the values in a single operation.
+
+        :param list keys: Keys to read.
+        :return: List of the associated values, or ``EmptyData`` for keys
+            that do not exist, in the same order as the keys.
+        """
+        return [self.peek_data(key) for key in keys]
+
+    def pop_data_many(self, keys):
+        """
+        Destructively read the values at the given keys. Implementations may
+        override this to read all the values in a single operation.
+
+        :param list keys: Keys to read.
+        :return: List of the associated values, or ``EmptyData`` for keys
+            that do not exist, in the same order as the keys.
+        """
+        return [self.pop_data(key) for key in keys]
+
     def has_data_for_key(self, key):
         """
         Return whether there is data for the given key.
@@ -161,12 +411,14 @@ class BaseStorage(object):
         """
         raise NotImplementedError
 
-    def put_if_empty(self, key, value):
+    def put_if_empty(self, key, value, ttl=None):
         """
         Atomically write data only if the key is not already set.
 
         :param bytes key: Key to check/set.
         :param bytes value: Arbitrary data.
+        :param int ttl: Number of seconds after which the key expires.
+            Implementations that do not support expiry may ignore this.
         :return: Boolean whether key/value was set.
         """
         if self.has_data_for_key(key):
@@ -174,6 +426,94 @@ class BaseStorage(object):
         self.put_data(key, value)
         return True
 
+    def acquire_lease(self, key, lease_id, limit, ttl):
+        """
+        Acquire a lease from a counting semaphore, unless ``limit`` leases
+        are already held. Leases expire after ``ttl`` seconds, so that leases
+        held by consumers that died are eventually released. Acquiring a
+        lease that is already held renews it.
+
+        :param str key: Name of the semaphore.
+        :param str lease_id: Unique identifier for the lease.
+        :param int limit: Maximum number of leases held at once.
+        :param ttl: Number of seconds after which the lease expires.
+        :return: Boolean whether the lease was acquired.
+        """
+        raise NotImplementedError
+
+    def release_lease(self, key, lease_id):
+        """
+        Release a lease acquired with :py:meth:`acquire_lease`.
+
+        :param str key: Name of the semaphore.
+        :param str lease_id: Identifier the lease was acquired with.
+        :return: Boolean whether the lease was held.
+        """
+        raise NotImplementedError
+
+    def acquire_token(self, key, rate, period):
+        """
+        Take a token from a token bucket, which holds at most ``rate`` tokens
+        and is refilled at a rate of ``rate`` tokens every ``period`` seconds.
+        The bucket starts out full, allowing a burst of ``rate`` calls.
+
+        :param str key: Name of the token bucket.
+        :param int rate: Capacity of the bucket.
+        :param period: Number of seconds in which the bucket is refilled.
+        :return: 0 if a token was taken, otherwise the number of seconds
+            until the next token is available.
+        """
+        raise NotImplementedError
+
+    def incr_counter(self, key, amount=1):
+        """
+        Atomically add ``amount`` to a counter. Counters start at zero, and
+        are removed when they return to zero.
+
+        :param str key: Name of the counter.
+        :param int amount: Number to add, which may be negative.
+        :return: The new value of the counter.
+        """
+        raise NotImplementedError
+
+    def push_batch(self, key, data):
+        """
+        Append data to the end of a buffer of calls to a batch task.
+
+        :param str key: Name of the buffer.
+        :param bytes data: Data for a single call.
+        :return: The number of items in the buffer.
+        """
+        raise NotImplementedError
+
+    def pop_batch(self, key, n):
+        """
+        Remove up to ``n`` items from the start of a buffer of calls to a batch
+        task.
+
+        :param str key: Name of the buffer.
+        :param int n: Maximum number of items to remove.
+        :return: A list of the items, oldest first.
+        """
+        raise NotImplementedError
+
+    def batch_size(self, key):
+        """
+        :param str key: Name of the buffer.
+        :return: The number of items in a buffer of calls to a batch task.
+        """
+        raise NotImplementedError
+
+    def sweep_results(self, limit=None):
+        """
+        Remove results that have expired. Implementations that expire data
+        natively need not do anything.
+
+        :param int limit: Maximum number of results to remove.
+        :return: Number of results removed.
+        """
+        return 0
+
     def result_store_size(self):
         """
         :return: Number of key/value pairs in the result store.
@@ -196,6 +536,48 @@ class BaseStorage(object):
         """
         raise NotImplementedError
 
+    def add_revocation(self, key, value):
+        """
+        Store the revocation data for a task or task class. The default
+        implementation uses the result store.
+
+        :param str key: revocation key
+        :param bytes value: revocation data
+        :return: No return value.
+        """
+        self.put_data(key, value)
+
+    def remove_revocation(self, key):
+        """
+        Remove the revocation data for a task or task class.
+
+        :param str key: revocation key
+        :return: Boolean indicating whether the key was revoked.
+        """
+        return self.pop_data(key) is not EmptyData
+
+    def get_revocations(self, keys):
+        """
+        Read the revocation data for several keys. This method is called for
+        every task executed by the consumer, so implementations should read
+        all the keys in a single operation, and should be as cheap as possible
+        when nothing has been revoked.
+
+        :param list keys: revocation keys
+        :return: A list containing the revocation data for each key, or
+            ``EmptyData`` if the key is not revoked.
+        """
+        return [self.peek_data(key) for key in keys]
+
+    def flush_revocations(self):
+        """
+        Remove all revocation data. The default implementation stores
+        revocations in the result store, so there is nothing else to remove.
+
+        :return: No return value.
+        """
+        pass
+
     def put_error(self, metadata):
         """
         Log an error in the error store. The ``max_errors`` parameter is used
@@ -248,6 +630,7 @@ class BaseStorage(object):
         self.flush_queue()
         self.flush_schedule()
         self.flush_results()
+        self.flush_revocations()
         self.flush_errors()
 
 
@@ -262,13 +645,206 @@ if #res and redis.call('zremrangebyscore', key, '-inf', unix_ts) == #res then
     return res
 end"""
 
+# Pop up to N items from the tails of the queue lists in a single operation.
+# Tasks with a priority are stored in a separate list per priority level, and
+# the levels in use are tracked in a sorted set. The first ARGV[2] keys are the
+# queue lists, ordered from the highest priority to the lowest, which are
+# drained in turn. If a processing list follows them, the items are also
+# pushed onto it. Every key is passed explicitly, as required by Redis Cluster.
+QUEUE_POP_LUA = """\
+local n = tonumber(ARGV[1])
+local nqueues = tonumber(ARGV[2])
+local processing = KEYS[nqueues + 1]
+local accum = {}
+for i = 1, nqueues do
+    local need = n - #accum
+    if need <= 0 then
+        break
+    end
+    local res = redis.call('lrange', KEYS[i], -need, -1)
+    if #res > 0 then
+        redis.call('ltrim', KEYS[i], 0, -(#res + 1))
+        for j = #res, 1, -1 do
+            table.insert(accum, res[j])
+        end
+    end
+end
+if processing and #accum > 0 then
+    redis.call('lpush', processing, unpack(accum))
+end
+return accum"""
+
+# Read revocation data for the given keys. Revocations are rare, so avoid
+# looking up the individual keys when nothing has been revoked. Older versions
+# of huey stored revocations in the result hash, which is also read until
+# RedisStorage.migrate_revocations() has been run.
+REVOKED_LUA = """\
+local key = KEYS[1]
+local legacy_key = KEYS[2]
+local migrated_key = KEYS[3]
+local res = {}
+if redis.call('hlen', key) > 0 then
+    res = redis.call('hmget', key, unpack(ARGV))
+end
+if redis.call('exists', migrated_key) == 0 then
+    local legacy = redis.call('hmget', legacy_key, unpack(ARGV))
+    for i = 1, #ARGV do
+        res[i] = res[i] or legacy[i]
+    end
+end
+return res"""
+
+# Store revocation data, which is also written to the result hash for older
+# versions of huey, until RedisStorage.migrate_revocations() has been run.
+REVOKE_LUA = """\
+local key = KEYS[1]
+local legacy_key = KEYS[2]
+local migrated_key = KEYS[3]
+redis.call('hset', key, ARGV[1], ARGV[2])
+if redis.call('exists', migrated_key) == 0 then
+    redis.call('hset', legacy_key, ARGV[1], ARGV[2])
+end"""
+
+# Find consumers whose heartbeat has expired and move the tasks they were
+# processing back to the front of the queue.
+REAP_LUA = """\
+local consumers = KEYS[1]
+local processing_key = KEYS[2]
+local heartbeat_prefix = ARGV[1]
+local processing_prefix = ARGV[2]
+local own_id = ARGV[3]
+local accum = {}
+for _, consumer_id in ipairs(redis.call('smembers', consumers)) do
+    if consumer_id ~= own_id and
+            redis.call('exists', heartbeat_prefix .. consumer_id) == 0 then
+        local processing = processing_prefix .. consumer_id
+        local data = redis.call('rpoplpush', processing, processing_key)
+        while data do
+            table.insert(accum, data)
+            data = redis.call('rpoplpush', processing, processing_key)
+        end
+        redis.call('srem', consumers, consumer_id)
+    end
+end
+return accum"""
+
+
+# Acquire a lease from a counting semaphore stored as a sorted set of lease
+# IDs scored by their expiry time. Server time is used, so that the leases of
+# all consumers expire consistently.
+LEASE_ACQUIRE_LUA = """\
+local key = KEYS[1]
+local lease_id = ARGV[1]
+local limit = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local t = redis.call('time')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('zremrangebyscore', key, '-inf', now)
+if redis.call('zscore', key, lease_id) or
+        redis.call('zcard', key) < limit then
+    redis.call('zadd', key, now + ttl, lease_id)
+    redis.call('pexpire', key, math.ceil(ttl * 1000))
+    return 1
+end
+return 0"""
+
+
+# Take a token from a bucket stored as a hash of the tokens remaining and the
+# time they were counted at. Tokens are refilled lazily, based on the time
+# elapsed according to the server's clock. The wait is returned as a string,
+# as Lua numbers are truncated to integers when converted to replies.
+TOKEN_BUCKET_LUA = """\
+local key = KEYS[1]
+local rate = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local t = redis.call('time')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('hmget', key, 'tokens', 'ts')
+local tokens = rate
+if bucket[1] then
+    local elapsed = math.max(0, now - tonumber(bucket[2]))
+    tokens = math.min(rate, tonumber(bucket[1]) + elapsed * rate / period)
+end
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) * period / rate
+end
+redis.call('hset', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('pexpire', key, math.ceil(period * 1000))
+return tostring(wait)"""
+
+
+# Increment a counter stored as a hash field, removing it once it reaches zero.
+COUNTER_INCR_LUA = """\
+local key = KEYS[1]
+local field = ARGV[1]
+local n = redis.call('hincrby', key, field, ARGV[2])
+if n == 0 then
+    redis.call('hdel', key, field)
+end
+return n"""
+
+# Remove up to N items from the head of a list in a single operation.
+BATCH_POP_LUA = """\
+local key = KEYS[1]
+local n = tonumber(ARGV[1])
+local items = redis.call('lrange', key, 0, n - 1)
+redis.call('ltrim', key, n, -1)
+return items"""
+
+# Store a result, either in the result hash or, if it has a TTL, in its own
+# key, which is tracked in a sorted set scored by its expiry time. A token is
+# pushed onto the result's notification list only if a client has registered
+# as waiting for it, see RedisStorage.wait_for_results().
+RESULT_PUT_LUA = """\
+local result_key = KEYS[1]
+local ttl_key = KEYS[2]
+local notify_key = KEYS[3]
+local waiter_key = KEYS[4]
+local ttl_index = KEYS[5]
+local key = ARGV[1]
+local value = ARGV[2]
+local ttl = tonumber(ARGV[3])
+if ttl > 0 then
+    redis.call('set', ttl_key, value, 'px', ttl)
+    redis.call('zadd', ttl_index, ARGV[5], key)
+else
+    redis.call('hset', result_key, key, value)
+end
+if redis.call('exists', waiter_key) == 1 then
+    redis.call('lpush', notify_key, '1')
+    redis.call('ltrim', notify_key, 0, 0)
+    redis.call('expire', notify_key, tonumber(ARGV[4]))
+end"""
+
+# Put back the token that woke up a client waiting for a result, so that the
+# other clients waiting for the same result are woken up too. The token is
+# only put back while the result has not been read destructively.
+RESULT_RENOTIFY_LUA = """\
+local notify_key = KEYS[1]
+local result_key = KEYS[2]
+local ttl_key = KEYS[3]
+local key = ARGV[1]
+local ttl = tonumber(ARGV[2])
+if redis.call('hexists', result_key, key) == 1 or
+        redis.call('exists', ttl_key) == 1 then
+    redis.call('lpush', notify_key, '1')
+    redis.call('ltrim', notify_key, 0, 0)
+    redis.call('expire', notify_key, ttl)
+end"""
+
 
 class RedisStorage(BaseStorage):
     redis_client = Redis
+    chunk_size = 1000
+    notify_ttl = 60
 
     def __init__(self, name='huey', blocking=False, read_timeout=1,
                  max_errors=1000, connection_pool=None, url=None,
-                 client_name=None, **connection_params):
+                 client_name=None, reliable=False, visibility_timeout=60,
+                 consumer_id=None, **connection_params):
 
         if Redis is None:
             raise ImportError('"redis" python module not found, cannot use '
@@ -291,12 +867,47 @@ class RedisStorage(BaseStorage):
         self.conn = self.redis_client(connection_pool=connection_pool)
         self.connection_params = connection_params
         self._pop = self.conn.register_script(SCHEDULE_POP_LUA)
+        self._pop_many = self.conn.register_script(QUEUE_POP_LUA)
+        self._reap = self.conn.register_script(REAP_LUA)
+        self._revoked = self.conn.register_script(REVOKED_LUA)
+        self._revoke = self.conn.register_script(REVOKE_LUA)
+        self._acquire_lease = self.conn.register_script(LEASE_ACQUIRE_LUA)
+        self._acquire_token = self.conn.register_script(TOKEN_BUCKET_LUA)
+        self._pop_batch = self.conn.register_script(BATCH_POP_LUA)
+        self._incr_counter = self.conn.register_script(COUNTER_INCR_LUA)
+        self._renotify = self.conn.register_script(RESULT_RENOTIFY_LUA)
+        self._put_result = self.conn.register_script(RESULT_PUT_LUA)
+        # Redis 6 and newer accept blocking timeouts with a fractional part.
+        # This is cleared if the server rejects them.
+        self.fractional_timeouts = True
 
         self.name = self.clean_name(name)
         self.queue_key = 'huey.redis.%s' % self.name
+        self.priority_key = 'huey.priority.%s' % self.name
         self.schedule_key = 'huey.schedule.%s' % self.name
+        self.schedule_wake_key = 'huey.schedule.wake.%s' % self.name
         self.result_key = 'huey.results.%s' % self.name
+        self.result_ttl_index_key = 'huey.result_ttls.%s' % self.name
         self.error_key = 'huey.errors.%s' % self.name
+        self.notify_prefix = 'huey.notify.%s.' % self.name
+        self.waiter_prefix = 'huey.waiters.%s.' % self.name
+        self.revoke_key = 'huey.revoked.%s' % self.name
+        self.revoke_migrated_key = 'huey.revoked.migrated.%s' % self.name
+        self.lease_prefix = 'huey.leases.%s.' % self.name
+        self.bucket_prefix = 'huey.buckets.%s.' % self.name
+        self.batch_prefix = 'huey.batches.%s.' % self.name
+        self.counter_key = 'huey.counters.%s' % self.name
+
+        # In reliable mode, tasks are atomically moved to a per-consumer
+        # processing list when dequeued, and removed once acknowledged. If the
+        # consumer stops sending heartbeats, its tasks are re-enqueued.
+        self.reliable = reliable
+        self.visibility_timeout = visibility_timeout
+        self.consumer_id = consumer_id or uuid.uuid4().hex
+        self.consumers_key = 'huey.consumers.%s' % self.name
+        self.heartbeat_prefix = 'huey.heartbeat.%s.' % self.name
+        self.processing_prefix = 'huey.processing.%s.' % self.name
+        self.processing_key = self.processing_prefix + self.consumer_id
 
         if client_name is not None:
             self.conn.client_setname(client_name)
@@ -308,40 +919,229 @@ class RedisStorage(BaseStorage):
     def clean_name(self, name):
         return re.sub('[^a-z0-9]', '', name)
 
-    def convert_ts(self, ts):
-        return time.mktime(ts.timetuple())
+    def blocking_timeout(self, timeout):
+        # Older servers only accept whole seconds, so the timeout is rounded
+        # up. A timeout of 0 would block indefinitely.
+        if self.fractional_timeouts:
+            return max(timeout, .01)
+        return max(int(math.ceil(timeout)), 1)
+
+    def _blpop(self, keys, timeout):
+        try:
+            return self.conn.blpop(keys, timeout=self.blocking_timeout(timeout))
+        except ResponseError:
+            if not self.fractional_timeouts:
+                raise
+            self.fractional_timeouts = False
+            return self._blpop(keys, timeout)
+        except ConnectionError:
+            return None
 
-    def enqueue(self, data):
-        self.conn.lpush(self.queue_key, data)
+    def convert_ts(self, ts):
+        # Keep sub-second precision, as timetuple() discards microseconds.
+        return time.mktime(ts.timetuple()) + ts.microsecond / 1000000.
+
+    def _priority_queue_key(self, priority):
+        return '%s.%s' % (self.queue_key, priority)
+
+    def _queue_keys(self):
+        levels = self.conn.zrevrange(self.priority_key, 0, -1, withscores=True)
+        return self._queue_keys_for_levels(levels)
+
+    def _queue_keys_for_levels(self, levels):
+        # List every queue key, ordered from highest to lowest priority.
+        keys = []
+        default_added = False
+        for level, score in levels:
+            if score < 0 and not default_added:
+                keys.append(self.queue_key)
+                default_added = True
+            if isinstance(level, bytes):
+                level = level.decode('utf-8')
+            keys.append(self._priority_queue_key(level))
+        if not default_added:
+            keys.append(self.queue_key)
+        return keys
+
+    def enqueue(self, data, priority=None):
+        if not priority:
+            self.conn.lpush(self.queue_key, data)
+        else:
+            pipe = self.conn.pipeline()
+            self._pipe_enqueue(pipe, data, priority)
+            pipe.execute()
+
+    def _pipe_enqueue(self, pipe, data, priority):
+        priority = int(priority)
+        pipe.zadd(self.priority_key, {str(priority): priority})
+        pipe.lpush(self._priority_queue_key(priority), data)
+
+    def enqueue_many(self, data_list, priority=None):
+        if not data_list:
+            return
+        pipe = self.conn.pipeline(transaction=False)
+        self._pipe_enqueue_many(pipe, data_list, priority)
+        pipe.execute()
+
+    def _pipe_enqueue_many(self, pipe, data_list, priority):
+        # Use a variadic LPUSH, split into chunks to avoid sending a single
+        # enormous command, but execute all chunks in one round-trip.
+        if not priority:
+            key = self.queue_key
+        else:
+            priority = int(priority)
+            key = self._priority_queue_key(priority)
+            pipe.zadd(self.priority_key, {str(priority): priority})
+        for i in range(0, len(data_list), self.chunk_size):
+            pipe.lpush(key, *data_list[i:i + self.chunk_size])
 
     def dequeue(self):
-        if self.blocking:
+        accum = self.dequeue_many(1)
+        if accum:
+            return accum[0]
+
+    def _dequeue_blocking(self, keys):
+        if self.reliable:
+            # BRPOPLPUSH can only wait on a single list, so only the default
+            # priority is monitored while blocking. Tasks with other
+            # priorities are picked up on the next read.
             try:
-                return self.conn.brpop(
+                return self.conn.brpoplpush(
                     self.queue_key,
-                    timeout=self.read_timeout)[1]
-            except (ConnectionError, TypeError, IndexError):
-                # Unfortunately, there is no way to differentiate a socket
-                # timing out and a host being unreachable.
+                    self.processing_key,
+                    timeout=self.read_timeout)
+            except ConnectionError:
                 return None
-        else:
-            return self.conn.rpop(self.queue_key)
+        try:
+            return self.conn.brpop(keys, timeout=self.read_timeout)[1]
+        except (ConnectionError, TypeError, IndexError):
+            # Unfortunately, there is no way to differentiate a socket
+            # timing out and a host being unreachable.
+            return None
+
+    def _shares_connection(self, storage):
+        # Whether the storage's queues can be read with a single BRPOP.
+        return (isinstance(storage, RedisStorage) and
+                not storage.reliable and
+                storage.pool.connection_kwargs == self.pool.connection_kwargs)
+
+    def dequeue_any(self, storages):
+        if not self.blocking or not all(self._shares_connection(storage)
+                                        for storage in storages):
+            return super(RedisStorage, self).dequeue_any(storages)
+
+        # Wait on the queues of every storage with a single BRPOP, which pops
+        # from the first non-empty list in the order the keys are given.
+        pipe = self.conn.pipeline()
+        for storage in storages:
+            pipe.zrevrange(storage.priority_key, 0, -1, withscores=True)
+        keys = []
+        owners = {}
+        for storage, levels in zip(storages, pipe.execute()):
+            for key in storage._queue_keys_for_levels(levels):
+                keys.append(key)
+                owners[key] = storage
+
+        try:
+            key, data = self.conn.brpop(keys, timeout=self.read_timeout)
+        except (ConnectionError, TypeError, ValueError):
+            return None
+        if isinstance(key, bytes):
+            key = key.decode('utf-8')
+        return (owners[key], data)
+
+    def _pop_many_keys(self, keys):
+        # Keys and arguments of QUEUE_POP_LUA for the given queue keys.
+        if self.reliable:
+            return keys + [self.processing_key], len(keys)
+        return keys, len(keys)
+
+    def _pop_queues(self, keys, n):
+        pop_keys, nqueues = self._pop_many_keys(keys)
+        return self._pop_many(keys=pop_keys, args=[n, nqueues])
+
+    def dequeue_nowait(self):
+        accum = self._pop_queues(self._queue_keys(), 1)
+        if accum:
+            return accum[0]
+
+    def dequeue_many(self, n):
+        # The priority levels are resolved first, as the script must be given
+        # every key it uses. A task enqueued with a new priority level in the
+        # meantime is read by the next call.
+        keys = self._queue_keys()
+        accum = self._pop_queues(keys, n)
+        if not accum and self.blocking:
+            data = self._dequeue_blocking(keys)
+            if data is not None:
+                accum.append(data)
+        return accum
+
+    def ack(self, data):
+        if self.reliable:
+            self.conn.lrem(self.processing_key, 1, data)
+
+    def heartbeat(self):
+        if self.reliable:
+            pipe = self.conn.pipeline()
+            pipe.set(self.heartbeat_prefix + self.consumer_id, '1',
+                     ex=self.visibility_timeout)
+            pipe.sadd(self.consumers_key, self.consumer_id)
+            pipe.execute()
+
+    def reap(self):
+        if not self.reliable:
+            return []
+        # Orphaned tasks are moved to the processing list of this consumer,
+        # so they are not lost if it dies before enqueueing them again.
+        return self._reap(keys=[self.consumers_key, self.processing_key],
+                          args=[self.heartbeat_prefix,
+                                self.processing_prefix,
+                                self.consumer_id])
 
     def unqueue(self, data):
-        return self.conn.lrem(self.queue_key, data)
+        pipe = self.conn.pipeline()
+        for key in self._queue_keys():
+            pipe.lrem(key, 0, data)
+        return sum(pipe.execute())
 
     def queue_size(self):
-        return self.conn.llen(self.queue_key)
+        pipe = self.conn.pipeline()
+        for key in self._queue_keys():
+            pipe.llen(key)
+        return sum(pipe.execute())
 
     def enqueued_items(self, limit=None):
         limit = limit or -1
-        return self.conn.lrange(self.queue_key, 0, limit)
+        pipe = self.conn.pipeline()
+        for key in self._queue_keys():
+            pipe.lrange(key, 0, limit)
+        accum = []
+        for items in pipe.execute():
+            accum.extend(items)
+        return accum if limit < 0 else accum[:limit + 1]
 
     def flush_queue(self):
-        self.conn.delete(self.queue_key)
+        keys = self._queue_keys()
+        keys.append(self.priority_key)
+        self.conn.delete(*keys)
 
     def add_to_schedule(self, data, ts):
-        self.conn.zadd(self.schedule_key, {data: self.convert_ts(ts)})
+        # Push a token to wake up any scheduler waiting in precise mode. Only
+        # a single token is kept, and it expires if no scheduler is waiting.
+        pipe = self.conn.pipeline()
+        self._pipe_add_to_schedule(pipe, data, ts)
+        pipe.execute()
+
+    # Members of a sorted set are unique, so adding identical data again only
+    # updates its score.
+    reschedule = add_to_schedule
+
+    def _pipe_add_to_schedule(self, pipe, data, ts):
+        pipe.zadd(self.schedule_key, {data: self.convert_ts(ts)})
+        pipe.lpush(self.schedule_wake_key, '1')
+        pipe.ltrim(self.schedule_wake_key, 0, 0)
+        pipe.expire(self.schedule_wake_key, self.notify_ttl)
 
     def read_schedule(self, ts):
         unix_ts = self.convert_ts(ts)
@@ -350,6 +1150,14 @@ class RedisStorage(BaseStorage):
         tasks = self._pop(keys=[self.schedule_key], args=[unix_ts])
         return [] if tasks is None else tasks
 
+    def next_scheduled_ts(self):
+        res = self.conn.zrange(self.schedule_key, 0, 0, withscores=True)
+        if res:
+            return datetime.datetime.fromtimestamp(res[0][1])
+
+    def wait_for_schedule(self, timeout):
+        self._blpop([self.schedule_wake_key], timeout)
+
     def schedule_size(self):
         return self.conn.zcard(self.schedule_key)
 
@@ -363,35 +1171,288 @@ class RedisStorage(BaseStorage):
     def put_data(self, key, value):
         self.conn.hset(self.result_key, key, value)
 
+    def result_notify_key(self, key):
+        return '%s%s' % (self.notify_prefix, key)
+
+    def result_waiter_key(self, key):
+        return '%s%s' % (self.waiter_prefix, key)
+
+    def result_ttl_key(self, key):
+        if isinstance(key, bytes):
+            key = key.decode('utf-8')
+        return '%s.%s' % (self.result_key, key)
+
+    def _result_ttl_expiry(self, ttl):
+        # Score of a result in the TTL index.
+        return time.time() + ttl
+
+    def _live_ttl_results(self):
+        # Keys of the results with a TTL that have not expired.
+        return self.conn.zrangebyscore(self.result_ttl_index_key,
+                                       '(%r' % time.time(), '+inf')
+
+    def put_result(self, key, value, ack=None, ttl=None):
+        # Store the result and, if a client is blocked in wait_for_result(),
+        # push a token onto the task's notification list to wake it up.
+        # Results with a TTL are stored in their own key, as hash fields
+        # cannot expire.
+        pipe = self.conn.pipeline()
+        self._pipe_put_result(pipe, key, value, ack, ttl)
+        pipe.execute()
+
+    def put_result_many(self, items, ttl=None):
+        pipe = self.conn.pipeline()
+        for key, value in items:
+            self._pipe_put_result(pipe, key, value, None, ttl)
+        pipe.execute()
+
+    def _pipe_put_result(self, pipe, key, value, ack, ttl):
+        self._put_result(client=pipe, **self.put_result_params(key, value,
+                                                               ttl))
+        if ack is not None and self.reliable:
+            pipe.lrem(self.processing_key, 1, ack)
+
+    def put_result_params(self, key, value, ttl):
+        return {'keys': [self.result_key, self.result_ttl_key(key),
+                         self.result_notify_key(key),
+                         self.result_waiter_key(key),
+                         self.result_ttl_index_key],
+                'args': [key, value, int(ttl * 1000) if ttl else 0,
+                         self.notify_ttl,
+                         self._result_ttl_expiry(ttl) if ttl else 0]}
+
+    def wait_for_result(self, key, timeout):
+        self.wait_for_results([key], timeout)
+
+    def _pipe_add_waiters(self, pipe, keys, timeout):
+        # Register the client as waiting for the results, so they are
+        # announced when stored, then check for results that were stored
+        # before the registration.
+        ttl = self.notify_ttl + int(math.ceil(timeout))
+        for key in keys:
+            pipe.set(self.result_waiter_key(key), '1', ex=ttl)
+        pipe.hmget(self.result_key, keys)
+        pipe.mget([self.result_ttl_key(key) for key in keys])
+
+    def _results_ready(self, res):
+        values, ttl_values = res[-2:]
+        return any(value is not None for value in values + ttl_values)
+
+    def wait_for_results(self, keys, timeout):
+        pipe = self.conn.pipeline()
+        self._pipe_add_waiters(pipe, keys, timeout)
+        if self._results_ready(pipe.execute()):
+            return
+
+        # BLPOP returns as soon as any of the notification lists is non-empty.
+        notify_keys = [self.result_notify_key(key) for key in keys]
+        res = self._blpop(notify_keys, timeout)
+        if res is not None:
+            key = keys[notify_keys.index(res[0].decode('utf-8'))]
+            self._renotify(**self.renotify_params(key))
+
+    def renotify_params(self, key):
+        return {'keys': [self.result_notify_key(key), self.result_key,
+                         self.result_ttl_key(key)],
+                'args': [key, self.notify_ttl]}
+
     def peek_data(self, key):
         pipe = self.conn.pipeline()
-        pipe.hexists(self.result_key, key)
-        pipe.hget(self.result_key, key)
-        exists, val = pipe.execute()
-        return EmptyData if not exists else val
+        self._pipe_get_data(pipe, key, peek=True)
+        return self._data_from_pipe(pipe.execute())
+
+    def peek_data_many(self, keys):
+        return self._get_data_many(keys, peek=True)
+
+    def pop_data_many(self, keys):
+        return self._get_data_many(keys, peek=False)
+
+    def _get_data_many(self, keys, peek):
+        if not keys:
+            return []
+        # Results with a TTL are stored in their own keys, see put_result().
+        ttl_keys = [self.result_ttl_key(key) for key in keys]
+        pipe = self.conn.pipeline()
+        pipe.hmget(self.result_key, keys)
+        pipe.mget(ttl_keys)
+        if not peek:
+            pipe.hdel(self.result_key, *keys)
+            pipe.delete(*ttl_keys)
+            pipe.delete(*[self.result_notify_key(key) for key in keys])
+            pipe.delete(*[self.result_waiter_key(key) for key in keys])
+            pipe.zrem(self.result_ttl_index_key, *keys)
+        values, ttl_values = pipe.execute()[:2]
+        accum = []
+        for value, ttl_value in zip(values, ttl_values):
+            if value is None:
+                value = EmptyData if ttl_value is None else ttl_value
+            accum.append(value)
+        return accum
 
     def pop_data(self, key):
         pipe = self.conn.pipeline()
+        self._pipe_get_data(pipe, key, peek=False)
+        return self._data_from_pipe(pipe.execute())
+
+    def _pipe_get_data(self, pipe, key, peek):
+        ttl_key = self.result_ttl_key(key)
         pipe.hexists(self.result_key, key)
         pipe.hget(self.result_key, key)
-        pipe.hdel(self.result_key, key)
-        exists, val, n = pipe.execute()
-        return EmptyData if not exists else val
+        pipe.get(ttl_key)
+        if not peek:
+            # The result notification is removed along with the result.
+            pipe.hdel(self.result_key, key)
+            pipe.delete(ttl_key, self.result_notify_key(key),
+                        self.result_waiter_key(key))
+            pipe.zrem(self.result_ttl_index_key, key)
+
+    def _data_from_pipe(self, res):
+        exists, val, ttl_val = res[:3]
+        if exists:
+            return val
+        return EmptyData if ttl_val is None else ttl_val
 
     def has_data_for_key(self, key):
-        return self.conn.hexists(self.result_key, key)
-
-    def put_if_empty(self, key, value):
+        pipe = self.conn.pipeline()
+        pipe.hexists(self.result_key, key)
+        pipe.exists(self.result_ttl_key(key))
+        return any(pipe.execute())
+
+    def put_if_empty(self, key, value, ttl=None):
+        if ttl:
+            if not self.conn.set(self.result_ttl_key(key), value,
+                                 px=int(ttl * 1000), nx=True):
+                return False
+            self.conn.zadd(self.result_ttl_index_key,
+                           {key: self._result_ttl_expiry(ttl)})
+            return True
         return self.conn.hsetnx(self.result_key, key, value)
 
+    def acquire_lease(self, key, lease_id, limit, ttl):
+        return bool(self._acquire_lease(keys=[self.lease_prefix + key],
+                                        args=[lease_id, limit, ttl]))
+
+    def release_lease(self, key, lease_id):
+        return bool(self.conn.zrem(self.lease_prefix + key, lease_id))
+
+    def acquire_token(self, key, rate, period):
+        return float(self._acquire_token(keys=[self.bucket_prefix + key],
+                                         args=[rate, period]))
+
+    def incr_counter(self, key, amount=1):
+        return self._incr_counter(keys=[self.counter_key], args=[key, amount])
+
+    def push_batch(self, key, data):
+        return self.conn.rpush(self.batch_prefix + key, data)
+
+    def pop_batch(self, key, n):
+        return self._pop_batch(keys=[self.batch_prefix + key], args=[n])
+
+    def batch_size(self, key):
+        return self.conn.llen(self.batch_prefix + key)
+
+    def sweep_results(self, limit=None):
+        # Redis removes expired results, only their entries in the TTL index
+        # are left behind.
+        now = '%r' % time.time()
+        if limit is None:
+            return self.conn.zremrangebyscore(self.result_ttl_index_key,
+                                              '-inf', now)
+        keys = self.conn.zrangebyscore(self.result_ttl_index_key, '-inf', now,
+                                       start=0, num=limit)
+        if keys:
+            return self.conn.zrem(self.result_ttl_index_key, *keys)
+        return 0
+
     def result_store_size(self):
-        return self.conn.hlen(self.result_key)
+        pipe = self.conn.pipeline()
+        pipe.hlen(self.result_key)
+        pipe.zcount(self.result_ttl_index_key, '(%r' % time.time(), '+inf')
+        return sum(pipe.execute())
 
     def result_items(self):
-        return self.conn.hgetall(self.result_key)
+        accum = self.conn.hgetall(self.result_key)
+        keys = self._live_ttl_results()
+        for i in range(0, len(keys), self.chunk_size):
+            chunk = keys[i:i + self.chunk_size]
+            values = self.conn.mget([self.result_ttl_key(key)
+                                     for key in chunk])
+            for key, value in zip(chunk, values):
+                if value is not None:
+                    accum[key] = value
+        return accum
 
     def flush_results(self):
-        self.conn.delete(self.result_key)
+        keys = self.conn.zrange(self.result_ttl_index_key, 0, -1)
+        for i in range(0, len(keys), self.chunk_size):
+            self.conn.delete(*[self.result_ttl_key(key)
+                               for key in keys[i:i + self.chunk_size]])
+        self.conn.delete(self.result_key, self.result_ttl_index_key)
+
+    def revocation_keys(self):
+        # Keys of the revocation scripts: the revocation hash, followed by the
+        # result hash where older versions of huey stored revocations.
+        return [self.revoke_key, self.result_key, self.revoke_migrated_key]
+
+    def add_revocation(self, key, value):
+        self._revoke(keys=self.revocation_keys(), args=[key, value])
+
+    def remove_revocation(self, key):
+        pipe = self.conn.pipeline()
+        pipe.hdel(self.revoke_key, key)
+        pipe.hdel(self.result_key, key)
+        return any(pipe.execute())
+
+    def get_revocations(self, keys):
+        res = self._revoked(keys=self.revocation_keys(), args=keys)
+        return self._revocations_from_script(keys, res)
+
+    def _revocations_from_script(self, keys, res):
+        if not res:
+            return [EmptyData] * len(keys)
+        return [EmptyData if value is None else value for value in res]
+
+    def _legacy_revocation_keys(self):
+        for pattern in ('r:*', 'rt:*'):
+            for key, _ in self.conn.hscan_iter(self.result_key, pattern,
+                                               self.chunk_size):
+                yield key
+
+    def migrate_revocations(self):
+        """
+        Move the revocations stored in the result hash by older versions of
+        huey to the revocation hash. Once this has been run, revocations are
+        no longer read from or written to the result hash, so it should only
+        be run once every consumer and producer has been upgraded.
+
+        :return: Number of revocations moved.
+        """
+        # The revocations are copied before the result hash stops being
+        # read, and removed from it afterwards, along with any revocation
+        # written in the meantime.
+        self._move_legacy_revocations(delete=False)
+        self.conn.set(self.revoke_migrated_key, '1')
+        return self._move_legacy_revocations(delete=True)
+
+    def _move_legacy_revocations(self, delete):
+        keys = list(self._legacy_revocation_keys())
+        for i in range(0, len(keys), self.chunk_size):
+            chunk = keys[i:i + self.chunk_size]
+            pipe = self.conn.pipeline()
+            for key, value in zip(chunk,
+                                  self.conn.hmget(self.result_key, chunk)):
+                if value is not None:
+                    pipe.hsetnx(self.revoke_key, key, value)
+            if delete:
+                pipe.hdel(self.result_key, *chunk)
+            pipe.execute()
+        return len(keys)
+
+    def flush_revocations(self):
+        keys = list(self._legacy_revocation_keys())
+        for i in range(0, len(keys), self.chunk_size):
+            self.conn.hdel(self.result_key, *keys[i:i + self.chunk_size])
+        self.conn.delete(self.revoke_key)
 
     def put_error(self, metadata):
         self.conn.lpush(self.error_key, metadata)
@@ -436,7 +1497,9 @@ class _EventIterator(object):
 
 class RedisHuey(Huey):
     def get_storage(self, read_timeout=1, max_errors=1000,
-                    connection_pool=None, url=None, **connection_params):
+                    connection_pool=None, url=None, reliable=False,
+                    visibility_timeout=60, consumer_id=None,
+                    **connection_params):
         return RedisStorage(
             name=self.name,
             blocking=self.blocking,
@@ -444,4 +1507,7 @@ class RedisHuey(Huey):
             max_errors=max_errors,
             connection_pool=connection_pool,
             url=url,
+            reliable=reliable,
+            visibility_timeout=visibility_timeout,
+            consumer_id=consumer_id,
             **connection_params)
@@ -4,10 +4,16 @@ from huey.tests.test_hooks import *
 from huey.tests.test_pipeline import *
 from huey.tests.test_queue import *
 from huey.tests.test_registry import *
+from huey.tests.test_serializer import *
 from huey.tests.test_storage import *
 from huey.tests.test_utils import *
 from huey.tests.test_wrapper import *
 
+try:
+    from huey.tests.test_asyncio import *
+except (ImportError, SyntaxError):
+    print('skipping asyncio tests, missing dependencies')
+
 try:
     from huey.tests.test_sqlite import *
 except ImportError:
@@ -0,0 +1,310 @@
+import asyncio
+import threading
+import time
+
+from huey.api import ResultGroup
+from huey.api import TaskResultWrapper
+from huey.consumer import Consumer
+from huey.contrib.asyncio import AsyncHuey
+from huey.contrib.asyncio import AsyncRedisStorage
+from huey.contrib.asyncio import AsyncStorage
+from huey.contrib.asyncio import AsyncWorker
+from huey.contrib.asyncio import get_async_storage
+from huey.exceptions import DataStoreTimeout
+from huey.exceptions import TaskException
+from huey.tests.base import HueyTestCase
+from huey.tests.base import test_huey
+
+
+state = {}
+
+@test_huey.task()
+async def async_sleep_add(a, b):
+    await asyncio.sleep(0.2)
+    return a + b
+
+@test_huey.task()
+async def async_blow_up():
+    await asyncio.sleep(0)
+    raise Exception('blowed up')
+
+@test_huey.task()
+def async_client_add(a, b):
+    return a + b
+
+@test_huey.task()
+def async_client_fail():
+    raise Exception('failed')
+
+@test_huey.task(concurrency=1)
+async def async_limited(k, v):
+    state[k] = v
+
+@test_huey.task(rate_limit='1/m')
+async def async_throttled(k, v):
+    state[k] = v
+
+@test_huey.task(unique=True)
+def async_client_unique(a):
+    return a
+
+@test_huey.batch_task(max_size=2)
+async def async_batch(calls):
+    await asyncio.sleep(0)
+    return [k for k, in calls]
+
+@test_huey.task()
+def sync_in_loop(k, v):
+    state[k] = v
+    return v
+
+
+class TestAsyncWorker(HueyTestCase):
+    def get_consumer(self, **kwargs):
+        kwargs.setdefault('worker_type', 'asyncio')
+        return Consumer(self.huey, **kwargs)
+
+    def setUp(self):
+        super(TestAsyncWorker, self).setUp()
+        state.clear()
+        self.async_worker = self.consumer.worker_threads[0][0]
+        self.async_worker.initialize()
+
+    def test_consumer_workers(self):
+        self.assertEqual(len(self.consumer.worker_threads), 1)
+        self.assertTrue(isinstance(self.async_worker, AsyncWorker))
+        self.assertEqual(self.async_worker.concurrency, 2)
+        self.assertTrue(isinstance(self.async_worker.storage,
+                                   AsyncRedisStorage))
+        self.assertTrue(async_sleep_add.task_class.is_async)
+        self.assertFalse(sync_in_loop.task_class.is_async)
+        self.async_worker.shutdown()
+
+    def test_concurrent_tasks(self):
+        r1 = async_sleep_add(1, 2)
+        r2 = async_sleep_add(3, 4)
+        r3 = async_sleep_add(5, 6)
+
+        start = time.time()
+        # Both slots are filled, the third task remains in the queue.
+        self.async_worker.loop()
+        self.async_worker.loop()
+        self.assertEqual(len(self.async_worker._running), 2)
+        self.assertEqual(self.huey.pending_count(), 1)
+
+        # The next read waits until a slot is free.
+        self.async_worker.loop()
+        self.assertEqual(self.huey.pending_count(), 0)
+        self.async_worker.shutdown()
+        self.assertFalse(self.async_worker._running)
+
+        # The tasks ran concurrently, two at a time.
+        self.assertTrue(time.time() - start < 0.55)
+        self.assertEqual(r1.get(), 3)
+        self.assertEqual(r2.get(), 7)
+        self.assertEqual(r3.get(), 11)
+
+    def test_sync_task(self):
+        res = sync_in_loop('k1', 'v1')
+        self.async_worker.loop()
+        self.async_worker.shutdown()
+        self.assertEqual(state, {'k1': 'v1'})
+        self.assertEqual(res.get(), 'v1')
+
+    def test_task_error(self):
+        res = async_blow_up()
+        self.async_worker.loop()
+        self.async_worker.shutdown()
+        self.assertEqual(self.huey.result_count(), 1)
+        self.assertEqual(len(self.huey.errors()), 1)
+        self.assertRaises(Exception, res.get)
+
+    def test_revoked(self):
+        res = sync_in_loop('k1', 'v1')
+        self.huey.revoke(res.task, revoke_once=True)
+        self.async_worker.loop()
+        self.async_worker.shutdown()
+        self.assertEqual(state, {})
+
+        # The task was only revoked for a single run, so it is restored.
+        self.assertFalse(res.is_revoked())
+
+    def test_concurrency_limit(self):
+        storage = self.huey.storage
+        key = 'concurrency.queue_task_async_limited'
+        storage.conn.delete(storage.lease_prefix + key)
+        storage.acquire_lease(key, 'other', 1, 60)
+        res = async_limited('k1', 'v1')
+        self.async_worker.loop()
+        self.async_worker.shutdown()
+        self.assertEqual(state, {})
+        self.assertTaskEvents(('deferred', res.task), ('scheduled', res.task))
+        self.assertEqual(self.huey.scheduled_count(), 1)
+
+        storage.release_lease(key, 'other')
+        task, = self.huey.scheduled()
+        self.huey.storage.flush_schedule()
+        task.execute_time = None
+        self.huey.enqueue(task)
+        self.async_worker.initialize()
+        self.async_worker.loop()
+        self.async_worker.shutdown()
+        self.assertEqual(state, {'k1': 'v1'})
+        self.assertEqual(storage.conn.zcard(storage.lease_prefix + key), 0)
+
+    def test_rate_limit(self):
+        storage = self.huey.storage
+        storage.conn.delete(storage.bucket_prefix +
+                            'rate_limit.queue_task_async_throttled')
+        r1 = async_throttled('k1', 'v1')
+        r2 = async_throttled('k2', 'v2')
+        self.async_worker.loop()
+        self.async_worker.loop()
+        self.async_worker.shutdown()
+        self.assertEqual(state, {'k1': 'v1'})
+        self.assertTaskEvents(
+            ('started', r1.task), ('finished', r1.task),
+            ('deferred', r2.task), ('scheduled', r2.task))
+        self.assertEqual(self.huey.scheduled_count(), 1)
+        storage.conn.delete(storage.bucket_prefix +
+                            'rate_limit.queue_task_async_throttled')
+
+    def test_batch_task(self):
+        storage = self.huey.storage
+        storage.conn.delete(storage.batch_prefix + 'queue_task_async_batch')
+        r1, r2 = async_batch.map(['k1', 'k2'])
+        self.assertEqual(self.huey.pending_count(), 2)
+        self.huey.dequeue()
+        self.async_worker.loop()
+        self.async_worker.shutdown()
+        self.assertEqual(r1.get(), 'k1')
+        self.assertEqual(r2.get(), 'k2')
+
+    def test_events(self):
+        res = async_sleep_add(1, 2)
+        self.async_worker.loop()
+        self.async_worker.shutdown()
+        self.assertTaskEvents(('started', res.task), ('finished', res.task))
+
+
+class TestAsyncStorage(HueyTestCase):
+    def test_get_async_storage(self):
+        self.assertTrue(isinstance(get_async_storage(self.huey.storage),
+                                   AsyncRedisStorage))
+
+    def test_executor_storage(self):
+        # The generic implementation runs the storage methods in a
+        # thread-pool, and can be used with any storage.
+        storage = AsyncStorage(self.huey.storage)
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(storage.enqueue(b'msg'))
+            self.assertEqual(loop.run_until_complete(storage.dequeue_many(5)),
+                             [b'msg'])
+        finally:
+            loop.close()
+
+
+class TestAsyncHuey(HueyTestCase):
+    def setUp(self):
+        super(TestAsyncHuey, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        self.huey._aio = None
+
+    def tearDown(self):
+        self.run_async(self.huey.aio.close())
+        self.huey._aio = None
+        self.loop.close()
+        super(TestAsyncHuey, self).tearDown()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def execute_next(self):
+        self.worker(self.huey.dequeue())
+
+    def test_aio(self):
+        self.assertTrue(isinstance(self.huey.aio, AsyncHuey))
+        self.assertTrue(self.huey.aio is self.huey.aio)
+        self.assertTrue(isinstance(self.huey.aio.storage, AsyncRedisStorage))
+
+    def test_aio_many_loops(self):
+        async def enqueue():
+            res = await async_client_add.aenqueue(1, 2)
+            return res.task.task_id
+
+        # Each event loop gets its own connections, so the client can be used
+        # from consecutive calls to asyncio.run().
+        t1 = asyncio.run(enqueue())
+        t2 = asyncio.run(enqueue())
+        self.assertEqual(sorted(task.task_id for task in self.huey.pending()),
+                         sorted([t1, t2]))
+
+    def test_aenqueue_aget(self):
+        res = self.run_async(async_client_add.aenqueue(1, 2))
+        self.assertTrue(isinstance(res, TaskResultWrapper))
+        self.assertEqual(self.huey.pending_count(), 1)
+
+        # Not ready yet.
+        self.assertTrue(self.run_async(res.aget(blocking=False)) is None)
+        self.execute_next()
+        self.assertEqual(self.run_async(res.aget(preserve=True)), 3)
+
+        # The result is cached by the wrapper, and was preserved in the
+        # result store.
+        self.assertEqual(res.get(), 3)
+        self.assertEqual(self.huey.result_count(), 1)
+        self.assertEqual(self.run_async(self.huey.aio.get(res.task.task_id)),
+                         3)
+        self.assertEqual(self.huey.result_count(), 0)
+
+    def test_aget_waits(self):
+        res = self.run_async(async_client_add.aenqueue(3, 4))
+        t = threading.Timer(0.3, self.execute_next)
+        t.start()
+        start = time.time()
+        self.assertEqual(self.run_async(res.aget(timeout=5, backoff=50,
+                                           max_delay=5)), 7)
+        self.assertTrue(time.time() - start < 2)
+        t.join()
+
+    def test_aget_timeout(self):
+        res = self.run_async(async_client_add.aenqueue(1, 2))
+        coro = res.aget(timeout=0.1, revoke_on_timeout=True)
+        self.assertRaises(DataStoreTimeout, self.run_async, coro)
+        self.assertTrue(res.is_revoked())
+
+    def test_aget_error(self):
+        res = self.run_async(async_client_fail.aenqueue())
+        self.execute_next()
+        self.assertRaises(TaskException, self.run_async, res.aget())
+
+    def test_enqueue_many(self):
+        tasks = [async_client_add.s(i, i) for i in range(3)]
+        group = self.run_async(self.huey.aio.enqueue_many(tasks))
+        self.assertTrue(isinstance(group, ResultGroup))
+        self.assertEqual(self.huey.pending_count(), 3)
+        for _ in range(3):
+            self.execute_next()
+        self.assertEqual([self.run_async(r.aget()) for r in group], [0, 2, 4])
+
+    def test_aenqueue_unique(self):
+        r1 = self.run_async(async_client_unique.aenqueue(1))
+        r2 = self.run_async(async_client_unique.aenqueue(1))
+        self.assertEqual(r2.task.task_id, r1.task.task_id)
+        self.assertEqual(self.huey.pending_count(), 1)
+
+        task = self.huey.dequeue()
+        self.worker(task)
+        self.assertEqual(self.run_async(r2.aget()), 1)
+        r3 = self.run_async(async_client_unique.aenqueue(1))
+        self.assertNotEqual(r3.task.task_id, r1.task.task_id)
+
+    def test_executor_storage(self):
+        # The facade can be used with storages that have no native asyncio
+        # implementation.
+        aio = AsyncHuey(self.huey)
+        aio.storage = AsyncStorage(self.huey.storage)
+        res = self.run_async(aio.enqueue(async_client_add.s(2, 3)))
+        self.execute_next()
+        self.assertEqual(self.run_async(aio.get_result(res)), 5)
@@ -1,16 +1,26 @@
 import contextlib
 import datetime
+import signal
 import threading
 import time
 from functools import wraps
+from multiprocessing import Pipe
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
 
+from huey import RedisHuey
 from huey import crontab
 from huey.consumer import Consumer
 from huey.consumer import Scheduler
 from huey.consumer import Worker
+from huey.exceptions import CancelExecution
+from huey.exceptions import ConfigurationError
 from huey.exceptions import DataStoreTimeout
 from huey.exceptions import RetryTask
 from huey.exceptions import TaskException
+from huey.exceptions import TaskTimeoutException
 from huey.tests.base import b
 from huey.tests.base import BrokenHuey
 from huey.tests.base import CaptureLogs
@@ -81,6 +91,60 @@ def hourly_task2():
 def locked_task(a, b):
     return a + b
 
+@test_huey.task(retries=1, timeout=0.1)
+def slow_task(n):
+    # Busy-wait, as time.sleep() is patched out by the tests.
+    started.set()
+    end = time.time() + n
+    while time.time() < end:
+        pass
+    return n
+
+started = threading.Event()
+
+@test_huey.task(timeout=0.1)
+def stuck_task(n):
+    end = time.time() + n
+    while time.time() < end:
+        pass
+
+@test_huey.task(retries=1, concurrency=1, concurrency_delay=30)
+def limited_task(k, v):
+    state[k] = v
+    return v
+
+@test_huey.task(unique=True)
+def unique_task(k, v):
+    state[k] = v
+    return v
+
+@test_huey.task(debounce=5)
+def debounced_task(k, v):
+    state[k] = state.get(k, 0) + v
+    return state[k]
+
+@test_huey.batch_task(max_size=3, max_wait=10)
+def batch_add(calls):
+    state.setdefault('batches', []).append(calls)
+    if any(a is None for a, b in calls):
+        raise Exception('invalid call')
+    return [a + b for a, b in calls]
+
+@test_huey.task(retries=1, rate_limit='2/m')
+def throttled_task(k, v):
+    state[k] = v
+    return v
+
+@test_huey.task(concurrency=1, concurrency_delay=30, rate_limit='2/m')
+def limited_throttled_task(k, v):
+    state[k] = v
+    return v
+
+@test_huey.task()
+def chord_callback(k, values):
+    state[k] = values
+    return sum(values)
+
 
 class CrashableWorker(Worker):
     def __init__(self, *args, **kwargs):
@@ -253,6 +317,587 @@ class TestConsumerAPIs(ConsumerTestCase):
             ('started', res.task),
             ('finished', res.task))
 
+    def test_prefetch(self):
+        self.consumer.stop()
+        self.consumer = self.get_consumer(prefetch=2)
+        worker = self.consumer._create_worker()
+
+        r1 = modify_state('k1', 'v1')
+        r2 = modify_state('k2', 'v2')
+        r3 = modify_state('k3', 'v3')
+
+        # Two tasks are read from the queue, but only one is executed.
+        worker.loop()
+        self.assertEqual(state, {'k1': 'v1'})
+        self.assertEqual(len(self.huey), 1)
+
+        # The buffered task is executed without going back to the queue.
+        worker.loop()
+        self.assertEqual(state, {'k1': 'v1', 'k2': 'v2'})
+        self.assertEqual(len(self.huey), 1)
+
+        # Un-run prefetched tasks are returned to the queue on shutdown.
+        worker.loop()
+        self.assertEqual(len(self.huey), 0)
+        modify_state('k4', 'v4')
+        modify_state('k5', 'v5')
+        worker.loop()
+        self.assertEqual(len(self.huey), 0)
+        worker.shutdown()
+        self.assertEqual(len(self.huey), 1)
+        self.assertEqual(self.huey.dequeue().data, (('k5', 'v5'), {}))
+        self.assertEqual(state, {'k1': 'v1', 'k2': 'v2', 'k3': 'v3',
+                                 'k4': 'v4'})
+
+    def test_worker_recycling(self):
+        self.consumer.stop()
+        self.consumer = self.get_consumer(workers=1, max_tasks_per_worker=2,
+                                          check_worker_health=False)
+        self.assertTrue(self.consumer._health_check)
+        worker, _ = self.consumer.worker_threads[0]
+
+        r1 = modify_state('k1', 'v1')
+        r2 = modify_state('k2', 'v2')
+        r3 = modify_state('k3', 'v3')
+        worker.loop()
+        self.assertFalse(worker.finished)
+        worker.loop()
+        self.assertTrue(worker.finished)
+        self.assertTrue(worker.recycle_flag.is_set())
+        self.assertEqual(state, {'k1': 'v1', 'k2': 'v2'})
+        self.assertEqual(len(self.huey), 1)
+
+        self.assertTaskEvents(
+            ('started', r1.task), ('finished', r1.task),
+            ('started', r2.task), ('finished', r2.task))
+        event = next(self.events)
+        self.assertEqual(event['status'], 'worker-recycling')
+        self.assertEqual(event['tasks'], 2)
+
+        # The worker is replaced, and the new worker runs the queued task.
+        self.assertFalse(self.consumer.check_worker_health())
+        event = next(self.events)
+        self.assertEqual(event['status'], 'worker-recycled')
+        self.assertEqual(event['recycled'], 1)
+
+        new_worker, worker_t = self.consumer.worker_threads[0]
+        self.assertFalse(new_worker is worker)
+        self.assertEqual(r3.get(blocking=True, timeout=5), 'v3')
+        self.consumer.stop()
+        worker_t.join()
+        self.consumer.scheduler.join()
+
+    def test_worker_recycling_memory(self):
+        consumer = self.get_consumer(max_worker_memory=1)
+        self.assertTrue(consumer.max_worker_memory is None)
+
+        worker = Worker(self.huey, 0.1, 1, 1.15, True, max_memory=1)
+        modify_state('k1', 'v1')
+        worker.loop()
+        self.assertTrue(worker.finished)
+
+    def test_task_timeout(self):
+        worker, worker_t = self.consumer.worker_threads[0]
+        self.assertEqual(worker.get_timeout(slow_task.task_class()), 0.1)
+        self.assertTrue(worker.get_timeout(modify_state.task_class()) is None)
+        worker.timeout = 5
+        self.assertEqual(worker.get_timeout(modify_state.task_class()), 5)
+        worker.timeout = None
+
+        started.clear()
+        res = slow_task(10)
+        t = threading.Thread(target=worker.loop)
+        t.daemon = True
+        t.start()
+        self.consumer.worker_threads[0] = (worker, t)
+        started.wait()
+        self.assertEqual(worker.get_deadline()[1].task_id, res.task.task_id)
+
+        # The consumer interrupts the worker thread once the deadline passes.
+        self.consumer.check_timeouts()
+        self.assertFalse(worker.deadline is None)
+        self._sleep(0.2)
+        self.consumer.check_timeouts()
+        t.join(5)
+        self.assertFalse(t.is_alive())
+        self.assertTrue(worker.get_deadline() is None)
+
+        self.assertTaskEvents(('started', res.task), ('timeout', res.task))
+        self.assertRaises(TaskException, res.get)
+
+        # The task is retried.
+        self.assertEqual(len(self.huey), 1)
+        task = self.huey.dequeue()
+        self.assertEqual(task.task_id, res.task.task_id)
+        self.assertEqual(task.retries, 0)
+
+    def test_task_timeout_after_finish(self):
+        # A task that is interrupted after it finished, but before its
+        # deadline was cleared, keeps its result and is not retried.
+        worker, _ = self.consumer.worker_threads[0]
+        clear_deadline = worker.clear_deadline
+
+        def late_clear_deadline():
+            clear_deadline()
+            raise TaskTimeoutException('late')
+
+        res = slow_task(0)
+        task = self.huey.dequeue()
+        worker.clear_deadline = late_clear_deadline
+        try:
+            worker.process_task(task, datetime.datetime.now())
+        finally:
+            del worker.clear_deadline
+
+        self.assertTaskEvents(('started', task), ('finished', task))
+        self.assertEqual(res.get(), 0)
+        self.assertEqual(len(self.huey), 0)
+
+    def test_task_timeout_cancelled(self):
+        # An interruption that is still pending when the deadline is cleared
+        # is cancelled. The thread is blocked in C code, so the exception
+        # cannot be raised before then.
+        worker, _ = self.consumer.worker_threads[0]
+        event = threading.Event()
+        raised = []
+
+        def run():
+            try:
+                event.wait()
+                for _ in range(1000):
+                    pass
+            except TaskTimeoutException:
+                raised.append(True)
+
+        t = threading.Thread(target=run)
+        t.start()
+        worker.set_deadline(time.time() - 1, 'task')
+        self.consumer.worker_threads[0] = (worker, t)
+        self.consumer.check_timeouts()
+        self.assertTrue(worker.get_deadline() is None)
+        self.assertTrue(worker.cancel_interrupt is not None)
+
+        worker.clear_deadline()
+        self.assertTrue(worker.cancel_interrupt is None)
+        event.set()
+        t.join(5)
+        self.assertEqual(raised, [])
+
+    def test_task_timeout_process(self):
+        # Workers running in a separate process report their deadline through
+        # a pipe, and are terminated when the task times out.
+        worker = Worker(self.huey, 0.1, 1, 1.15, True,
+                        deadline_pipe=Pipe(duplex=False))
+        res = slow_task(10)
+        task = self.huey.dequeue()
+        worker.set_deadline(time.time() + 0.1, task)
+        self.assertTrue(worker.deadline is None)
+        deadline, timed_out = worker.get_deadline()
+        self.assertEqual(timed_out.task_id, task.task_id)
+        self.assertEqual(timed_out.data, ((10,), {}))
+        worker.set_deadline(None)
+        self.assertTrue(worker.get_deadline() is None)
+
+        worker.handle_timeout(timed_out)
+        self.assertTaskEvents(('timeout', res.task), ('retrying', res.task))
+        self.assertRaises(TaskException, res.get)
+        self.assertEqual(len(self.huey), 1)
+        self.assertEqual(self.huey.dequeue().retries, 0)
+
+    def test_task_timeout_process_prefetch(self):
+        # Tasks prefetched by a worker process are returned to the queue when
+        # the process is terminated.
+        worker = Worker(self.huey, 0.1, 1, 1.15, True, prefetch=3,
+                        deadline_pipe=Pipe(duplex=False))
+        res = slow_task(10)
+        r1 = modify_state('k1', 'v1')
+        r2 = modify_state('k2', 'v2')
+        task = worker.dequeue()
+        self.assertEqual(len(worker._prefetched), 2)
+        self.assertEqual(len(self.huey), 0)
+        worker.set_deadline(time.time() + 0.1, task)
+
+        # Consumer-side copy of the worker.
+        consumer_worker = Worker(self.huey, 0.1, 1, 1.15, True,
+                                 deadline_pipe=worker._deadline_pipe)
+        _, timed_out = consumer_worker.get_deadline()
+        self.assertEqual(len(consumer_worker._prefetched), 2)
+        consumer_worker.handle_timeout(timed_out)
+        self.assertEqual(len(consumer_worker._prefetched), 0)
+
+        tasks = [self.huey.dequeue() for _ in range(len(self.huey))]
+        self.assertEqual(sorted(t.task_id for t in tasks),
+                         sorted(r.task.task_id for r in (res, r1, r2)))
+
+    def test_task_timeout_process_worker(self):
+        # Worker processes inherit the consumer's signal handlers, but are
+        # still stopped when their task times out, and replaced.
+        time.sleep = self._sleep
+        sigterm_handler = signal.getsignal(signal.SIGTERM)
+        consumer = Consumer(self.huey, workers=1, worker_type='process',
+                            periodic=False)
+        consumer.start()
+        try:
+            worker, worker_t = consumer.worker_threads[0]
+            res = stuck_task(10)
+            start = time.time()
+            while consumer.worker_threads[0][1] is worker_t:
+                self.assertTrue(time.time() - start < 5)
+                consumer.check_timeouts()
+                time.sleep(0.05)
+
+            self.assertFalse(worker_t.is_alive())
+            self.assertTrue(consumer.worker_threads[0][1].is_alive())
+            self.assertRaises(TaskException, res.get)
+        finally:
+            consumer.stop()
+            for _, process in consumer.worker_threads + consumer.schedulers:
+                process.join(5)
+            signal.signal(signal.SIGTERM, sigterm_handler)
+
+    def test_autoscale(self):
+        self.consumer.stop()
+        self.consumer = consumer = self.get_consumer(
+            workers=1, max_workers=3, check_worker_health=False)
+        self.assertTrue(consumer._health_check)
+        self.assertEqual(len(consumer.worker_threads), 1)
+
+        # The number of pending tasks exceeds the number of workers, but the
+        # consumer only scales up after consecutive checks.
+        for i in range(3):
+            modify_state('k%s' % i, 'v%s' % i)
+        consumer.autoscale()
+        self.assertEqual(len(consumer.worker_threads), 1)
+        consumer.autoscale()
+        self.assertEqual(len(consumer.worker_threads), 2)
+        event = next(self.events)
+        self.assertEqual(event['status'], 'workers-scaled')
+        self.assertEqual(event['workers'], 2)
+        self.assertEqual(event['previous'], 1)
+        self.assertEqual(event['pending'], 3)
+
+        # The new worker was started and runs the pending tasks.
+        worker, worker_t = consumer.worker_threads[1]
+        start = time.time()
+        while self.huey.result_count() < 3 and time.time() - start < 5:
+            self._sleep(0.01)
+        self.assertEqual(self.huey.result_count(), 3)
+        self.assertEqual(len(self.huey), 0)
+        self.assertTrue(consumer._wait_times.qsize() > 0)
+
+        # Once idle, workers are retired one at a time.
+        consumer.scale_down_checks = 2
+        consumer.autoscale()
+        self.assertEqual(len(consumer.worker_threads), 2)
+        consumer.autoscale()
+        self.assertEqual(len(consumer.worker_threads), 1)
+        self.assertEqual(consumer._retiring, [(worker, worker_t)])
+        worker_t.join(5)
+        self.assertFalse(worker_t.is_alive())
+        self.assertTrue(worker.finished)
+
+        # The retired worker is dropped, and the minimum is respected.
+        consumer.autoscale()
+        consumer.autoscale()
+        self.assertEqual(consumer._retiring, [])
+        self.assertEqual(len(consumer.worker_threads), 1)
+
+    def test_task_wait_time(self):
+        worker = Worker(self.huey, 0.1, 1, 1.15, True, wait_times=Queue())
+        res = modify_state('k', 'v')
+        task = self.huey.dequeue()
+        self.assertTrue(time.time() - task.enqueued_at < 5)
+        task.enqueued_at -= 2
+        worker.handle_task(task, datetime.datetime.utcnow())
+        self.assertTrue(worker.wait_times.get_nowait() >= 2)
+
+    def test_concurrency_limit(self):
+        storage = self.huey.storage
+        key = storage.lease_prefix + 'concurrency.queue_task_limited_task'
+        storage.conn.delete(key)
+
+        # Another consumer holds the only slot, so the task is deferred to
+        # the schedule without using up its retries.
+        self.assertTrue(storage.acquire_lease(
+            'concurrency.queue_task_limited_task', 'other', 1, 60))
+        res = limited_task('k1', 'v1')
+        task = self.huey.dequeue()
+        now = datetime.datetime.utcnow()
+        self.worker(task, now)
+        self.assertEqual(state, {})
+        self.assertTaskEvents(('deferred', res.task), ('scheduled', res.task))
+        self.assertEqual(len(self.huey), 0)
+
+        scheduled, = self.huey.scheduled()
+        self.assertEqual(scheduled.task_id, res.task.task_id)
+        self.assertEqual(scheduled.retries, 1)
+        self.assertEqual(scheduled.execute_time,
+                         now + datetime.timedelta(seconds=30))
+
+        # Once the slot is free, the task runs and releases its slot.
+        storage.release_lease('concurrency.queue_task_limited_task', 'other')
+        self.worker(scheduled, now + datetime.timedelta(seconds=30))
+        self.assertEqual(state, {'k1': 'v1'})
+        self.assertEqual(res.get(), 'v1')
+        self.assertEqual(storage.conn.zcard(key), 0)
+
+    def test_rate_limit(self):
+        storage = self.huey.storage
+        key = storage.bucket_prefix + 'rate_limit.queue_task_throttled_task'
+        storage.conn.delete(key)
+
+        now = datetime.datetime.utcnow()
+        r1 = throttled_task('k1', 'v1')
+        r2 = throttled_task('k2', 'v2')
+        r3 = throttled_task('k3', 'v3')
+        for _ in range(3):
+            self.worker(self.huey.dequeue(), now)
+
+        # The first two calls run, the third is deferred until the next token
+        # is available, 30 seconds later, without using up its retries.
+        self.assertEqual(state, {'k1': 'v1', 'k2': 'v2'})
+        self.assertTaskEvents(
+            ('started', r1.task), ('finished', r1.task),
+            ('started', r2.task), ('finished', r2.task),
+            ('deferred', r3.task), ('scheduled', r3.task))
+        scheduled, = self.huey.scheduled()
+        self.assertEqual(scheduled.task_id, r3.task.task_id)
+        self.assertEqual(scheduled.retries, 1)
+        delay = (scheduled.execute_time - now).total_seconds()
+        self.assertTrue(29 < delay <= 30)
+        storage.conn.delete(key)
+
+    def test_rate_limit_concurrency(self):
+        # A task deferred by its concurrency limit does not use up a token.
+        storage = self.huey.storage
+        name = 'queue_task_limited_throttled_task'
+        bucket_key = storage.bucket_prefix + 'rate_limit.' + name
+        lease_key = storage.lease_prefix + 'concurrency.' + name
+        storage.conn.delete(bucket_key, lease_key)
+
+        self.assertTrue(storage.acquire_lease('concurrency.' + name, 'other',
+                                              1, 60))
+        res = limited_throttled_task('k1', 'v1')
+        self.worker(self.huey.dequeue())
+        self.assertTaskEvents(('deferred', res.task), ('scheduled', res.task))
+        self.assertEqual(storage.conn.exists(bucket_key), 0)
+
+        # Once the slot is free, the task uses a token and runs.
+        storage.release_lease('concurrency.' + name, 'other')
+        scheduled, = self.huey.scheduled()
+        self.worker(scheduled, scheduled.execute_time)
+        self.assertEqual(res.get(), 'v1')
+        self.assertEqual(storage.conn.exists(bucket_key), 1)
+        self.assertEqual(storage.conn.zcard(lease_key), 0)
+        storage.conn.delete(bucket_key)
+
+    def test_unique_task(self):
+        r1 = unique_task('k1', 'v1')
+        r2 = unique_task('k1', 'v1')
+        self.assertEqual(r2.task.task_id, r1.task.task_id)
+        self.assertEqual(len(self.huey), 1)
+
+        # The task is no longer pending once it starts running.
+        self.worker(self.huey.dequeue())
+        self.assertEqual(state, {'k1': 'v1'})
+        self.assertEqual(r2.get(), 'v1')
+        r3 = unique_task('k1', 'v1')
+        self.assertNotEqual(r3.task.task_id, r1.task.task_id)
+
+        # Revoked tasks are no longer pending either.
+        r3.revoke()
+        self.worker(self.huey.dequeue())
+        r4 = unique_task('k1', 'v1')
+        self.assertNotEqual(r4.task.task_id, r3.task.task_id)
+        self.assertEqual(len(self.huey), 1)
+
+    def test_debounce(self):
+        start = datetime.datetime.utcnow()
+        results = [debounced_task('k1', 1) for _ in range(3)]
+        r2 = debounced_task('k2', 1)
+
+        # Identical calls share a single schedule entry and result, due 5
+        # seconds after the last call.
+        self.assertEqual(len(set(r.task.task_id for r in results)), 1)
+        self.assertNotEqual(r2.task.task_id, results[0].task.task_id)
+        self.assertEqual(len(self.huey), 0)
+        self.assertEqual(self.huey.scheduled_count(), 2)
+        t1, t2 = self.huey.scheduled()
+        self.assertTrue(t1.execute_time is None)
+
+        scheduler = self.consumer._create_scheduler()
+        scheduler.loop(start + datetime.timedelta(seconds=4))
+        self.assertEqual(len(self.huey), 0)
+        scheduler.loop(datetime.datetime.utcnow() +
+                       datetime.timedelta(seconds=5))
+        self.assertEqual(len(self.huey), 2)
+        self.worker(self.huey.dequeue())
+        self.worker(self.huey.dequeue())
+        self.assertEqual(state, {'k1': 1, 'k2': 1})
+        self.assertEqual(results[2].get(), 1)
+
+    def test_batch_task(self):
+        storage = self.huey.storage
+        key = storage.batch_prefix + 'queue_task_batch_add'
+        storage.conn.delete(key)
+
+        # The first call schedules a batch within max_wait, and filling the
+        # batch enqueues one to run immediately.
+        start = datetime.datetime.utcnow()
+        results = batch_add.map([(1, 2), (3, 4), (5, 6), (7, 8)])
+        self.assertEqual(storage.batch_size('queue_task_batch_add'), 4)
+        delayed, full = self.huey.pending()[::-1]
+        self.assertTrue(delayed.execute_time > start)
+        self.assertTrue(full.execute_time is None)
+
+        self.huey.dequeue()
+        self.worker(self.huey.dequeue())
+        self.assertEqual(state['batches'], [[(1, 2), (3, 4), (5, 6)]])
+        self.assertEqual([r.get() for r in results[:3]], [3, 7, 11])
+        self.assertTrue(results[3].get() is None)
+
+        # The call left over is picked up by another batch.
+        self.assertEqual(len(self.huey), 1)
+        task = self.huey.dequeue()
+        self.assertTrue(task.execute_time > start)
+        self.worker(task, task.execute_time)
+        self.assertEqual(state['batches'][-1], [(7, 8)])
+        self.assertEqual(results[3].get(), 15)
+        self.assertEqual(len(self.huey), 0)
+
+        # Errors are stored as the result of every call in the batch.
+        r1, r2 = batch_add.map([(1, 1), (None, 1)])
+        self.huey.dequeue()
+        self.worker(batch_add.task_class())
+        self.assertRaises(TaskException, r1.get)
+        self.assertRaises(TaskException, r2.get)
+        storage.conn.delete(key)
+
+    def test_chord(self):
+        res = self.huey.chord(
+            [modify_state.s('k%s' % i, i) for i in range(3)],
+            chord_callback.s('total'))
+        self.assertEqual(len(self.huey), 3)
+        tasks = [self.huey.dequeue() for _ in range(3)]
+
+        # The callback is enqueued once every task in the group finished,
+        # with the results in the order of the group.
+        for task in reversed(tasks):
+            self.assertEqual(len(self.huey), 0)
+            self.worker(task)
+        self.assertEqual(len(self.huey), 1)
+        self.worker(self.huey.dequeue())
+        self.assertEqual(state['total'], [0, 1, 2])
+        self.assertEqual(res.get(), 3)
+
+        # A task that fails causes the callback to fail instead of running.
+        res = self.huey.chord([modify_state.s('k3', 3), blow_up.s()],
+                              chord_callback.s('failed'))
+        self.worker(self.huey.dequeue())
+        self.worker(self.huey.dequeue())
+        self.assertEqual(len(self.huey), 0)
+        self.assertFalse('failed' in state)
+        self.assertRaises(TaskException, res.get)
+
+    def test_chord_not_executed(self):
+        # Tasks in a chord that are revoked, cancelled, or whose worker
+        # process is terminated, still count as finished.
+        self.huey.chord(
+            [modify_state.s('k0', 0), modify_state.s('k1', 1),
+             modify_state.s('k2', 2), slow_task.s(10)],
+            chord_callback.s('total'))
+        t0, t1, t2, t3 = [self.huey.dequeue() for _ in range(4)]
+        self.worker(t0)
+
+        self.huey.revoke_by_id(t1.task_id)
+        self.worker(t1)
+
+        def cancel(task):
+            if task.task_id == t2.task_id:
+                raise CancelExecution()
+        self.huey.register_pre_execute('cancel', cancel)
+        try:
+            self.worker(t2)
+        finally:
+            self.huey.unregister_pre_execute('cancel')
+
+        self.huey.store_errors = False
+        try:
+            t3.retries = 0
+            self.consumer._create_worker().handle_timeout(t3)
+        finally:
+            self.huey.store_errors = True
+        self.assertTaskEvents(
+            ('started', t0), ('finished', t0),
+            ('revoked', t1),
+            ('started', t2),
+            ('timeout', t3))
+
+        # The results of the group are removed once the callback is enqueued.
+        self.assertEqual(len(self.huey), 1)
+        self.assertEqual(self.huey.result_count(), 0)
+        self.worker(self.huey.dequeue())
+        self.assertEqual(state['total'], [0, None, None, None])
+
+    def test_chord_empty(self):
+        res = self.huey.chord([], chord_callback.s('total'))
+        self.worker(self.huey.dequeue())
+        self.assertEqual(state['total'], [])
+        self.assertEqual(res.get(), 0)
+
+    def test_rate_limit_invalid(self):
+        def declare():
+            @self.huey.task(rate_limit='100 per minute')
+            def invalid_rate_limit():
+                pass
+        self.assertRaises(ValueError, declare)
+
+    def test_multiple_queues(self):
+        other = RedisHuey('testing-other', blocking=False)
+        other.flush()
+        self.consumer.stop()
+        self.consumer = consumer = self.get_consumer(
+            workers=1, prefetch=4, queues=[(other, 3)])
+        self.assertEqual(consumer.queues, [(self.huey, 1), (other, 3)])
+        self.assertEqual(consumer.prefetch, 1)
+        self.assertRaises(ConfigurationError, self.get_consumer,
+                          worker_type='asyncio', queues=[other])
+
+        # Each queue has a scheduler. Periodic tasks in the shared registry
+        # are only scheduled by the main queue's scheduler.
+        (h1, s1), (h2, s2) = consumer.schedulers
+        self.assertTrue(h1 is self.huey and h2 is other)
+        self.assertTrue(consumer.scheduler is s1)
+        self.assertTrue(consumer._create_scheduler(self.huey).periodic)
+        self.assertFalse(consumer._create_scheduler(other).periodic)
+
+        try:
+            for i in range(8):
+                modify_state('k%s' % i, 'v%s' % i)
+                other.enqueue(modify_state.s('o%s' % i, 'w%s' % i))
+
+            # The worker reads the queues in proportion to their weights, and
+            # uses the instance the task was read from to process it.
+            worker, _ = consumer.worker_threads[0]
+            for i in range(4):
+                worker.loop()
+            self.assertEqual(self.huey.result_count(), 1)
+            self.assertEqual(other.result_count(), 3)
+            for i in range(4):
+                worker.loop()
+            self.assertEqual(self.huey.result_count(), 2)
+            self.assertEqual(other.result_count(), 6)
+
+            # An empty queue does not hold up the others.
+            self.huey.storage.flush_queue()
+            for i in range(2):
+                worker.loop()
+            self.assertTrue(worker.huey is other)
+            self.assertEqual(other.result_count(), 8)
+            self.assertEqual(len(other), 0)
+        finally:
+            other.flush()
+
     def test_worker(self):
         modify_state('k', 'w')
         task = test_huey.dequeue()
@@ -598,6 +1243,112 @@ class TestConsumerAPIs(ConsumerTestCase):
 
         self.assertEqual(state, {'p2': 2})
 
+    def test_precise_periodic_scheduler(self):
+        self.consumer.stop()
+        self.consumer = self.get_consumer(precise=True)
+        scheduler = self.consumer._create_scheduler()
+
+        dt = datetime.datetime(2011, 1, 1, 0, 1, 30)
+        scheduler.loop(dt)
+        self.assertEqual(len(self.huey), 0)
+        self.assertEqual(
+            [(ts, task_class) for ts, _, task_class
+             in sorted(scheduler._periodic_heap)],
+            [(datetime.datetime(2011, 1, 1, 0, 2), hourly_task.task_class),
+             (datetime.datetime(2011, 1, 1, 0, 3), hourly_task2.task_class)])
+
+        # Tasks are enqueued once their run time has passed, and are then
+        # rescheduled for their next run time.
+        scheduler.loop(datetime.datetime(2011, 1, 1, 0, 2))
+        self.assertEqual(len(self.huey), 1)
+        scheduler.loop(datetime.datetime(2011, 1, 1, 0, 2, 30))
+        self.assertEqual(len(self.huey), 1)
+        self.assertEqual(scheduler._periodic_heap[0][0],
+                         datetime.datetime(2011, 1, 1, 0, 3))
+
+        task = test_huey.dequeue()
+        self.assertTrue(isinstance(task, hourly_task.task_class))
+        self.worker(task, dt)
+        self.assertEqual(state, {'p': 'y'})
+
+        scheduler.loop(datetime.datetime(2011, 1, 1, 1, 0))
+        self.assertEqual(len(self.huey), 1)
+        self.assertEqual(
+            [task_class for _, _, task_class
+             in sorted(scheduler._periodic_heap)],
+            [hourly_task.task_class, hourly_task2.task_class])
+        self.assertEqual(scheduler._periodic_heap[0][0],
+                         datetime.datetime(2011, 1, 1, 1, 2))
+
+    def test_precise_scheduler_wait(self):
+        self.consumer.stop()
+        self.consumer = self.get_consumer(precise=True, scheduler_interval=10)
+        scheduler = self.consumer._create_scheduler()
+        waits = []
+        scheduler.wait_for_interval = lambda start, n: waits.append(n)
+
+        # Use a fixed time, so no periodic task is due within the interval.
+        now = datetime.datetime(2011, 1, 1, 0, 10, 0, 250000)
+        scheduler.loop(now)
+        self.assertEqual(waits, [10])
+
+        # The scheduler waits until the next scheduled task is due.
+        eta = now + datetime.timedelta(seconds=2.5)
+        modify_state.schedule(('k', 'v'), eta=eta, convert_utc=False)
+        self.worker(test_huey.dequeue(), now)
+        scheduler.loop(now)
+        self.assertEqual(waits[-1], 2.5)
+        self.assertEqual(len(self.huey), 0)
+
+        scheduler.loop(eta)
+        self.assertEqual(len(self.huey), 1)
+        self.assertEqual(waits[-1], 10)
+
+    def test_periodic_second_resolution(self):
+        huey = RedisHuey('testing-seconds', global_registry=False)
+
+        @huey.periodic_task(crontab(minute='*', second='0,30'))
+        def every_30s():
+            pass
+
+        @huey.periodic_task(crontab(minute='*'))
+        def every_minute():
+            pass
+
+        # Schedules to the second are only honored in precise mode.
+        consumer = Consumer(huey)
+        self.assertRaises(ConfigurationError, consumer.start)
+
+        consumer = Consumer(huey, precise=True)
+        consumer._check_periodic_resolution()
+        consumer = Consumer(huey, periodic=False)
+        consumer._check_periodic_resolution()
+
+    def test_dedupe_periodic(self):
+        self.consumer.stop()
+        self.consumer = self.get_consumer(dedupe_periodic=True)
+        s1 = self.consumer._create_scheduler()
+        s2 = self.consumer._create_scheduler()
+
+        # Both schedulers see the task is due, only one enqueues it.
+        dt = datetime.datetime(2011, 1, 1, 0, 2)
+        s1.enqueue_periodic_tasks(dt, None)
+        s2.enqueue_periodic_tasks(dt.replace(second=30), None)
+        self.assertEqual(len(self.huey), 1)
+
+        # The next run is enqueued by whichever scheduler gets there first.
+        dt = datetime.datetime(2011, 1, 1, 1, 2)
+        s2.enqueue_periodic_tasks(dt, None)
+        s1.enqueue_periodic_tasks(dt, None)
+        self.assertEqual(len(self.huey), 2)
+
+        # Claims expire.
+        key = 'p:%s:%s' % (hourly_task.task_class.__name__,
+                           '2011-01-01T01:02:00')
+        storage = self.huey.storage
+        self.assertTrue(0 < storage.conn.ttl(storage.result_ttl_key(key)) <=
+                        s1.dedupe_ttl)
+
     def test_revoking_periodic(self):
         global state
 
@@ -654,14 +1405,15 @@ class TestConsumerAPIs(ConsumerTestCase):
 
         loop_periodic(dt)
         self.assertEqual(state, {})
-        self.assertEqual(test_huey.result_count(), 1)
+        revoke_key = test_huey.storage.revoke_key
+        self.assertEqual(test_huey.storage.conn.hlen(revoke_key), 1)
 
         # after an hour it is back
         loop_periodic(dt + td)
         self.assertEqual(state, {'p': 'y'})
 
         # our data store should reflect the delay
-        self.assertEqual(test_huey.result_count(), 0)
+        self.assertEqual(test_huey.storage.conn.hlen(revoke_key), 0)
 
     def test_odd_scheduler_interval(self):
         self.consumer.stop()
@@ -99,3 +99,54 @@ class CrontabTestCase(BaseTestCase):
         # check invalid configurations are detected and reported
         self.assertRaises(ValueError, crontab, minute='61')
         self.assertRaises(ValueError, crontab, minute='0-61')
+
+    def test_crontab_second(self):
+        validate = crontab(minute='*/5', second='0,30')
+        self.assertTrue(validate(datetime.datetime(2011, 1, 1, 0, 5, 30)))
+        self.assertFalse(validate(datetime.datetime(2011, 1, 1, 0, 5, 15)))
+        self.assertFalse(validate(datetime.datetime(2011, 1, 1, 0, 6, 0)))
+
+        # Without a seconds field, seconds are ignored.
+        validate = crontab(minute='*/5')
+        self.assertTrue(validate(datetime.datetime(2011, 1, 1, 0, 5, 15)))
+
+        self.assertRaises(ValueError, crontab, second='60')
+
+    def test_next_after(self):
+        def assertNext(cron, dt, expected):
+            self.assertEqual(cron.next_after(dt), expected)
+
+        dt = datetime.datetime
+
+        assertNext(crontab(), dt(2011, 1, 1, 0, 0, 15),
+                   dt(2011, 1, 1, 0, 1))
+        assertNext(crontab(minute='0', hour='3'), dt(2011, 1, 1, 3, 0),
+                   dt(2011, 1, 2, 3, 0))
+        assertNext(crontab(minute='0', hour='3'), dt(2011, 1, 1, 2, 59, 59),
+                   dt(2011, 1, 1, 3, 0))
+        assertNext(crontab(minute='*/15'), dt(2011, 12, 31, 23, 50),
+                   dt(2012, 1, 1, 0, 0))
+
+        # jan 1, 2011 is a saturday
+        assertNext(crontab(day_of_week='1', hour='9', minute='30'),
+                   dt(2011, 1, 1, 12, 0), dt(2011, 1, 3, 9, 30))
+        assertNext(crontab(month='2', day='29', minute='0', hour='0'),
+                   dt(2011, 1, 1), dt(2012, 2, 29))
+        assertNext(crontab(minute='1', second='*/20'),
+                   dt(2011, 1, 1, 0, 1, 40), dt(2011, 1, 1, 1, 1))
+        assertNext(crontab(second='*/20'), dt(2011, 1, 1, 0, 1, 5, 12),
+                   dt(2011, 1, 1, 0, 1, 20))
+
+        # Schedules that can never be satisfied.
+        self.assertTrue(crontab(month='2', day='30').next_after(
+            dt(2011, 1, 1)) is None)
+
+        # The next run time always matches the schedule.
+        cron = crontab(month='1,5', day='1,4,7', day_of_week='0,6',
+                       hour='*/4', minute='1-5,10-15,50')
+        current = dt(2011, 1, 1)
+        for i in range(100):
+            next_dt = cron.next_after(current)
+            self.assertTrue(next_dt > current)
+            self.assertTrue(cron(next_dt))
+            current = next_dt
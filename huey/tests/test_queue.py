@@ -5,6 +5,7 @@ from huey import exceptions as huey_exceptions
 from huey import RedisHuey
 from huey.api import Huey
 from huey.api import QueueTask
+from huey.api import ResultGroup
 from huey.api import TaskWrapper
 from huey.constants import EmptyData
 from huey.exceptions import TaskException
@@ -58,6 +59,14 @@ def add_values(a, b):
 def add_values2(a, b):
     return a + b
 
+@huey_results.task(unique=True)
+def unique_add(a, b):
+    return a + b
+
+@huey_results.task(unique_key=lambda account, **kw: str(account))
+def unique_by_account(account, amount=0):
+    return amount
+
 @huey_results.periodic_task(crontab(minute='0'))
 def hourly_task2():
     state['periodic'] = 2
@@ -123,6 +132,14 @@ class TestHueyQueueMetadataAPIs(BaseQueueTestCase):
         self.assertEqual(sorted(huey_results.all_results().keys()),
                          sorted([b(t1.task_id), b(t2.task_id)]))
 
+        # Keys used by huey itself, whose values are not serialized results,
+        # are not included.
+        unique_add(5, 6)
+        with huey_results.lock_task('test-lock'):
+            self.assertEqual(huey_results.result_count(), 4)
+            self.assertEqual(sorted(huey_results.all_results().keys()),
+                             sorted([b(t1.task_id), b(t2.task_id)]))
+
 
 class TestHueyQueueAPIs(BaseQueueTestCase):
     def test_enqueue(self):
@@ -142,6 +159,104 @@ class TestHueyQueueAPIs(BaseQueueTestCase):
         # no changes to state
         self.assertEqual(state, {})
 
+    def test_enqueue_many(self):
+        results = add_values.map([(1, 2), (3, 4), (5, 6)])
+        self.assertTrue(isinstance(results, ResultGroup))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(huey_results), 3)
+
+        # Tasks are dequeued in the order they were enqueued.
+        for task_id in results.task_ids:
+            task = huey_results.dequeue()
+            self.assertEqual(task.task_id, task_id)
+            huey_results.execute(task)
+
+        self.assertEqual(results.get(), [3, 7, 11])
+
+        results = huey.enqueue_many([put_data.s('k1', 'v1'),
+                                     put_data.s('k2', 'v2')])
+        self.assertTrue(results is None)
+        self.assertEqual(len(huey), 2)
+        while huey:
+            huey.execute(huey.dequeue())
+        self.assertEqual(state, {'k1': 'v1', 'k2': 'v2'})
+
+    def test_result_group_read_twice(self):
+        results = add_values.map([(1, 2), (3, 4), (5, 6)])
+        while huey_results:
+            huey_results.execute(huey_results.dequeue())
+
+        # Results are removed from the result store when they are read,
+        # unless they are preserved.
+        self.assertEqual(results.get(preserve=True), [3, 7, 11])
+        self.assertEqual(results[1].get(), 7)
+        self.assertEqual(results.get(), [3, None, 11])
+        self.assertEqual(results.get(), [None, None, None])
+
+    def test_get_many(self):
+        results = add_values.map([(1, 2), (3, 4), (5, 6)])
+        t1, t2, t3 = [huey_results.dequeue() for _ in range(3)]
+        huey_results.execute(t3)
+        huey_results.execute(t1)
+        self.assertEqual(huey_results.get_many(results, preserve=True),
+                         [3, None, 11])
+
+        # Results that are ready are yielded first, the others as they
+        # become ready.
+        wrappers = list(results)
+        completed = huey_results.as_completed(wrappers, timeout=5)
+        self.assertTrue(next(completed) is wrappers[0])
+        self.assertTrue(next(completed) is wrappers[2])
+        huey_results.execute(t2)
+        self.assertTrue(next(completed) is wrappers[1])
+        self.assertRaises(StopIteration, next, completed)
+        self.assertEqual([r.get() for r in wrappers], [3, 7, 11])
+        self.assertEqual(huey_results.result_count(), 0)
+
+        res = add_values(1, 1)
+        self.assertRaises(huey_exceptions.DataStoreTimeout,
+                          huey_results.get_many, [res], blocking=True,
+                          timeout=0.1, revoke_on_timeout=True)
+        self.assertTrue(res.is_revoked())
+
+    def test_enqueue_unique(self):
+        r1 = unique_add(1, 2)
+        r2 = unique_add(1, 2)
+        r3 = unique_add(2, 3)
+        self.assertEqual(len(huey_results), 2)
+
+        # Duplicate callers get the result of the pending task.
+        self.assertEqual(r2.task.task_id, r1.task.task_id)
+        self.assertNotEqual(r3.task.task_id, r1.task.task_id)
+
+        # The same task can be re-enqueued, e.g. from the schedule.
+        huey_results.enqueue(r1.task)
+        self.assertEqual(len(huey_results), 3)
+
+        # Once the task starts, identical tasks can be enqueued again.
+        task = huey_results.dequeue()
+        huey_results.clear_unique(task)
+        huey_results.execute(task)
+        self.assertEqual(r2.get(), 3)
+        r4 = unique_add(1, 2)
+        self.assertNotEqual(r4.task.task_id, r1.task.task_id)
+
+        results = huey_results.enqueue_many([unique_add.s(1, 2),
+                                             unique_add.s(4, 5)])
+        self.assertEqual(results.task_ids[0], r4.task.task_id)
+        self.assertEqual(len(huey_results), 4)
+
+    def test_enqueue_unique_key(self):
+        r1 = unique_by_account(1, amount=10)
+        r2 = unique_by_account(1, amount=20)
+        r3 = unique_by_account(2, amount=20)
+        self.assertEqual(len(huey_results), 2)
+        self.assertEqual(r2.task.task_id, r1.task.task_id)
+        self.assertTrue(unique_by_account.task_class.unique)
+
+        huey_results.execute(huey_results.dequeue())
+        self.assertEqual(r2.get(), 10)
+
     def test_enqueue_decorator(self):
         put_data('k', 'v')
         self.assertEqual(len(huey), 1)
@@ -232,6 +347,12 @@ class TestHueyQueueAPIs(BaseQueueTestCase):
             def put_data(self, key, value):
                 raise SpecialException('put error')
 
+            def add_revocation(self, key, value):
+                raise SpecialException('put error')
+
+            def remove_revocation(self, key):
+                raise SpecialException('get error')
+
             def add_to_schedule(self, data, ts):
                 raise SpecialException('add error')
 
@@ -680,6 +801,23 @@ class TestAlwaysEager(BaseQueueTestCase):
         result = eager_huey.enqueue(pipe)
         self.assertEqual(result, [3, 6, 10, 15])
 
+    def test_always_eager_batch(self):
+        @eager_huey.batch_task(max_size=10)
+        def add_batch(calls):
+            return [a + b for a, b in calls]
+
+        self.assertEqual(add_batch(1, 3), 4)
+        self.assertEqual(add_batch.map([(1, 2), (3, 4)]), [3, 7])
+
+    def test_always_eager_chord(self):
+        @eager_huey.task()
+        def total(values):
+            return sum(values)
+
+        result = eager_huey.chord([add.s(1, 2), add.s(3, 4)], total.s())
+        self.assertEqual(result, 10)
+        self.assertEqual(eager_huey.group([add.s(1, 2), add.s(3, 4)]), [3, 7])
+
     def test_always_eager_failure(self):
         self.assertRaises(TypeError, add, 1, None)
 
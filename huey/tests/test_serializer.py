@@ -0,0 +1,197 @@
+import datetime
+import os
+import pickle
+
+from huey import RedisHuey
+from huey.exceptions import ConfigurationError
+from huey.exceptions import QueueException
+from huey.exceptions import TaskException
+from huey.registry import registry
+from huey.serializer import BinarySerializer
+from huey.serializer import COMPRESSION
+from huey.serializer import JSONSerializer
+from huey.serializer import PickleSerializer
+from huey.serializer import get_serializer
+from huey.tests.base import BaseTestCase
+from huey.tests.base import HueyTestCase
+from huey.tests.base import test_huey
+from huey.utils import Error
+
+
+json_huey = RedisHuey('testing-json', serializer='json', blocking=False)
+
+@test_huey.task()
+def serialized_add(a, b):
+    return a + b
+
+@json_huey.task()
+def json_add(a, b):
+    return {'sum': a + b, 'args': (a, b)}
+
+@json_huey.task()
+def json_fail():
+    raise Exception('failed')
+
+
+class TestSerializers(BaseTestCase):
+    serializers = (BinarySerializer(), JSONSerializer(), PickleSerializer())
+
+    def get_task(self):
+        task = serialized_add.s(1, 2).then(serialized_add, 3)
+        task.execute_time = datetime.datetime(2018, 1, 2, 3, 4, 5, 678901)
+        task.priority = 2
+        task.chord = 'chord-id'
+        return task
+
+    def assertTasksEqual(self, task, other):
+        self.assertEqual(type(other), type(task))
+        for attr in ('task_id', 'execute_time', 'retries', 'retry_delay',
+                     'data', 'priority', 'chord'):
+            self.assertEqual(getattr(other, attr), getattr(task, attr))
+
+    def test_message_roundtrip(self):
+        task = self.get_task()
+        for serializer in self.serializers:
+            msg = registry.get_message_for_task(task, serializer=serializer)
+            other = registry.get_task_for_message(msg, serializer)
+            self.assertTasksEqual(task, other)
+            self.assertTasksEqual(task.on_complete, other.on_complete)
+            self.assertTrue(other.enqueued_at is not None)
+
+            msg = registry.get_message_for_task(serialized_add.s(1, 2), False,
+                                                serializer)
+            other = registry.get_task_for_message(msg, serializer)
+            self.assertTrue(other.execute_time is None)
+            self.assertTrue(other.priority is None)
+            self.assertTrue(other.enqueued_at is None)
+            self.assertTrue(other.on_complete is None)
+
+    def test_read_any_format(self):
+        # Messages written by one serializer can be read by the others.
+        task = self.get_task()
+        for serializer in self.serializers:
+            msg = registry.get_message_for_task(task, serializer=serializer)
+            for other in self.serializers:
+                self.assertTasksEqual(
+                    task, registry.get_task_for_message(msg, other))
+
+        # Messages written by older versions are pickled tuples.
+        msg = pickle.dumps((task.task_id, 'queue_task_serialized_add', None,
+                            0, 0, ((1, 2), {}), None))
+        other = registry.get_task_for_message(msg, BinarySerializer())
+        self.assertEqual(other.task_id, task.task_id)
+        self.assertEqual(other.data, ((1, 2), {}))
+
+    def test_binary_message(self):
+        serializer = BinarySerializer()
+        task = self.get_task()
+        msg = registry.get_message_for_task(task, serializer=serializer)
+        self.assertEqual(msg[:1], BinarySerializer.header)
+        self.assertTrue(len(msg) < len(registry.get_message_for_task(task)))
+        self.assertFalse(b'queue_task_serialized_add' in msg)
+
+        # Task IDs that are not UUIDs are stored as strings.
+        task = serialized_add.s(1, 2)
+        task.task_id = 'custom-id'
+        msg = registry.get_message_for_task(task, serializer=serializer)
+        self.assertEqual(registry.get_task_for_message(msg).task_id,
+                         'custom-id')
+
+        # Task classes are looked up by the integer derived from their name.
+        name = 'queue_task_serialized_add'
+        value = registry.task_name_to_int(name)
+        self.assertEqual(registry.int_to_task_name(value), name)
+        self.assertRaises(QueueException, registry.int_to_task_name,
+                          value + 1)
+
+    def test_values(self):
+        value = {'k1': [1, 2.5, 'three'], 'k2': None}
+        error = Error({'error': 'failed'})
+        for serializer in self.serializers:
+            self.assertEqual(serializer.deserialize(serializer.serialize(value)),
+                             value)
+            self.assertEqual(serializer.deserialize(serializer.serialize(error)),
+                             error)
+
+        # Values written by one serializer can be read by the others.
+        data = JSONSerializer().serialize(error)
+        self.assertEqual(PickleSerializer().deserialize(data), error)
+        data = PickleSerializer().serialize(error)
+        self.assertEqual(JSONSerializer().deserialize(data), error)
+
+    def test_compression(self):
+        value = {'blob': 'x' * 4096}
+        task = serialized_add.s('x' * 4096, 'y')
+        for compression in sorted(COMPRESSION):
+            for cls in (BinarySerializer, JSONSerializer, PickleSerializer):
+                serializer = cls(compression)
+                data = serializer.serialize(value)
+                self.assertEqual(data[:1], COMPRESSION[compression][0])
+                self.assertTrue(len(data) < 1024)
+                self.assertEqual(serializer.deserialize(data), value)
+
+                # Compressed data can be read by any serializer.
+                msg = registry.get_message_for_task(task,
+                                                    serializer=serializer)
+                self.assertTrue(len(msg) < 1024)
+                other = registry.get_task_for_message(msg, PickleSerializer())
+                self.assertEqual(other.data, task.data)
+
+                stats = serializer.stats()
+                self.assertEqual(stats['serialized'], 2)
+                self.assertEqual(stats['compressed'], 2)
+                self.assertTrue(stats['bytes_in'] > 8192)
+                self.assertTrue(stats['ratio'] > 8)
+
+    def test_compression_threshold(self):
+        serializer = BinarySerializer('zlib', compression_threshold=100)
+
+        # Small payloads, and those that do not compress, are stored as-is.
+        data = serializer.serialize('small')
+        self.assertEqual(data, PickleSerializer().serialize('small'))
+        blob = os.urandom(1024)
+        data = serializer.serialize(blob)
+        self.assertEqual(data, PickleSerializer().serialize(blob))
+        self.assertEqual(serializer.deserialize(data), blob)
+
+        stats = serializer.stats()
+        self.assertEqual(stats['serialized'], 2)
+        self.assertEqual(stats['compressed'], 0)
+        self.assertEqual(stats['bytes_in'], stats['bytes_out'])
+        self.assertEqual(stats['ratio'], 1.)
+
+        data = serializer.serialize(b'x' * 100)
+        self.assertEqual(serializer.deserialize(data), b'x' * 100)
+        self.assertEqual(serializer.stats()['compressed'], 1)
+
+    def test_get_serializer(self):
+        self.assertTrue(isinstance(get_serializer(), BinarySerializer))
+        self.assertTrue(isinstance(get_serializer('json'), JSONSerializer))
+        serializer = PickleSerializer()
+        self.assertTrue(get_serializer(serializer) is serializer)
+        self.assertRaises(ConfigurationError, get_serializer, 'yaml')
+
+        serializer = get_serializer('json', 'zlib')
+        self.assertEqual(serializer.compression, 'zlib')
+        self.assertRaises(ConfigurationError, get_serializer, None, 'snappy')
+        self.assertRaises(ConfigurationError, get_serializer,
+                          PickleSerializer(), 'zlib')
+
+
+class TestHueySerializer(HueyTestCase):
+    def get_huey(self):
+        return json_huey
+
+    def test_json_huey(self):
+        self.assertTrue(isinstance(self.huey.serializer, JSONSerializer))
+        res = json_add(1, 2)
+        task = self.huey.dequeue()
+        self.assertEqual(task.data, ((1, 2), {}))
+        self.worker(task)
+        self.assertEqual(res.get(), {'sum': 3, 'args': [1, 2]})
+
+        res = json_fail()
+        self.worker(self.huey.dequeue())
+        self.assertRaises(TaskException, res.get)
+        error, = self.huey.errors()
+        self.assertEqual(error['task'], 'queue_task_json_fail')
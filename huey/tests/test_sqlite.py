@@ -1,10 +1,16 @@
 import datetime
+import os
+import sqlite3
 import threading
+import time
 
 from huey.constants import EmptyData
 from huey.consumer import Consumer
+from huey.contrib.sqlitedb import KeyValue
+from huey.contrib.sqlitedb import Lease
 from huey.contrib.sqlitedb import SqliteHuey
 from huey.contrib.sqlitedb import SqliteStorage
+from huey.contrib.sqlitedb import TokenBucket
 from huey.tests.base import CaptureLogs
 from huey.tests.base import HueyTestCase
 
@@ -34,6 +40,212 @@ class TestSqliteStorage(HueyTestCase):
         self.assertEqual(db.queue_size(), 0)
         self.assertEqual(db.result_store_size(), 0)
 
+    def test_enqueue_many(self):
+        @self.huey.task()
+        def square(n):
+            return n * n
+
+        results = square.map(range(250))
+        self.assertEqual(self.huey.pending_count(), 250)
+        for i in range(250):
+            self.huey.execute(self.huey.dequeue())
+        self.assertEqual(results.get(), [n * n for n in range(250)])
+
+        square.map(range(5))
+        tasks = self.huey.dequeue_many(3)
+        self.assertEqual([task.data for task in tasks],
+                         [((0,), {}), ((1,), {}), ((2,), {})])
+        self.assertEqual(len(self.huey.dequeue_many(3)), 2)
+        self.assertEqual(self.huey.dequeue_many(3), [])
+
+    def test_dequeue_many_concurrent(self):
+        @self.huey.task()
+        def square(n):
+            return n * n
+
+        square.map(range(200))
+        accum = []
+        lock = threading.Lock()
+
+        def consume():
+            while True:
+                tasks = self.huey.dequeue_many(7)
+                if not tasks:
+                    break
+                with lock:
+                    accum.extend(task.data[0][0] for task in tasks)
+
+        threads = [threading.Thread(target=consume) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # Every task is dequeued exactly once.
+        self.assertEqual(sorted(accum), list(range(200)))
+        self.assertEqual(self.huey.pending_count(), 0)
+
+    def test_wait_for_result(self):
+        @self.huey.task()
+        def add(a, b):
+            return a + b
+
+        res = add(1, 2)
+        task = self.huey.dequeue()
+        t = threading.Timer(0.3, self.huey.execute, args=(task,))
+        t.start()
+        start = time.time()
+        self.assertEqual(res.get(blocking=True, timeout=5, backoff=50,
+                                 max_delay=5), 3)
+        self.assertTrue(time.time() - start < 1)
+        t.join()
+
+    def test_result_ttl(self):
+        storage = self.huey.storage
+
+        @self.huey.task(result_ttl=60)
+        def add_ttl(a, b):
+            return a + b
+
+        results = add_ttl.map([(1, 2), (3, 4), (5, 6)])
+        for _ in range(3):
+            self.huey.execute(self.huey.dequeue())
+        self.assertEqual(self.huey.result_count(), 3)
+        r1, r2, r3 = results
+        self.assertEqual(r1.get(), 3)
+
+        # Expired results are not visible, and are removed by the scheduler.
+        (KeyValue
+         .update(expires_at=time.time() - 1)
+         .where(KeyValue.key == r2.task.task_id)
+         .execute())
+        self.assertTrue(r2.get(preserve=True) is None)
+        self.assertFalse(storage.has_data_for_key(r2.task.task_id))
+        self.assertEqual(self.huey.result_count(), 1)
+        self.assertEqual(KeyValue.select().count(), 2)
+
+        scheduler = self.consumer._create_scheduler()
+        self.assertEqual(scheduler.sweep_results(), 1)
+        self.assertEqual(KeyValue.select().count(), 1)
+        self.assertEqual(r3.get(), 11)
+
+        # Storing a result again replaces the existing value.
+        storage.put_data('k1', b'v1')
+        storage.put_data('k1', b'v2')
+        self.assertEqual(storage.pop_data('k1'), b'v2')
+
+    def test_all_results(self):
+        # Results are stored using the serializer of the huey instance.
+        for serializer in ('binary', 'json', 'pickle'):
+            huey = SqliteHuey('sqlite-%s' % serializer,
+                              filename='/tmp/sqlite-huey.db',
+                              serializer=serializer)
+            huey.put('k1', {'sum': 3})
+            huey.put('k2', [1, 2])
+            try:
+                self.assertEqual(huey.all_results(),
+                                 {'k1': {'sum': 3}, 'k2': [1, 2]})
+                self.assertEqual(huey.storage.result_items()['k1'],
+                                 huey.serializer.serialize({'sum': 3}))
+            finally:
+                huey.flush()
+                huey.storage.database.close()
+                # Models are bound to the database of the latest storage.
+                self.huey.storage.initialize_task_table()
+
+    def test_next_scheduled_ts(self):
+        @self.huey.task()
+        def add_later(a, b):
+            return a + b
+
+        self.assertTrue(self.huey.next_scheduled_ts() is None)
+        dt1 = datetime.datetime(2013, 1, 2, 0, 0)
+        dt2 = datetime.datetime(2013, 1, 1, 0, 0)
+        add_later.schedule((1, 2), eta=dt1, convert_utc=False)
+        add_later.schedule((3, 4), eta=dt2, convert_utc=False)
+        for _ in range(2):
+            self.huey.add_schedule(self.huey.dequeue())
+        self.assertEqual(self.huey.next_scheduled_ts(), dt2)
+        self.huey.read_schedule(dt2)
+        self.assertEqual(self.huey.next_scheduled_ts(), dt1)
+
+    def test_schedule_precision(self):
+        @self.huey.task()
+        def add_later(a, b):
+            return a + b
+
+        # Scheduled times keep their microseconds, so tasks are not read from
+        # the schedule before they are due.
+        dt = datetime.datetime(2013, 1, 1, 0, 0, 0, 400000)
+        add_later.schedule((1, 2), eta=dt, convert_utc=False)
+        self.huey.add_schedule(self.huey.dequeue())
+        self.assertEqual(self.huey.next_scheduled_ts(), dt)
+        self.assertEqual(
+            self.huey.read_schedule(dt - datetime.timedelta(seconds=.1)), [])
+        task, = self.huey.read_schedule(dt)
+        self.assertEqual(task.data, ((1, 2), {}))
+
+    def test_priority(self):
+        @self.huey.task()
+        def add(a, b):
+            return a + b
+
+        add(1, 2)
+        add.schedule((3, 4), priority=2)
+        add.schedule((5, 6), priority=-1)
+        add.schedule((7, 8), priority=2)
+        self.assertEqual([t.data[0] for t in self.huey.pending()],
+                         [(3, 4), (7, 8), (1, 2), (5, 6)])
+        self.assertEqual([t.data[0] for t in self.huey.dequeue_many(3)],
+                         [(3, 4), (7, 8), (1, 2)])
+        task = self.huey.dequeue()
+        self.assertEqual(task.data[0], (5, 6))
+        self.assertEqual(task.priority, -1)
+
+    def assertIndexed(self, storage, table, column):
+        indexes = storage.database.get_indexes(table)
+        self.assertTrue([column] in [index.columns for index in indexes])
+
+    def test_add_missing_columns(self):
+        # Database created by a version of huey without task priorities or
+        # result expiry.
+        filename = '/tmp/sqlite-huey-old.db'
+        if os.path.exists(filename):
+            os.unlink(filename)
+        conn = sqlite3.connect(filename)
+        conn.executescript(
+            'CREATE TABLE "task" ("id" INTEGER NOT NULL PRIMARY KEY, '
+            '"queue" VARCHAR(255) NOT NULL, "data" BLOB NOT NULL);'
+            'CREATE TABLE "keyvalue" ("queue" VARCHAR(255) NOT NULL, '
+            '"key" VARCHAR(255) NOT NULL, "value" BLOB NOT NULL, '
+            'PRIMARY KEY ("queue", "key"));'
+            'INSERT INTO "task" ("queue", "data") VALUES (\'old\', X\'01\');'
+            'INSERT INTO "keyvalue" ("queue", "key", "value") '
+            'VALUES (\'old\', \'k1\', X\'02\');')
+        conn.close()
+
+        try:
+            storage = SqliteStorage('old', filename)
+            columns = [c.name for c in storage.database.get_columns('task')]
+            self.assertTrue('priority' in columns)
+            self.assertIndexed(storage, 'task', 'priority')
+            storage.enqueue(b'new', priority=1)
+            self.assertEqual(storage.dequeue(), b'new')
+            self.assertEqual(storage.dequeue(), b'\x01')
+
+            columns = [c.name for c in
+                       storage.database.get_columns('keyvalue')]
+            self.assertTrue('expires_at' in columns)
+            self.assertIndexed(storage, 'keyvalue', 'expires_at')
+            storage.put_result('k2', b'\x03', ttl=60)
+            self.assertEqual(storage.peek_data('k1'), b'\x02')
+            self.assertEqual(storage.pop_data('k2'), b'\x03')
+            storage.database.close()
+        finally:
+            # Models are bound to the database of the latest storage.
+            self.huey.storage.initialize_task_table()
+            os.unlink(filename)
+
     def test_put_if_empty(self):
         storage = self.huey.storage
         self.assertTrue(storage.put_if_empty('k1', '1'))
@@ -46,6 +258,59 @@ class TestSqliteStorage(HueyTestCase):
         self.assertEqual(storage.pop_data('k1'), '3')
         self.assertEqual(storage.pop_data('k2'), '4')
 
+    def test_put_if_empty_ttl(self):
+        storage = self.huey.storage
+        self.assertTrue(storage.put_if_empty('k1', b'1', 60))
+        self.assertFalse(storage.put_if_empty('k1', b'2', 60))
+
+        # Once expired, the key can be set again.
+        (KeyValue
+         .update(expires_at=time.time() - 1)
+         .where(KeyValue.key == 'k1')
+         .execute())
+        self.assertTrue(storage.put_if_empty('k1', b'3'))
+        self.assertEqual(storage.pop_data('k1'), b'3')
+
+    def test_leases(self):
+        storage = self.huey.storage
+        self.assertTrue(storage.acquire_lease('sem', 'l1', 2, 60))
+        self.assertTrue(storage.acquire_lease('sem', 'l2', 2, 60))
+        self.assertFalse(storage.acquire_lease('sem', 'l3', 2, 60))
+        self.assertTrue(storage.acquire_lease('sem', 'l1', 2, 60))
+        self.assertTrue(storage.acquire_lease('other', 'l3', 2, 60))
+
+        self.assertTrue(storage.release_lease('sem', 'l1'))
+        self.assertFalse(storage.release_lease('sem', 'l1'))
+        self.assertTrue(storage.acquire_lease('sem', 'l3', 2, 60))
+
+        # Expired leases no longer count towards the limit.
+        (Lease
+         .update(expires_at=time.time() - 1)
+         .where(Lease.lease_id == 'l2')
+         .execute())
+        self.assertTrue(storage.acquire_lease('sem', 'l4', 2, 60))
+        for lease_id in ('l3', 'l4'):
+            self.assertTrue(storage.release_lease('sem', lease_id))
+        self.assertTrue(storage.release_lease('other', 'l3'))
+
+    def test_token_bucket(self):
+        storage = self.huey.storage
+        self.assertEqual(storage.acquire_token('bucket', 2, 60), 0)
+        self.assertEqual(storage.acquire_token('bucket', 2, 60), 0)
+        self.assertAlmostEqual(storage.acquire_token('bucket', 2, 60), 30,
+                               delta=0.1)
+
+        # Tokens are refilled based on the time elapsed, up to the capacity.
+        TokenBucket.update(timestamp=TokenBucket.timestamp - 45).execute()
+        self.assertEqual(storage.acquire_token('bucket', 2, 60), 0)
+        self.assertAlmostEqual(storage.acquire_token('bucket', 2, 60), 15,
+                               delta=0.1)
+        TokenBucket.update(timestamp=TokenBucket.timestamp - 600).execute()
+        self.assertEqual(storage.acquire_token('bucket', 2, 60), 0)
+        self.assertEqual(storage.acquire_token('bucket', 2, 60), 0)
+        self.assertTrue(storage.acquire_token('bucket', 2, 60) > 0)
+        self.assertEqual(storage.acquire_token('other', 2, 60), 0)
+
     def test_schedule(self):
         dt1 = datetime.datetime(2013, 1, 1, 0, 0)
         dt2 = datetime.datetime(2013, 1, 2, 0, 0)
@@ -78,6 +343,49 @@ class TestSqliteStorage(HueyTestCase):
         self.assertEqual(len(storage.read_schedule(dt3)), 1)
         self.assertEqual(len(storage.read_schedule(dt3)), 0)
 
+    def test_batches(self):
+        storage = self.huey.storage
+        self.assertEqual([storage.push_batch('batch', b'i%d' % i)
+                          for i in range(3)], [1, 2, 3])
+        self.assertEqual(storage.push_batch('other', b'o0'), 1)
+        self.assertEqual(storage.pop_batch('batch', 2), [b'i0', b'i1'])
+        self.assertEqual(storage.batch_size('batch'), 1)
+        self.assertEqual(storage.pop_batch('batch', 2), [b'i2'])
+        self.assertEqual(storage.pop_batch('batch', 2), [])
+        self.assertEqual(storage.batch_size('other'), 1)
+
+    def test_counters(self):
+        storage = self.huey.storage
+        self.assertEqual(storage.incr_counter('c1', 2), 2)
+        self.assertEqual(storage.incr_counter('c2'), 1)
+        self.assertEqual(storage.incr_counter('c1', -1), 1)
+        self.assertEqual(storage.incr_counter('c1', -1), 0)
+        self.assertEqual(storage.incr_counter('c1'), 1)
+
+    def test_peek_data_many(self):
+        storage = self.huey.storage
+        storage.put_data('k1', b'v1')
+        storage.put_data('k2', b'v2')
+        self.assertEqual(storage.peek_data_many(['k1', 'kx', 'k2']),
+                         [b'v1', EmptyData, b'v2'])
+        self.assertEqual(storage.peek_data('k1'), b'v1')
+
+        self.assertEqual(storage.pop_data_many(['k1', 'kx', 'k2']),
+                         [b'v1', EmptyData, b'v2'])
+        self.assertEqual(storage.peek_data_many(['k1', 'k2']),
+                         [EmptyData, EmptyData])
+
+    def test_reschedule(self):
+        storage = self.huey.storage
+        dt1 = datetime.datetime(2013, 1, 1, 0, 0)
+        dt2 = datetime.datetime(2013, 1, 2, 0, 0)
+        storage.reschedule(b'k1', dt1)
+        storage.reschedule(b'k2', dt1)
+        storage.reschedule(b'k1', dt2)
+        self.assertEqual(storage.schedule_size(), 2)
+        self.assertEqual(storage.read_schedule(dt1), [b'k2'])
+        self.assertEqual(storage.read_schedule(dt2), [b'k1'])
+
     def test_consumer_integration(self):
         lock = threading.Lock()
 
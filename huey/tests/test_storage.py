@@ -1,9 +1,13 @@
 import datetime
 import itertools
+import pickle
+import threading
+import time
 
 from redis.connection import ConnectionPool
 
 from huey.constants import EmptyData
+from huey.exceptions import DataStoreTimeout
 from huey.storage import RedisHuey
 from huey.storage import RedisStorage
 from huey.tests.base import b
@@ -29,6 +33,493 @@ class TestRedisStorage(HueyTestCase):
         self.huey.execute(task)
         self.assertEqual(res.get(), '\xce\xcf')
 
+    def test_dequeue_many(self):
+        storage = self.huey.storage
+        storage.enqueue_many([b('a'), b('b'), b('c')])
+        storage.enqueue(b('d'))
+        self.assertEqual(storage.dequeue_many(2), [b('a'), b('b')])
+        self.assertEqual(storage.dequeue_many(5), [b('c'), b('d')])
+        self.assertEqual(storage.dequeue_many(5), [])
+        self.assertEqual(storage.queue_size(), 0)
+
+    def test_wait_for_result(self):
+        storage = self.huey.storage
+
+        @self.huey.task()
+        def add(a, b):
+            return a + b
+
+        res = add(1, 2)
+        task = self.huey.dequeue()
+
+        # The waiting client is woken up as soon as the result is stored,
+        # instead of polling until the next read.
+        t = threading.Timer(0.3, self.huey.execute, args=(task,))
+        t.start()
+        start = time.time()
+        self.assertEqual(res.get(blocking=True, timeout=5, backoff=50,
+                                 max_delay=5), 3)
+        self.assertTrue(time.time() - start < 1)
+        t.join()
+
+        # No notification is sent if nobody waits for the result, and a
+        # client that starts waiting afterwards returns immediately.
+        res = add(3, 4)
+        self.huey.execute(self.huey.dequeue())
+        key = res.task.task_id
+        self.assertFalse(storage.conn.exists(storage.result_notify_key(key)))
+        start = time.time()
+        storage.wait_for_result(key, 5)
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(res.get(blocking=True), 7)
+        self.assertFalse(storage.conn.exists(storage.result_waiter_key(key)))
+
+        # Timeouts shorter than a second are not rounded up.
+        res = add(5, 6)
+        start = time.time()
+        self.assertRaises(DataStoreTimeout, res.get, blocking=True,
+                          timeout=.2)
+        self.assertTrue(time.time() - start < .6)
+
+        # Servers older than Redis 6 only accept whole seconds.
+        self.assertEqual(storage.blocking_timeout(.2), .2)
+        storage.fractional_timeouts = False
+        try:
+            self.assertEqual(storage.blocking_timeout(.2), 1)
+            self.assertEqual(storage.blocking_timeout(1.5), 2)
+        finally:
+            storage.fractional_timeouts = True
+
+    def test_wait_for_result_many_waiters(self):
+        storage = self.huey.storage
+
+        @self.huey.task()
+        def add(a, b):
+            return a + b
+
+        res = add(1, 2)
+        task = self.huey.dequeue()
+        key = res.task.task_id
+        elapsed = []
+
+        def wait():
+            start = time.time()
+            storage.wait_for_result(key, 5)
+            elapsed.append(time.time() - start)
+
+        # Every client waiting for the result is woken up when it is stored.
+        threads = [threading.Thread(target=wait) for _ in range(3)]
+        for t in threads:
+            t.start()
+        self._sleep(.1)
+        self.huey.execute(task)
+        for t in threads:
+            t.join()
+        self.assertEqual(len(elapsed), 3)
+        self.assertTrue(max(elapsed) < 1)
+
+        # Once the result has been read, the notification is not put back.
+        self.assertEqual(res.get(), 3)
+        start = time.time()
+        storage.wait_for_result(key, .2)
+        self.assertTrue(time.time() - start >= .15)
+
+    def test_result_ttl(self):
+        storage = self.huey.storage
+
+        @self.huey.task(result_ttl=60)
+        def add_ttl(a, b):
+            return a + b
+
+        @self.huey.task()
+        def sub_ttl(a, b):
+            return a - b
+
+        r1 = add_ttl(1, 2)
+        r2 = sub_ttl(5, 1)
+        r3 = add_ttl(3, 4)
+        for _ in range(3):
+            self.huey.execute(self.huey.dequeue())
+
+        # Results with a TTL are stored in their own key.
+        self.assertEqual(storage.conn.hlen(storage.result_key), 1)
+        ttl_key = storage.result_ttl_key(r1.task.task_id)
+        self.assertTrue(0 < storage.conn.pttl(ttl_key) <= 60000)
+        self.assertTrue(storage.has_data_for_key(r1.task.task_id))
+        self.assertEqual(self.huey.result_count(), 3)
+        self.assertEqual(
+            sorted(self.huey.all_results()),
+            sorted([b(r.task.task_id) for r in (r1, r2, r3)]))
+
+        self.assertEqual(self.huey.get(r1.task.task_id, peek=True), 3)
+        self.assertEqual(r1.get(), 3)
+        self.assertFalse(storage.has_data_for_key(r1.task.task_id))
+        self.assertEqual(r2.get(), 4)
+        self.assertEqual(self.huey.result_count(), 1)
+
+        # Results with a TTL are tracked in a sorted set, rather than found
+        # by scanning the keyspace.
+        index = storage.result_ttl_index_key
+        self.assertEqual(storage.conn.zrange(index, 0, -1),
+                         [b(r3.task.task_id)])
+
+        # Expired results are removed by Redis, and their entries in the
+        # sorted set by sweep_results().
+        storage.put_result('k1', b'v1', ttl=.01)
+        self.assertEqual(self.huey.result_count(), 2)
+        self._sleep(0.02)
+        self.assertEqual(self.huey.result_count(), 1)
+        self.assertEqual(list(storage.result_items()), [b(r3.task.task_id)])
+        self.assertEqual(storage.sweep_results(), 1)
+        self.assertEqual(storage.conn.zcard(index), 1)
+        self.assertEqual(r3.get(), 7)
+        self.assertEqual(storage.conn.zcard(index), 0)
+
+        # The default TTL can be configured on the Huey instance.
+        huey = RedisHuey('testing-ttl', result_ttl=30)
+        huey.flush()
+        @huey.task()
+        def mul_ttl(a, b):
+            return a * b
+
+        r4 = mul_ttl(5, 6)
+        huey.execute(huey.dequeue())
+        self.assertEqual(huey.storage.conn.hlen(huey.storage.result_key), 0)
+        self.assertEqual(huey.result_count(), 1)
+        huey.storage.flush_results()
+        self.assertEqual(huey.result_count(), 0)
+        self.assertTrue(r4.get() is None)
+
+    def test_revocations(self):
+        storage = self.huey.storage
+
+        @self.huey.task()
+        def revoke_me(n):
+            return n
+
+        r1 = revoke_me(1)
+        r2 = revoke_me(2)
+        keys = [r1.task.revoke_id, 'rt:%s' % revoke_me.task_class.__name__]
+        storage.conn.delete(storage.revoke_migrated_key)
+        self.assertEqual(storage.get_revocations(keys),
+                         [EmptyData, EmptyData])
+
+        # Revocations stored in the result hash by older versions of huey are
+        # read until they have been migrated, and new revocations are also
+        # written there for older consumers.
+        data = pickle.dumps((None, False))
+        storage.conn.hset(storage.result_key, r1.task.revoke_id, data)
+        self.assertTrue(r1.is_revoked())
+        r2.revoke()
+        self.assertEqual(storage.conn.hget(storage.result_key,
+                                           r2.task.revoke_id), data)
+
+        self.assertEqual(storage.migrate_revocations(), 2)
+        self.assertEqual(storage.conn.hlen(storage.result_key), 0)
+        self.assertTrue(r1.is_revoked())
+        self.assertTrue(r1.restore())
+        self.assertTrue(r2.restore())
+        self.assertFalse(r1.is_revoked())
+        self.assertFalse(r2.is_revoked())
+
+        # Revocations are kept separately from the result store.
+        r1.revoke()
+        self.assertEqual(storage.conn.hlen(storage.revoke_key), 1)
+        self.assertEqual(self.huey.result_count(), 0)
+        data = storage.get_revocations(keys)
+        self.assertTrue(data[0] is not EmptyData)
+        self.assertTrue(data[1] is EmptyData)
+        self.assertTrue(r1.is_revoked())
+        self.assertFalse(r2.is_revoked())
+
+        revoke_me.revoke(revoke_once=True)
+        self.assertTrue(self.huey.is_revoked(r2.task, peek=False))
+        self.assertFalse(r2.is_revoked())
+
+        self.assertTrue(r1.restore())
+        self.assertFalse(r1.restore())
+        self.assertEqual(storage.conn.hlen(storage.revoke_key), 0)
+
+        r1.revoke()
+        self.huey.flush()
+        self.assertFalse(r1.is_revoked())
+
+    def test_schedule_precision(self):
+        storage = self.huey.storage
+
+        @self.huey.task()
+        def add_later(a, b):
+            return a + b
+
+        self.assertTrue(self.huey.next_scheduled_ts() is None)
+        dt = datetime.datetime(2011, 1, 1, 0, 0, 0, 500000)
+        add_later.schedule((1, 2), eta=dt, convert_utc=False)
+        add_later.schedule((3, 4), eta=dt + datetime.timedelta(seconds=5),
+                           convert_utc=False)
+        for _ in range(2):
+            self.huey.add_schedule(self.huey.dequeue())
+        self.assertEqual(self.huey.next_scheduled_ts(), dt)
+
+        # Adding to the schedule leaves a token to wake up the scheduler.
+        self.assertEqual(storage.conn.llen(storage.schedule_wake_key), 1)
+        start = time.time()
+        self.huey.wait_for_schedule(5)
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(storage.conn.llen(storage.schedule_wake_key), 0)
+
+        # Sub-second precision is preserved.
+        self.assertEqual(self.huey.read_schedule(dt.replace(microsecond=0)),
+                         [])
+        tasks = self.huey.read_schedule(dt)
+        self.assertEqual([t.data for t in tasks], [((1, 2), {})])
+        self.assertEqual(self.huey.next_scheduled_ts(),
+                         dt + datetime.timedelta(seconds=5))
+
+    def test_priority(self):
+        @self.huey.task()
+        def add(a, b):
+            return a + b
+
+        @self.huey.task(priority=5)
+        def urgent(n):
+            return n
+
+        add(1, 2)
+        urgent(1)
+        add.schedule((3, 4), priority=-1)
+        add.schedule((5, 6), priority=10)
+        urgent(2)
+        add(7, 8)
+        self.assertEqual(self.huey.pending_count(), 6)
+
+        tasks = self.huey.dequeue_many(3)
+        self.assertEqual([(t.data[0], t.priority) for t in tasks],
+                         [((5, 6), 10), ((1,), 5), ((2,), 5)])
+        task = self.huey.dequeue()
+        self.assertEqual(task.data[0], (1, 2))
+        self.assertEqual(task.priority, None)
+        self.assertEqual([t.data[0] for t in self.huey.dequeue_many(5)],
+                         [(7, 8), (3, 4)])
+        self.assertEqual(self.huey.pending_count(), 0)
+
+        # Priority is preserved when the task is read back from storage and
+        # enqueued again, e.g. for retries.
+        urgent.map([(3,), (4,)])
+        add(9, 10)
+        task = self.huey.dequeue()
+        self.assertEqual(task.priority, 5)
+        self.huey.enqueue(task)
+        self.assertEqual(self.huey.pending_count(), 3)
+        self.huey.flush()
+        self.assertEqual(self.huey.pending_count(), 0)
+
+    def test_reliable_queue(self):
+        huey = RedisHuey('testing-reliable', blocking=False, reliable=True,
+                         consumer_id='c1')
+        storage = huey.storage
+        huey.flush()
+        conn = storage.conn
+        conn.delete(storage.consumers_key, storage.processing_key,
+                    storage.processing_prefix + 'c2')
+
+        @huey.task()
+        def add(a, b):
+            return a + b
+
+        r1 = add(1, 2)
+        r2 = add(3, 4)
+        r3 = add(5, 6)
+        huey.heartbeat()
+
+        # Tasks are moved to the processing list until acknowledged. Storing
+        # the result also acknowledges the task.
+        task = huey.dequeue()
+        self.assertEqual(conn.llen(storage.processing_key), 1)
+        huey.execute(task)
+        self.assertEqual(conn.llen(storage.processing_key), 0)
+        self.assertEqual(r1.get(), 3)
+
+        # Task is read but the consumer dies before it is processed.
+        task = huey.dequeue()
+        self.assertEqual(task.task_id, r2.task.task_id)
+        self.assertEqual(huey.pending_count(), 1)
+        self.assertEqual(conn.llen(storage.processing_key), 1)
+
+        # Consumer is still alive, so nothing is recovered.
+        other = RedisHuey('testing-reliable', blocking=False, reliable=True,
+                          consumer_id='c2')
+        self.assertEqual(other.heartbeat(), 0)
+
+        # Simulate the heartbeat expiring. The task is enqueued again.
+        conn.delete(storage.heartbeat_prefix + 'c1')
+        self.assertEqual(other.heartbeat(), 1)
+        self.assertEqual(huey.pending_count(), 2)
+        self.assertEqual(conn.llen(storage.processing_key), 0)
+        self.assertEqual(conn.llen(other.storage.processing_key), 0)
+        self.assertEqual(conn.smembers(storage.consumers_key), set([b('c2')]))
+
+        task = other.dequeue()
+        self.assertEqual(task.task_id, r3.task.task_id)
+        other.ack(task)
+        tasks = other.dequeue_many(2)
+        self.assertEqual([t.task_id for t in tasks], [r2.task.task_id])
+        self.assertEqual(conn.llen(other.storage.processing_key), 1)
+        other.ack(tasks[0])
+        self.assertEqual(conn.llen(other.storage.processing_key), 0)
+
+        # Tasks are enqueued again with their priority.
+        r4 = add.s(7, 8)
+        r4.priority = 5
+        huey.enqueue(r4)
+        add(9, 10)
+        huey.heartbeat()
+        self.assertEqual(huey.dequeue().task_id, r4.task_id)
+        conn.delete(storage.heartbeat_prefix + 'c1')
+        self.assertEqual(other.heartbeat(), 1)
+        task = other.dequeue()
+        self.assertEqual(task.task_id, r4.task_id)
+        other.ack(task)
+        conn.delete(storage.consumers_key, storage.heartbeat_prefix + 'c2')
+
+    def test_reap_unreliable(self):
+        # Storages that do not track in-flight tasks have nothing to reap.
+        huey = RedisHuey('testing-unreliable', blocking=False)
+        self.assertEqual(huey.heartbeat(), 0)
+        self.assertEqual(huey.storage.conn.exists(
+            huey.storage.consumers_key), 0)
+
+    def test_dequeue_any(self):
+        s1 = RedisStorage('testing-q1', blocking=True, read_timeout=0.1)
+        s2 = RedisStorage('testing-q2', blocking=True, read_timeout=0.1)
+        s3 = RedisStorage('testing-q3', blocking=False)
+        for storage in (s1, s2, s3):
+            storage.flush_queue()
+
+        # Queues are read in the order given, with a single BRPOP.
+        s2.enqueue(b('t1'))
+        s1.enqueue(b('t2'))
+        s1.enqueue(b('t3'), priority=1)
+        self.assertEqual(s1.dequeue_any([s2, s1]), (s2, b('t1')))
+        self.assertEqual(s1.dequeue_any([s1, s2]), (s1, b('t3')))
+        self.assertEqual(s1.dequeue_any([s2, s1]), (s1, b('t2')))
+        self.assertTrue(s1.dequeue_any([s1, s2]) is None)
+
+        # Non-blocking storages read each queue in turn.
+        s3.enqueue(b('t4'))
+        self.assertEqual(s1.dequeue_any([s1, s3]), (s3, b('t4')))
+        self.assertTrue(s3.dequeue_any([s3, s2]) is None)
+        for storage in (s1, s2, s3):
+            storage.flush_queue()
+            storage.conn.delete(storage.priority_key)
+
+    def test_dequeue_any_reliable(self):
+        # Reliable storages cannot share a BRPOP, but an empty queue does not
+        # hold up the others: every queue is read before waiting.
+        s1 = RedisStorage('testing-q1', blocking=True, read_timeout=5,
+                          reliable=True)
+        s2 = RedisStorage('testing-q2', blocking=True, read_timeout=0.1,
+                          reliable=True)
+        s2.enqueue(b('t1'), priority=1)
+        s2.enqueue(b('t2'))
+        start = time.time()
+        self.assertEqual(s1.dequeue_any([s1, s2]), (s2, b('t1')))
+        self.assertEqual(s1.dequeue_any([s1, s2]), (s2, b('t2')))
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual(s2.dequeue_nowait(), None)
+
+        # Only the first blocking queue is waited on.
+        self.assertTrue(s2.dequeue_any([s2, s1]) is None)
+        for storage in (s1, s2):
+            storage.ack(b('t1'))
+            storage.ack(b('t2'))
+            storage.flush_queue()
+            storage.conn.delete(storage.priority_key)
+
+    def test_leases(self):
+        storage = self.huey.storage
+        storage.conn.delete(storage.lease_prefix + 'sem')
+        self.assertTrue(storage.acquire_lease('sem', 'l1', 2, 60))
+        self.assertTrue(storage.acquire_lease('sem', 'l2', 2, 0.1))
+        self.assertFalse(storage.acquire_lease('sem', 'l3', 2, 60))
+
+        # Acquiring a lease that is held renews it.
+        self.assertTrue(storage.acquire_lease('sem', 'l1', 2, 60))
+        self.assertTrue(storage.release_lease('sem', 'l1'))
+        self.assertFalse(storage.release_lease('sem', 'l1'))
+        self.assertTrue(storage.acquire_lease('sem', 'l3', 2, 60))
+
+        # Expired leases no longer count towards the limit.
+        self._sleep(0.15)
+        self.assertTrue(storage.acquire_lease('sem', 'l4', 2, 60))
+        self.assertEqual(
+            sorted(storage.conn.zrange(storage.lease_prefix + 'sem', 0, -1)),
+            [b('l3'), b('l4')])
+        storage.conn.delete(storage.lease_prefix + 'sem')
+
+    def test_token_bucket(self):
+        storage = self.huey.storage
+        storage.conn.delete(storage.bucket_prefix + 'bucket')
+
+        # The bucket starts out full, then refills at 2 tokens per 0.2s.
+        self.assertEqual(storage.acquire_token('bucket', 2, 0.2), 0)
+        self.assertEqual(storage.acquire_token('bucket', 2, 0.2), 0)
+        wait = storage.acquire_token('bucket', 2, 0.2)
+        self.assertTrue(0 < wait <= 0.1)
+
+        self._sleep(wait)
+        self.assertEqual(storage.acquire_token('bucket', 2, 0.2), 0)
+        self.assertTrue(storage.acquire_token('bucket', 2, 0.2) > 0)
+        self.assertTrue(storage.conn.pttl(storage.bucket_prefix + 'bucket')
+                        <= 200)
+        storage.conn.delete(storage.bucket_prefix + 'bucket')
+
+    def test_batches(self):
+        storage = self.huey.storage
+        storage.conn.delete(storage.batch_prefix + 'batch')
+        self.assertEqual([storage.push_batch('batch', 'i%s' % i)
+                          for i in range(5)], [1, 2, 3, 4, 5])
+        self.assertEqual(storage.pop_batch('batch', 2), [b('i0'), b('i1')])
+        self.assertEqual(storage.batch_size('batch'), 3)
+        self.assertEqual(storage.pop_batch('batch', 5),
+                         [b('i2'), b('i3'), b('i4')])
+        self.assertEqual(storage.pop_batch('batch', 5), [])
+        self.assertEqual(storage.batch_size('batch'), 0)
+
+    def test_counters(self):
+        storage = self.huey.storage
+        storage.conn.delete(storage.counter_key)
+        self.assertEqual(storage.incr_counter('c1', 2), 2)
+        self.assertEqual(storage.incr_counter('c2'), 1)
+        self.assertEqual(storage.incr_counter('c1', -1), 1)
+        self.assertEqual(storage.incr_counter('c1', -1), 0)
+
+        # Counters are removed once they reach zero.
+        self.assertEqual(storage.conn.hkeys(storage.counter_key), [b('c2')])
+        self.assertEqual(storage.incr_counter('c2', -1), 0)
+        self.assertFalse(storage.conn.exists(storage.counter_key))
+
+    def test_peek_data_many(self):
+        storage = self.huey.storage
+        storage.put_data('k1', 'v1')
+        storage.put_result('k2', 'v2', ttl=60)
+        self.assertEqual(storage.peek_data_many(['k1', 'kx', 'k2']),
+                         [b('v1'), EmptyData, b('v2')])
+        self.assertEqual(storage.peek_data_many([]), [])
+        self.assertEqual(storage.peek_data('k1'), b('v1'))
+
+        self.assertEqual(storage.pop_data_many(['k1', 'kx', 'k2']),
+                         [b('v1'), EmptyData, b('v2')])
+        self.assertEqual(storage.peek_data_many(['k1', 'k2']),
+                         [EmptyData, EmptyData])
+
+    def test_put_result_many(self):
+        storage = self.huey.storage
+        storage.put_result_many([('k1', 'v1'), ('k2', 'v2')])
+        storage.put_result_many([('k3', 'v3')], ttl=60)
+        self.assertEqual(storage.pop_data('k1'), b('v1'))
+        self.assertEqual(storage.pop_data('k2'), b('v2'))
+        self.assertEqual(storage.pop_data('k3'), b('v3'))
+
     def test_data_stores(self):
         storage = self.huey.storage
         storage.put_data('k1', 'v1')
@@ -75,6 +566,19 @@ class TestRedisStorage(HueyTestCase):
         self.assertEqual(storage.read_schedule(dt4), [b('s4')])
         self.assertEqual(storage.read_schedule(dt4), [])
 
+    def test_reschedule(self):
+        storage = self.huey.storage
+        dt1 = datetime.datetime(2013, 1, 1, 0, 0)
+        dt2 = datetime.datetime(2013, 1, 2, 0, 0)
+
+        # Identical data is moved rather than added again.
+        storage.reschedule('s1', dt1)
+        storage.reschedule('s2', dt1)
+        storage.reschedule('s1', dt2)
+        self.assertEqual(storage.schedule_size(), 2)
+        self.assertEqual(storage.read_schedule(dt1), [b('s2')])
+        self.assertEqual(storage.read_schedule(dt2), [b('s1')])
+
     def test_events(self):
         storage = self.huey.storage
         ps = storage.listener()
@@ -1,4 +1,5 @@
 from huey.tests.base import BaseTestCase
+from huey.utils import parse_rate_limit
 from huey.utils import wrap_exception
 
 
@@ -21,3 +22,14 @@ class TestWrapException(BaseTestCase):
             self.assertEqual(str(exc), "KeyError: 'huey'")
         else:
             assert False
+
+
+class TestParseRateLimit(BaseTestCase):
+    def test_parse_rate_limit(self):
+        self.assertEqual(parse_rate_limit('10/s'), (10, 1))
+        self.assertEqual(parse_rate_limit('100/m'), (100, 60))
+        self.assertEqual(parse_rate_limit('1000/h'), (1000, 3600))
+        self.assertEqual(parse_rate_limit('5 / d'), (5, 86400))
+        self.assertEqual(parse_rate_limit('10/30s'), (10, 30))
+        for invalid in ('100', '100/w', 'm/100', '0/m', '10/0s', '1.5/s'):
+            self.assertRaises(ValueError, parse_rate_limit, invalid)
@@ -1,8 +1,21 @@
 from collections import namedtuple
 import datetime
+import os
+import re
 import sys
 import time
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    from inspect import iscoroutinefunction
+except ImportError:
+    def iscoroutinefunction(fn):
+        return False
+
 
 Error = namedtuple('Error', ('metadata',))
 
@@ -73,4 +86,46 @@ def local_to_utc(dt):
     """
     Converts a naive local datetime.datetime in UTC time zone.
     """
-    return datetime.datetime(*time.gmtime(time.mktime(dt.timetuple()))[:6])
+    utc = datetime.datetime(*time.gmtime(time.mktime(dt.timetuple()))[:6])
+    return utc.replace(microsecond=dt.microsecond)
+
+
+def get_rss():
+    """
+    Return the resident set size of the current process in bytes, or None if
+    it cannot be determined. Where /proc is not available, the peak resident
+    set size is returned instead.
+    """
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, IndexError, IOError, OSError, ValueError):
+        pass
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is measured in bytes on OS X and kilobytes elsewhere.
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+rate_limit_re = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*([smhd])\s*$')
+RATE_LIMIT_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate_limit(rate_limit):
+    """
+    Convert a rate limit like ``'100/m'`` into a 2-tuple of the number of
+    calls allowed and the length of the period in seconds. The period may be
+    ``s``, ``m``, ``h`` or ``d``, optionally preceded by a multiplier, for
+    example ``'10/30s'``.
+    """
+    match = rate_limit_re.match(rate_limit)
+    if match is None:
+        raise ValueError('Invalid rate limit "%s", expected a value like '
+                         '"100/m".' % rate_limit)
+    calls, multiplier, unit = match.groups()
+    period = int(multiplier or 1) * RATE_LIMIT_PERIODS[unit]
+    if not int(calls) or not period:
+        raise ValueError('Rate limit "%s" must allow at least one call in a '
+                         'non-empty period.' % rate_limit)
+    return int(calls), period